@@ -0,0 +1,172 @@
+"""Admission control for extractions: per-session and per-org rate limits, a global in-flight cap
+and a bounded fair queue.
+
+Each session and org has a token bucket; a request that finds its bucket empty is refused at
+once (429 with Retry-After). Admitted extractions then need one of ADMISSION_MAX_IN_FLIGHT
+slots. When none is free they wait in a queue that hands freed slots to sessions in
+round-robin order, so a session with one upload is not stuck behind another session's batch.
+Each session may only hold ADMISSION_SESSION_QUEUE places, and the queue as a whole
+ADMISSION_QUEUE_SIZE.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from config import (
+    ADMISSION_MAX_IN_FLIGHT, ADMISSION_QUEUE_SIZE, ADMISSION_QUEUE_TIMEOUT, ADMISSION_SESSION_QUEUE,
+    ORG_BURST, ORG_RATE_PER_MINUTE, SESSION_BURST, SESSION_RATE_PER_MINUTE,
+)
+from metrics import record_admission_rejection, record_admission_wait, record_stage, set_admission_gauges
+from ttl_cache import TTLCache
+
+
+class AdmissionRejected(Exception):
+    """An extraction refused by admission control (HTTP 429); `code` says which limit was hit."""
+
+    def __init__(self, message, code, retry_after):
+        super().__init__(message)
+        self.code = code
+        self.retry_after = max(1, math.ceil(retry_after))
+
+    def to_dict(self):
+        return {'error': str(self), 'code': self.code, 'retryAfter': self.retry_after}
+
+
+class TokenBucket:
+    """`burst` tokens, refilled at `rate` per second."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self, now):
+        """Take a token; returns 0 on success, else the seconds until one is available."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class _Waiter:
+    def __init__(self):
+        self.granted = False
+        self.event = threading.Event()
+
+
+class AdmissionController:
+    def __init__(self, max_in_flight=ADMISSION_MAX_IN_FLIGHT, queue_size=ADMISSION_QUEUE_SIZE,
+                 session_queue=ADMISSION_SESSION_QUEUE, queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+                 session_rate=SESSION_RATE_PER_MINUTE / 60, session_burst=SESSION_BURST,
+                 org_rate=ORG_RATE_PER_MINUTE / 60, org_burst=ORG_BURST):
+        self.max_in_flight = max_in_flight
+        self.queue_size = queue_size
+        self.session_queue = session_queue
+        self.queue_timeout = queue_timeout
+        self._limits = {'session': (session_rate, session_burst), 'org': (org_rate, org_burst)}
+        # Idle buckets are full again after burst / rate seconds; an hour comfortably covers that
+        self._buckets = TTLCache(ttl=60 * 60, maxsize=10000)
+        self._queues = OrderedDict()  # session -> deque of _Waiter, in round-robin order
+        self._queued = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def check_rate(self, session, org):
+        """Take a token from the session's and the org's bucket. Raises AdmissionRejected when either is empty."""
+        now = time.monotonic()
+        with self._lock:
+            for scope, key in (('session', session), ('org', org)):
+                rate, burst = self._limits[scope]
+                if not rate or key is None:
+                    continue
+                bucket = self._buckets.get((scope, key))
+                if bucket is None:
+                    bucket = TokenBucket(rate, max(1, burst))
+                    self._buckets.set((scope, key), bucket)
+                wait = bucket.take(now)
+                if wait:
+                    record_admission_rejection(f'{scope}_rate_limited')
+                    raise AdmissionRejected(f'Too many extraction requests for this {scope}; slow down',
+                                            f'{scope}_rate_limited', wait)
+
+    def acquire(self, session):
+        """Wait for an in-flight slot (fair across sessions). Raises AdmissionRejected when the queue is
+        full or the wait exceeds queue_timeout. Every successful acquire() must be followed by release().
+        """
+        started = time.monotonic()
+        with self._lock:
+            if not self.max_in_flight or (self._in_flight < self.max_in_flight and not self._queued):
+                self._in_flight += 1
+                self._update_gauges()
+                waiter = None
+            else:
+                queue = self._queues.get(session)
+                if self._queued >= self.queue_size or (queue and len(queue) >= self.session_queue):
+                    record_admission_rejection('queue_full')
+                    raise AdmissionRejected('The extraction queue is full; try again shortly', 'queue_full',
+                                            self.queue_timeout / 4)
+                waiter = _Waiter()
+                if queue is None:
+                    queue = self._queues[session] = deque()
+                queue.append(waiter)
+                self._queued += 1
+                self._update_gauges()
+        if waiter is None:
+            record_admission_wait(0.0)
+            return
+        waiter.event.wait(self.queue_timeout)
+        with self._lock:
+            if not waiter.granted:
+                queue = self._queues[session]
+                queue.remove(waiter)
+                if not queue:
+                    del self._queues[session]
+                self._queued -= 1
+                self._update_gauges()
+                record_admission_rejection('queue_timeout')
+                raise AdmissionRejected('Timed out waiting in the extraction queue', 'queue_timeout',
+                                        self.queue_timeout / 4)
+        waited = time.monotonic() - started
+        record_stage('queue', waited)
+        record_admission_wait(waited)
+
+    def release(self):
+        with self._lock:
+            if self._queues:
+                # Round-robin: the next session in line gets the slot, then moves to the back
+                session, queue = next(iter(self._queues.items()))
+                waiter = queue.popleft()
+                if queue:
+                    self._queues.move_to_end(session)
+                else:
+                    del self._queues[session]
+                self._queued -= 1
+                waiter.granted = True
+                waiter.event.set()  # the slot passes straight to the waiter; in-flight count is unchanged
+            else:
+                self._in_flight -= 1
+            self._update_gauges()
+
+    @contextmanager
+    def slot(self, session):
+        self.acquire(session)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _update_gauges(self):
+        set_admission_gauges(self._in_flight, self._queued)
+
+    def stats(self):
+        with self._lock:
+            return {'inFlight': self._in_flight, 'queued': self._queued, 'queuedSessions': len(self._queues),
+                    'maxInFlight': self.max_in_flight or None}
+
+
+admission = AdmissionController()
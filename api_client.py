@@ -1,32 +1,126 @@
 import os
 import json
+import tempfile
+import threading
+import time
 from typing import Optional
 from config import TOKEN_FILE
 
+
 class APIClient:
-    def __init__(self):
-        self.token_file = TOKEN_FILE
-    
+    """Token store backed by TOKEN_FILE (JSON: access_token, instance_url), or by a shared state
+    namespace when one is given (the file is then only read once, to migrate an existing token).
+
+    The parsed file is cached and only re-read when its mtime or size changes (checked at most
+    every `check_interval` seconds), so per-request lookups don't touch the disk. Writes are
+    atomic (temp file + rename) and serialized with a lock; the instance is safe to share
+    across threads.
+    """
+
+    STORE_KEY = 'env'
+
+    def __init__(self, token_file: Optional[str] = None, check_interval: float = 1.0, store=None):
+        self.token_file = token_file or TOKEN_FILE
+        self.check_interval = check_interval
+        self.store = store
+        self._lock = threading.RLock()
+        self._data = None
+        self._signature = None
+        self._checked_at = 0.0
+
+    def _stat_signature(self):
+        try:
+            st = os.stat(self.token_file)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
     def load_token_data(self):
-        if not os.path.exists(self.token_file):
-            raise Exception('Token file not found. Please authenticate.')
-        with open(self.token_file, 'r') as f:
-            return json.load(f)
-    
+        with self._lock:
+            now = time.monotonic()
+            if self._data is not None and now - self._checked_at < self.check_interval:
+                return self._data
+            if self.store is not None:
+                return self._load_from_store(now)
+            signature = self._stat_signature()
+            self._checked_at = now
+            if signature is None:
+                self._data = self._signature = None
+                raise Exception('Token file not found. Please authenticate.')
+            if signature != self._signature or self._data is None:
+                with open(self.token_file, 'r') as f:
+                    self._data = self._parse(f.read())
+                self._signature = signature
+            return self._data
+
+    def _load_from_store(self, now):
+        data = self.store.get(self.STORE_KEY)
+        if data is None and self._stat_signature() is not None:
+            with open(self.token_file, 'r') as f:
+                data = self._parse(f.read())
+            self.store.compare_and_set(self.STORE_KEY, None, data)  # another worker may have migrated it first
+            data = self.store.get(self.STORE_KEY)
+        self._checked_at = now
+        self._data = data
+        if data is None:
+            raise Exception('Token not found. Please authenticate.')
+        return data
+
+    @staticmethod
+    def _parse(text):
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError:
+            # Older versions wrote the bare access token as plain text
+            data = {'access_token': text.strip() or None}
+        if not isinstance(data, dict):
+            raise Exception('Token file is not in the expected format. Please authenticate again.')
+        return data
+
     def get_access_token(self):
         return self.load_token_data().get('access_token')
-    
+
     def get_instance_url(self):
         return self.load_token_data().get('instance_url')
-    
+
     def is_authenticated(self):
         try:
             data = self.load_token_data()
             return bool(data.get('access_token')) and bool(data.get('instance_url'))
         except Exception:
             return False
-    
+
+    def save_token_data(self, access_token: str, instance_url: Optional[str]) -> None:
+        """Atomically write the token file (or the shared store) and refresh the cache."""
+        data = {'access_token': access_token, 'instance_url': instance_url}
+        if self.store is not None:
+            with self._lock:
+                self.store.set(self.STORE_KEY, data)
+                self._data = data
+                self._checked_at = time.monotonic()
+            return
+        directory = os.path.dirname(os.path.abspath(self.token_file))
+        with self._lock:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.token-', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(data, f)
+                os.chmod(tmp_path, 0o600)
+                os.replace(tmp_path, self.token_file)
+            except BaseException:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+                raise
+            self._data = data
+            self._signature = self._stat_signature()
+            self._checked_at = time.monotonic()
+
     def save_access_token(self, access_token: str) -> None:
-        """Save access token to local storage"""
-        with open(self.token_file, 'w') as f:
-            f.write(access_token.strip()) 
\ No newline at end of file
+        """Save access token to local storage (keeps the stored instance_url)"""
+        try:
+            instance_url = self.get_instance_url()
+        except Exception:
+            instance_url = None
+        self.save_token_data(access_token.strip(), instance_url)
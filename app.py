@@ -1,43 +1,129 @@
-from flask import Flask, request, jsonify, render_template, send_file, redirect, render_template_string, g, make_response
+from flask import Flask, Request, request, jsonify, send_file, redirect, render_template_string, g, make_response, Response, stream_with_context
 import subprocess
 import json
-import requests
-import base64
+import gzip
+import hashlib
 import logging
 import os
 import secrets
+import tempfile
+import time
 from datetime import datetime
 from itsdangerous import URLSafeTimedSerializer, BadSignature
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
 
 # Import configuration
-from config import DEFAULT_ML_MODEL, LOGIN_URL, CLIENT_ID, CLIENT_SECRET, API_VERSION, TOKEN_FILE, DOCUMENT_AI_EXTRACT_PATH
+from config import (
+    DEFAULT_ML_MODEL, LOGIN_URL, CLIENT_ID, CLIENT_SECRET, ENDPOINT_PREFLIGHT,
+    JOB_LONG_POLL_MAX, BATCH_CONCURRENCY, BATCH_MAX_FILES, BATCH_MAX_ZIP_BYTES, UPLOAD_SPOOL_THRESHOLD,
+    RESPONSE_GZIP_MIN_BYTES, SESSION_STORE_SIZE, SESSION_DECODE_CACHE_SIZE, CHUNK_PAGES,
+    IMAGE_PREPROCESS, MAX_REQUEST_BYTES, COMPARE_MAX_MODELS,
+)
+from admission import AdmissionRejected, admission
+from assets import AssetPipeline
 from api_client import APIClient
+from circuit_breaker import circuit_breakers
+from coalescing import extraction_flights
+from http_client import http_client
+from discovery import probe_endpoint
+from jobs import JobQueueFull, extraction_jobs
+from extraction import (
+    INVALID_FILE_TYPE, allowed_file, build_extraction, call_document_ai, extraction_options, org_owner,
+    parse_page_range, prepare_schema_config, run_extraction, with_model,
+)
+from ttl_cache import TTLCache
+from state_store import namespace, state_backend
+from result_cache import result_cache
+from schemas import schema_registry
+from snippets import render_snippet, snippet_store
+from preflight import PreflightError
+from profiling import profiled
+from batch import BatchDocument, ZipRejected, is_zip_upload, iter_batch, ndjson_stream, zip_documents
+from compare import iter_compare
+from json_utils import FastJSONProvider, dumps as dumps_json
+from metrics import end_request, finish_response, render as render_metrics, stage, start_request
+
+
+
+class SpooledUploadRequest(Request):
+    """Keep uploaded files in memory only up to UPLOAD_SPOOL_THRESHOLD, then spool them to disk."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_THRESHOLD, mode='rb+')
+
 
 app = Flask("Salesforce Data Cloud Document AI test platform")
+app.request_class = SpooledUploadRequest
+app.json = FastJSONProvider(app)
 app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY", secrets.token_hex(32))
+# Werkzeug stops reading the body (413) once it exceeds this; None disables the limit
+app.config["MAX_CONTENT_LENGTH"] = MAX_REQUEST_BYTES or None
+
+# UI pages have no per-request data: render them once, serve precompressed with ETags
+assets = AssetPipeline(app)
+assets.add_template_page('home', 'index.html')
+assets.add_static_page('json_jazz', 'json-jazz.html')
+
+# Token store for the env-configured org (local dev with .env); shared by all workers with a shared state backend
+api_client = APIClient(store=namespace('tokens') if state_backend.shared else None)
 
-# Server-side session store (fallback when cookie not used): session_id -> session dict
-SESSIONS = {}
 # Cookie-based session: signed payload so it works across Heroku dynos/restarts
 SESSION_COOKIE_NAME = "org_session"
 SESSION_MAX_AGE = 60 * 60 * 24 * 30  # 30 days
+# Server-side session store (fallback when cookie not used): session_id -> session dict.
+# Entries expire after SESSION_MAX_AGE and the store is size-bounded (see state_store).
+SESSIONS = namespace('sessions', ttl=SESSION_MAX_AGE, maxsize=SESSION_STORE_SIZE)
+# An unchanged session cookie is only re-signed (to extend its expiry) once it is this old
+SESSION_REFRESH_AFTER = 60 * 60 * 24  # 1 day
+# Routes that never read the org session: skip cookie verification entirely
+SESSIONLESS_ENDPOINTS = {'static', 'home', 'json_jazz', 'auth_callback', 'metrics'}
+
+_serializer = None
+# Verified cookie value -> (decoded session, signed-at timestamp); expires with the cookie itself
+_decoded_sessions = TTLCache(ttl=SESSION_MAX_AGE, maxsize=SESSION_DECODE_CACHE_SIZE)
 
 
 def _session_serializer():
-    return URLSafeTimedSerializer(app.config["SECRET_KEY"], salt="org_session")
+    global _serializer
+    secret_key = app.config["SECRET_KEY"]
+    if _serializer is None or _serializer.secret_key != secret_key.encode('utf-8'):
+        _serializer = URLSafeTimedSerializer(secret_key, salt="org_session")
+    return _serializer
+
+
+def _remember_decoded(cookie_val, data, signed_at):
+    remaining = signed_at + SESSION_MAX_AGE - time.time()
+    if remaining > 0:
+        _decoded_sessions.set(cookie_val, (dict(data), signed_at), ttl=remaining)
 
 
 def _encode_session(data):
-    return _session_serializer().dumps(data)
+    val = _session_serializer().dumps(data)
+    _remember_decoded(val, data, time.time())
+    return val
 
 
-def _decode_session(cookie_val):
+def _decode_session_with_timestamp(cookie_val):
+    """(session dict, signed-at epoch seconds) for a valid cookie, else (None, None). Memoized per cookie value."""
     if not cookie_val or len(cookie_val) < 20:
-        return None
+        return None, None
+    cached = _decoded_sessions.get(cookie_val)
+    if cached is not None:
+        data, signed_at = cached
+        return dict(data), signed_at  # copy: callers may modify the session they get
     try:
-        return _session_serializer().loads(cookie_val, max_age=SESSION_MAX_AGE)
+        data, signed_at = _session_serializer().loads(cookie_val, max_age=SESSION_MAX_AGE, return_timestamp=True)
     except BadSignature:
-        return None
+        return None, None
+    signed_at = signed_at.timestamp()
+    if isinstance(data, dict):
+        _remember_decoded(cookie_val, data, signed_at)
+        data = dict(data)
+    return data, signed_at
+
+
+def _decode_session(cookie_val):
+    return _decode_session_with_timestamp(cookie_val)[0]
 
 
 def _get_session_id():
@@ -53,7 +139,10 @@ def _has_env_org():
 
 
 def _set_session_cookie(resp, data):
-    """Set the signed session cookie on response."""
+    """Set the signed session cookie on response (skipped when the browser already holds a fresh, identical one)."""
+    loaded, signed_at = getattr(g, "org_session_loaded", (None, None))
+    if loaded is not None and loaded == data and time.time() - signed_at < SESSION_REFRESH_AFTER:
+        return
     val = _encode_session(data)
     resp.set_cookie(
         SESSION_COOKIE_NAME,
@@ -65,21 +154,44 @@ def _set_session_cookie(resp, data):
     )
 
 
+@app.before_request
+def start_request_timings():
+    start_request(request.environ).route = request.endpoint or 'not_found'
+
+
+@app.after_request
+def add_server_timing(resp):
+    server_timing = finish_response(request.environ, request.endpoint or 'not_found', resp.status_code)
+    if server_timing:
+        resp.headers['Server-Timing'] = server_timing
+    return resp
+
+
+@app.teardown_request
+def end_request_timings(exc=None):
+    end_request()
+
+
 @app.before_request
 def load_org_session():
     """Load per-user org session from cookie (signed) or in-memory store."""
     g.org_session_id = None
     g.org_session_data = None
+    g.org_session_loaded = (None, None)
+    if request.endpoint in SESSIONLESS_ENDPOINTS:
+        return
     cookie_val = request.cookies.get(SESSION_COOKIE_NAME)
     # Prefer cookie-based session (works across dynos on Heroku)
-    decoded = _decode_session(cookie_val)
+    decoded, signed_at = _decode_session_with_timestamp(cookie_val)
     if decoded and isinstance(decoded, dict):
         g.org_session_data = decoded
+        g.org_session_loaded = (dict(decoded), signed_at)
         return
     # Fallback: in-memory by session id (legacy)
-    if cookie_val and cookie_val in SESSIONS:
+    legacy = SESSIONS.get(cookie_val) if cookie_val else None
+    if legacy is not None:
         g.org_session_id = cookie_val
-        g.org_session_data = SESSIONS[cookie_val]
+        g.org_session_data = legacy
 
 
 def _login_url():
@@ -128,9 +240,10 @@ def _get_instance_url():
         return s["instance_url"]
     return api_client.get_instance_url() if api_client.is_authenticated() else None
 
+
 @app.route('/', methods=['GET'])
 def home():
-    return render_template('index.html')
+    return assets.page('home')
 
 @app.route('/api/status', methods=['GET'])
 def check_auth_status():
@@ -151,7 +264,12 @@ def check_auth_status():
             'status': 'running',
             'authenticated': has_token,
             'needs_org_config': False,
-            'message': 'Access token found' if has_token else 'Access token not found. Please authenticate first.'
+            'message': 'Access token found' if has_token else 'Access token not found. Please authenticate first.',
+            'httpPool': http_client.pool_stats(),
+            'resultCache': result_cache.stats(),
+            'circuitBreaker': circuit_breakers.status(_get_instance_url()) if has_token else None,
+            'admission': admission.stats(),
+            'coalescing': extraction_flights.stats()
         })
     except Exception as e:
         return jsonify({
@@ -164,6 +282,33 @@ def check_auth_status():
         }), 500
 
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics: request stage timings and Salesforce API call counters (this process only)."""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/api/schemas', methods=['POST'])
+def register_schema():
+    """Register a JSON schema (request body, or a 'schema' form field); returns its id for schema_id."""
+    if not _is_authenticated():
+        return jsonify({'error': 'Authentication required. Please authenticate with Salesforce first.'}), 401
+    schema_text = request.form.get('schema') if request.form else request.get_data(as_text=True)
+    try:
+        schema_id, created = schema_registry.register(schema_text or '')
+    except ValueError as e:
+        return jsonify({'error': f'Invalid JSON schema: {str(e)}'}), 400
+    return jsonify({'schemaId': schema_id}), 201 if created else 200
+
+
+@app.route('/api/schemas/<schema_id>', methods=['GET'])
+def get_schema(schema_id):
+    schema = schema_registry.get(schema_id)
+    if schema is None:
+        return jsonify({'error': 'Unknown or expired schema_id', 'code': 'unknown_schema_id'}), 404
+    return jsonify({'schemaId': schema_id, 'schema': schema})
+
+
 @app.route('/api/org-config', methods=['POST'])
 def set_org_config():
     """Store per-user org configuration (Login URL, Client ID, Client Secret). Isolated per browser via session cookie."""
@@ -195,8 +340,8 @@ def set_org_config():
 def org_logout():
     """Clear current org session so user can enter a different org."""
     session_id = _get_session_id()
-    if session_id and session_id in SESSIONS:
-        del SESSIONS[session_id]
+    if session_id:
+        SESSIONS.pop(session_id)
     resp = jsonify({'success': True})
     resp.set_cookie(SESSION_COOKIE_NAME, '', max_age=0, expires=0)
     return resp
@@ -258,18 +403,30 @@ def auth_callback():
     """, code=code)
 
 @app.route('/auth/exchange', methods=['POST'])
+@profiled
 def auth_exchange():
+    with stage('prepare'):
+        token_request, error_response = _prepare_token_exchange()
+    if error_response:
+        return error_response
+    token_url, payload = token_request
+    resp = http_client.post(token_url, data=payload)
+    return _complete_token_exchange(resp)
+
+
+def _prepare_token_exchange():
+    """Validate /auth/exchange and build the OAuth token request: ((token_url, form_data), None) or (None, error)."""
     data = request.get_json()
     code = data.get('code')
     code_verifier = data.get('code_verifier')
     if not code or not code_verifier:
-        return "Missing code or code_verifier", 400
+        return None, ("Missing code or code_verifier", 400)
 
     login_url = _login_url()
     client_id = _client_id()
     client_secret = _client_secret()
     if not login_url or not client_id or not client_secret:
-        return "Org not configured. Please enter org details first.", 400
+        return None, ("Org not configured. Please enter org details first.", 400)
 
     redirect_uri = f"{request.url_root.rstrip('/')}/auth/callback"
     token_url = f"https://{login_url}/services/oauth2/token"
@@ -281,28 +438,34 @@ def auth_exchange():
         "redirect_uri": redirect_uri,
         "code_verifier": code_verifier
     }
+    return (token_url, payload), None
+
 
-    resp = requests.post(token_url, data=payload)
+def _complete_token_exchange(resp):
+    """Store the tokens from the OAuth token response (.status_code/.text/.json()) and build the reply."""
     if resp.status_code != 200:
         return f"Error exchanging code for token: {resp.text}", 400
 
     token_data = resp.json()
+    if ENDPOINT_PREFLIGHT:
+        try:
+            with stage('preflight'):
+                probe_endpoint(token_data["instance_url"], token_data["access_token"])
+        except Exception as e:
+            logging.warning("Document AI endpoint pre-flight probe failed: %s", str(e))
     session_data = _get_session()
-    if session_data is not None:
-        session_data["access_token"] = token_data["access_token"]
-        session_data["instance_url"] = token_data["instance_url"]
-        # Send updated session in cookie so browser has tokens (works across Heroku dynos)
-        response = make_response('', 204)
-        _set_session_cookie(response, session_data)
-        return response
-    else:
-        # Fallback: write to token file (local dev with .env)
-        with open(TOKEN_FILE, "w") as f:
-            json.dump({
-                "access_token": token_data["access_token"],
-                "instance_url": token_data["instance_url"]
-            }, f)
-        return '', 204
+    with stage('session'):
+        if session_data is not None:
+            session_data["access_token"] = token_data["access_token"]
+            session_data["instance_url"] = token_data["instance_url"]
+            # Send updated session in cookie so browser has tokens (works across Heroku dynos)
+            response = make_response('', 204)
+            _set_session_cookie(response, session_data)
+            return response
+        else:
+            # Fallback: write to token file (local dev with .env)
+            api_client.save_token_data(token_data["access_token"], token_data["instance_url"])
+            return '', 204
 
 @app.route('/api/save-token', methods=['POST'])
 def save_token():
@@ -334,235 +497,370 @@ def save_token():
             'details': str(e)
         }), 500
 
+
+def _error(message, code, status=400, **details):
+    """Structured validation error: {'error': message, 'code': code, ...details}."""
+    return jsonify(dict({'error': message, 'code': code}, **details)), status
+
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    return _error(f'Request body is larger than the {app.config["MAX_CONTENT_LENGTH"]} byte limit',
+                  'request_too_large', 413, limitBytes=app.config['MAX_CONTENT_LENGTH'])
+
+
+def _admission_session():
+    """Admission-control identity of the caller: a hash of the org_session cookie, else the client address."""
+    cookie_val = request.cookies.get(SESSION_COOKIE_NAME)
+    if cookie_val:
+        return hashlib.sha256(cookie_val.encode('utf-8')).hexdigest()[:16]
+    return f'addr:{request.remote_addr}'
+
+
+def _check_admission_rate():
+    """429 response when the caller's session or org is over its request rate, else None.
+
+    Runs before the upload is read, so a rejected request costs almost nothing.
+    """
+    try:
+        admission.check_rate(_admission_session(), _get_instance_url())
+    except AdmissionRejected as e:
+        return jsonify(e.to_dict()), 429, {'Retry-After': str(e.retry_after)}
+    return None
+
+
+def _prepare_extraction():
+    """Validate the current /extract-data request and build everything the upstream call needs.
+
+    Returns (extraction, None) on success or (None, error_response) when the request is invalid.
+    The extraction dict holds no reference to the Flask request, so it can run on another thread.
+    """
+    if not _is_authenticated():
+        return None, (jsonify({'error': 'Authentication required. Please authenticate with Salesforce first.'}), 401)
+    rejected = _check_admission_rate()
+    if rejected:
+        return None, rejected
+
+    with stage('upload'):  # the multipart body is parsed (and spooled) on first access
+        files = request.files
+    if 'file' not in files:
+        return None, _error('No file uploaded', 'missing_file')
+    file = files['file']
+    if file.filename == '':
+        return None, _error('No file selected', 'missing_file')
+    if not allowed_file(file.filename):
+        return None, _error(INVALID_FILE_TYPE, 'invalid_file_type')
+
+    options, error_response = _parse_extraction_options()
+    if error_response:
+        return None, error_response
+    try:
+        return build_extraction(options, file.stream, file.content_type), None
+    except PreflightError as e:
+        return None, (jsonify(e.to_dict()), e.status)
+
+
+def _parse_extraction_options():
+    """Parse the form fields shared by every document in a request (schema, model, pages, confidence).
+
+    Returns (options, None) or (None, error_response).
+    """
+    schema_config = request.form.get('schema', '')
+    schema_id = request.form.get('schema_id', '').strip()
+    ml_model = request.form.get('ml_model', DEFAULT_ML_MODEL)
+    include_confidence = request.form.get('include_confidence') == 'true'
+    page_range = request.form.get('page_range', '').strip()
+    config_prompt = request.form.get('config_prompt', '').strip()
+
+    # Schema-level instructions: Document AI uses the root-level "description" of the schema JSON.
+    if schema_id:
+        # Registered schema: the prepared schemaConfig (prompt included) comes from the registry's cache
+        with stage('schema'):
+            schema_config_final = schema_registry.schema_config(schema_id, config_prompt)
+        if schema_config_final is None:
+            return None, (jsonify({
+                'error': 'Unknown or expired schema_id. Register the schema again with POST /api/schemas.',
+                'code': 'unknown_schema_id'
+            }), 404)
+    else:
+        try:
+            with stage('schema'):
+                schema_config_final = prepare_schema_config(schema_config, config_prompt)
+        except json.JSONDecodeError as e:
+            return None, _error(f'Invalid JSON schema: {str(e)}', 'invalid_schema')
+
+    try:
+        start_page, end_page = parse_page_range(page_range)
+    except ValueError as e:
+        return None, _error(str(e), 'invalid_page_range')
+
+    # Optional: split long PDFs into windows of this many pages, extracted concurrently
+    try:
+        chunk_pages = int(request.form.get('chunk_pages') or CHUNK_PAGES)
+    except ValueError:
+        return None, _error('chunk_pages must be an integer', 'invalid_chunk_pages')
+    if chunk_pages < 0:
+        return None, _error('chunk_pages must be 0 (off) or a positive number of pages', 'invalid_chunk_pages')
+
+    options = extraction_options(
+        _get_instance_url(), _get_access_token(), schema_config_final, ml_model, include_confidence,
+        start_page, end_page, chunk_pages,
+        cache_bypass=request.form.get('cache') == 'false' or 'no-cache' in request.headers.get('Cache-Control', ''),
+        image_preprocess=request.form.get('image_preprocess', str(IMAGE_PREPROCESS)).lower() == 'true',
+        admission_session=_admission_session(),
+    )
+    options['pretty'] = _wants_pretty()
+    return options, None
+
+
+def _gzip_response(resp):
+    """Gzip a large response body when the client accepts it."""
+    if (not RESPONSE_GZIP_MIN_BYTES or resp.direct_passthrough or 'Content-Encoding' in resp.headers
+            or not request.accept_encodings['gzip']):  # quality 0 when refused (gzip;q=0) or not accepted
+        return resp
+    data = resp.get_data()
+    if len(data) < RESPONSE_GZIP_MIN_BYTES:
+        return resp
+    with stage('gzip'):
+        resp.set_data(gzip.compress(data, compresslevel=6))
+    resp.headers['Content-Encoding'] = 'gzip'
+    resp.vary.add('Accept-Encoding')
+    return resp
+
+
+def _wants_pretty():
+    """Indented JSON only when asked for (pretty=true query or form field); compact otherwise."""
+    return (request.args.get('pretty') or request.form.get('pretty') or '').lower() in ('1', 'true')
+
+
+def _extraction_response(result, status, cache_status=None, pretty=False):
+    """Shape a run_extraction result as the /extract-data HTTP response."""
+    if 'error' not in result:
+        with stage('serialize'):
+            body = dumps_json(result, pretty=pretty)
+        resp = make_response(body, status, {'Content-Type': 'application/json; charset=utf-8'})
+    else:
+        resp = jsonify(result)
+        resp.status_code = status
+        _clear_token_on_auth_failure(resp, result, status)
+    if cache_status:
+        resp.headers['X-Cache'] = cache_status
+    if 'retryAfter' in result:
+        resp.headers['Retry-After'] = str(result['retryAfter'])
+    return _gzip_response(resp)
+
+
+def _clear_token_on_auth_failure(resp, result, status):
+    """On 401/403 from Salesforce, clear token in session so /api/status returns authenticated: false."""
+    # 'url_used' marks a failed upstream call (vs. e.g. a model-provider 403 inside a 200 response)
+    if status not in (401, 403) or 'url_used' not in (result or {}):
+        return
+    session_data = _get_session()
+    if session_data is not None:
+        updated = dict(session_data)
+        updated.pop('access_token', None)
+        updated.pop('instance_url', None)
+        _set_session_cookie(resp, updated)
+
+
 @app.route('/extract-data', methods=['POST'])
+@profiled
 def extract_data():
     try:
-        if not _is_authenticated():
-            return jsonify({'error': 'Authentication required. Please authenticate with Salesforce first.'}), 401
-
-        ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg', 'tiff', 'bmp'}
-        def allowed_file(filename):
-            return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file uploaded'}), 400
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
-        if not allowed_file(file.filename):
-            return jsonify({'error': 'Invalid file type. Allowed types are: PDF and images (PNG, JPG, JPEG, TIFF, BMP)'}), 400
-
-        schema_config = request.form.get('schema', '')
-        ml_model = request.form.get('ml_model', DEFAULT_ML_MODEL)
-        include_confidence = request.form.get('include_confidence') == 'true'
-        page_range = request.form.get('page_range', '').strip()
-        config_prompt = request.form.get('config_prompt', '').strip()
-        file_data = file.read()
-        base64_data = base64.b64encode(file_data).decode('utf-8')
-        
-        # Schema-level instructions: Document AI uses the root-level "description" of the schema JSON.
+        extraction, error_response = _prepare_extraction()
+        if error_response:
+            return error_response
+        result, status = run_extraction(extraction)
+        return _extraction_response(result, status, extraction.get('cache_status'), extraction['pretty'])
+    except HTTPException:
+        raise  # e.g. 413 from reading an oversized body: answered by its error handler
+    except Exception as e:
+        return jsonify({
+            'error': str(e)
+        }), 500
+
+
+@app.route('/extract-data/snippet/<snippet_id>', methods=['GET'])
+def get_developer_snippet(snippet_id):
+    """curl + Apex reproducing a recent successful extraction (id from the extraction's apiRequestId)."""
+    owner = _job_owner()
+    context = snippet_store.get(snippet_id, owner) if owner else None
+    if context is None:
+        return jsonify({'error': 'Developer reference not found or expired. Run the extraction again.'}), 404
+    with stage('snippet'):
+        snippet = render_snippet(context, _get_access_token())
+    return jsonify(snippet)
+
+
+@app.route('/extract-data/batch', methods=['POST'])
+def extract_data_batch():
+    """Extract many documents (multiple 'files' fields and/or zip archives) with one schema config.
+
+    Streams one NDJSON line per document as it finishes, then a summary line. Per-document
+    failures are reported on their line and do not stop the batch.
+    """
+    if not _is_authenticated():
+        return jsonify({'error': 'Authentication required. Please authenticate with Salesforce first.'}), 401
+    rejected = _check_admission_rate()  # before request.files: a rejected batch is never parsed
+    if rejected:
+        return rejected
+    uploads = [f for f in request.files.getlist('files') + request.files.getlist('file') if f.filename]
+    if not uploads:
+        return _error('No files uploaded', 'missing_file')
+
+    documents = []
+    try:
+        for upload in uploads:
+            if is_zip_upload(upload):
+                documents.extend(zip_documents(upload, allowed_file, BATCH_MAX_FILES, BATCH_MAX_ZIP_BYTES,
+                                               start_index=len(documents)))
+            else:
+                documents.append(BatchDocument(len(documents), upload.filename, upload.content_type,
+                                               lambda upload=upload: upload.stream))
+    except ZipRejected as e:
+        return _error(str(e), e.code, **e.details)
+    if len(documents) > BATCH_MAX_FILES:
+        return _error(f'Too many documents ({len(documents)}); the limit is {BATCH_MAX_FILES}', 'too_many_documents',
+                      limit=BATCH_MAX_FILES)
+
+    options, error_response = _parse_extraction_options()
+    if error_response:
+        return error_response
+    try:
+        concurrency = int(request.form.get('concurrency') or BATCH_CONCURRENCY)
+    except ValueError:
+        return _error('concurrency must be an integer', 'invalid_concurrency')
+    concurrency = max(1, min(concurrency, BATCH_CONCURRENCY))
+
+    def run_document(doc):
+        if not allowed_file(doc.filename):
+            return {'status': 400, 'error': INVALID_FILE_TYPE, 'code': 'invalid_file_type'}
         try:
-            schema_json = json.loads(schema_config)
-            if config_prompt:
-                schema_json['description'] = config_prompt
-                logging.info("Schema-level prompt added (root description)")
-            schema_config_final = json.dumps(schema_json)
-        except json.JSONDecodeError as e:
-            return jsonify({'error': f'Invalid JSON schema: {str(e)}'}), 400
-
-        # Parse page range if provided
-        start_page = None
-        end_page = None
-
-        if page_range:
-            try:
-                parts = page_range.split('-')
-                if len(parts) == 2:
-                    start_page = int(parts[0])
-                    end_page = int(parts[1])
-                    
-                    # Validate
-                    if start_page < 1 or end_page < 1:
-                        return jsonify({'error': 'Page numbers must be at least 1'}), 400
-                    if start_page > end_page:
-                        return jsonify({'error': 'Start page must be less than or equal to end page'}), 400
-                else:
-                    return jsonify({'error': 'Invalid page range format. Use: startPage-endPage'}), 400
-            except ValueError:
-                return jsonify({'error': 'Invalid page range format. Use: startPage-endPage'}), 400
-
-        instance_url = _get_instance_url()
-
-        # Build query parameters (reused for retry)
-        query_params = []
-        if include_confidence:
-            query_params.append('extractDataWithConfidenceScore=true')
-        if start_page is not None:
-            query_params.append(f'startPage={start_page}')
-        if end_page is not None:
-            query_params.append(f'endPage={end_page}')
-        query_suffix = '?' + '&'.join(query_params) if query_params else ''
-
-        # Build URL: support override via DOCUMENT_AI_EXTRACT_PATH (some orgs use path without /actions/)
-        path_suffix = DOCUMENT_AI_EXTRACT_PATH.strip().strip('/')
-        url = f"{instance_url}/services/data/{API_VERSION}/{path_suffix}{query_suffix}"
-
-        # Log page range for debugging
-        logging.info("Processing document (page_range=%s)", page_range or "all")
-
-        payload = {
-            "mlModel": ml_model,
-            "schemaConfig": schema_config_final,
-            "files": [
-                {
-                    "mimeType": file.content_type or "image/jpeg",
-                    "data": base64_data
-                }
-            ]
-        }
+            with doc.open() as source:
+                extraction = build_extraction(options, source, doc.content_type)
+        except PreflightError as e:
+            return dict(e.to_dict(), status=e.status)
+        result, status = run_extraction(extraction)
+        return dict(result, status=status)
+
+    return Response(stream_with_context(ndjson_stream(iter_batch(documents, run_document, concurrency))),
+                    mimetype='application/x-ndjson', headers={'X-Accel-Buffering': 'no'})
+
+
+def _parse_compare_models():
+    """Models to compare from the 'ml_models' field(s), comma-separated or repeated; (models, None) or (None, error)."""
+    models = []
+    for value in request.form.getlist('ml_models'):
+        models.extend(m.strip() for m in value.split(',') if m.strip())
+    models = list(dict.fromkeys(models))
+    if not models:
+        return None, _error('List the models to compare in ml_models', 'missing_models')
+    if len(models) > COMPARE_MAX_MODELS:
+        return None, _error(f'Too many models ({len(models)}); the limit is {COMPARE_MAX_MODELS}', 'too_many_models',
+                            limit=COMPARE_MAX_MODELS)
+    return models, None
+
+
+@app.route('/extract-data/compare', methods=['POST'])
+def extract_data_compare():
+    """Extract one upload with several models at once: the document is validated and encoded once.
+
+    Streams one NDJSON line per model as it finishes (result, status, latency, sizes), then a
+    summary line with per-model latency and result size and the fields the models disagree on.
+    """
+    try:
+        # Auth and the admission rate check come first, before the upload is parsed
+        extraction, error_response = _prepare_extraction()
+        if error_response:
+            return error_response
+    except HTTPException:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    models, error_response = _parse_compare_models()
+    if error_response:
+        extraction['body'].close()
+        return error_response
 
-        access_token = _get_access_token()
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {access_token}'
-        }
+    def run_model(model):
+        model_extraction = with_model(extraction, model)
+        result, status = call_document_ai(model_extraction)
+        return dict(result, requestBytes=len(model_extraction['body']), cache=model_extraction.get('cache_status')), status
+
+    def stream():
+        try:
+            for line in iter_compare(models, run_model):
+                yield dumps_json(line) + b'\n'
+        finally:
+            extraction['body'].close()  # every model's call has finished: iter_compare waits for them
+
+    return Response(stream_with_context(stream()), mimetype='application/x-ndjson',
+                    headers={'X-Accel-Buffering': 'no'})
+
+
+def _job_owner():
+    """Owner id of the current request's org credentials (None when not authenticated)."""
+    if not _is_authenticated():
+        return None
+    return org_owner(_get_instance_url(), _get_access_token())
 
-        # Do not log schema, payload, or URL (may contain user data or org identity)
-        response = requests.request("POST", url, headers=headers, json=payload, timeout=160)
-
-        # On 404: try alternate path and/or API version (different orgs use different combinations)
-        if response.status_code == 404:
-            paths = [
-                "ssot/document-processing/actions/extract-data",
-                "ssot/document-processing/extract-data",
-            ]
-            versions = list(dict.fromkeys([API_VERSION, "v65.0", "v64.0"]))  # dedupe, keep order
-            for try_version in versions:
-                for try_path in paths:
-                    if try_path == path_suffix and try_version == API_VERSION:
-                        continue  # already tried above
-                    alt_url = f"{instance_url}/services/data/{try_version}/{try_path}{query_suffix}"
-                    logging.info("Retrying 404 with alternate path/version")
-                    response = requests.request("POST", alt_url, headers=headers, json=payload, timeout=160)
-                    if response.status_code in [200, 201]:
-                        url = alt_url
-                        break
-                if response.status_code in [200, 201]:
-                    break
-
-        # Handle 404: Document AI endpoint not found
-        if response.status_code == 404:
-            return jsonify({
-                'error': 'Document AI endpoint not found (404)',
-                'details': response.text or 'The document-processing API returned 404.',
-                'hints': [
-                    'Document AI may not be enabled in this org, or the API path/version differs.',
-                    'Confirm Document AI is enabled: Setup → Data 360 Connect / Document AI.',
-                    'On Heroku set: DOCUMENT_AI_EXTRACT_PATH=ssot/document-processing/extract-data or .../actions/extract-data, and API_VERSION=v65.0 or v64.0.',
-                    'Check Data 360 Connect API docs or Postman for the current extract-data path for your org.'
-                ]
-            }), 404
-            
-        if response.status_code in [200, 201]:
-            try:
-                # Do not log response body (may contain extracted PII or sensitive data)
-                json_response = response.json()
-                
-                # Check if response has expected structure
-                if not json_response:
-                    return jsonify({'error': 'Empty response from server'}), 200
-                
-                if 'data' not in json_response or not json_response['data']:
-                    return jsonify({'error': 'No data in response'}), 200
-                
-                # Check for error in the response
-                if json_response['data'][0].get('error'):
-                    error_msg = json_response['data'][0]['error']
-                    if '403' in error_msg:
-                        return jsonify({
-                            'error': 'Authentication error with the OpenAI service. Please check your API credentials.',
-                            'details': error_msg
-                        }), 403
-                    return jsonify({
-                        'error': 'Service error',
-                        'details': error_msg
-                    }), 500
-                
-                nested_json_str = json_response['data'][0].get('data')
-                if not nested_json_str:
-                    return jsonify({'error': 'No extracted data in response'}), 200
-                
-                # Replace HTML entities
-                nested_json_str = nested_json_str.replace('&quot;', '"').replace('&#92;', '\\')
-                
-                # Parse the JSON string
-                nested_json = json.loads(nested_json_str)
-                
-                # Unified response shape: always { data, metadata?, apiRequest? }
-                response_data = {'data': nested_json}
-                if include_confidence:
-                    response_data['metadata'] = {'confidenceScoresIncluded': True}
-                
-                # Build developer snippet (curl + Apex) for successful extract-data
-                payload_json = json.dumps(payload, ensure_ascii=False)
-                # Escape single quotes for use inside single-quoted curl -d '...'
-                def escape_single_quotes(s):
-                    return s.replace("'", "'\"'\"'")
-                payload_escaped = escape_single_quotes(payload_json)
-                url_escaped = escape_single_quotes(url)
-                token_escaped = escape_single_quotes(access_token)
-                curl_cmd = f"curl -X POST '{url_escaped}' -H 'Content-Type: application/json' -H 'Authorization: Bearer {token_escaped}' -d '{payload_escaped}'"
-                
-                mime_type = file.content_type or 'image/jpeg'
-                apex_endpoint = f"{instance_url.rstrip('/')}/services/data/{API_VERSION}/ssot/document-processing/actions/extract-data{query_suffix}"
-                apex_snippet = f'''HttpRequest req = new HttpRequest();
-req.setEndpoint('{apex_endpoint}');
-req.setMethod('POST');
-req.setHeader('Content-Type', 'application/json');
-req.setHeader('Authorization', 'Bearer ' + accessToken);
-req.setBody('{{"mlModel":"{ml_model}","schemaConfig":' + schemaConfigJson + ',"files":[{{"mimeType":"{mime_type}","data":"' + base64FileData + '"}}]}}');
-Http http = new Http();
-HttpResponse res = http.send(req);
-// Replace: accessToken, schemaConfigJson (JSON string), base64FileData (Base64 string).'''
-                
-                response_data['apiRequest'] = {
-                    'curl': curl_cmd,
-                    'apex': apex_snippet
-                }
-                
-                formatted_json = json.dumps(response_data, ensure_ascii=False, indent=2)
-                return formatted_json, 200, {
-                    'Content-Type': 'application/json; charset=utf-8'
-                }
-            except (KeyError, IndexError, json.JSONDecodeError) as e:
-                return jsonify({
-                    'error': f'Error processing response: {str(e)}',
-                    'raw_response': response.text
-                }), 500
-        else:
-            resp = jsonify({
-                'error': f'API request failed with status {response.status_code}',
-                'details': response.text,
-                'url_used': url
-            })
-            # On 401/403 from Salesforce, clear token in session so /api/status returns authenticated: false
-            if response.status_code in (401, 403):
-                session_data = _get_session()
-                if session_data is not None:
-                    updated = dict(session_data)
-                    updated.pop('access_token', None)
-                    updated.pop('instance_url', None)
-                    _set_session_cookie(resp, updated)
-            return resp, response.status_code
 
+def _run_extraction_job(extraction):
+    try:
+        return run_extraction(extraction)
+    except Exception as e:
+        return {'error': str(e)}, 500
+
+
+@app.route('/extract-data/jobs', methods=['POST'])
+def create_extraction_job():
+    """Accept an upload and run the extraction in the background; returns a job id immediately."""
+    try:
+        extraction, error_response = _prepare_extraction()
+        if error_response:
+            return error_response
+        job = extraction_jobs.submit(_run_extraction_job, extraction, owner=_job_owner())
+    except JobQueueFull as e:
+        extraction['body'].close()
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
+    except HTTPException:
+        raise
     except Exception as e:
         return jsonify({
             'error': str(e)
         }), 500
+    return jsonify(job.to_dict()), 202, {'Location': f"/extract-data/jobs/{job.id}"}
+
+
+@app.route('/extract-data/jobs/<job_id>', methods=['GET'])
+def get_extraction_job(job_id):
+    """Job status; includes result and resultStatus once finished. ?wait=N long-polls up to N seconds."""
+    job = extraction_jobs.get(job_id)
+    if job is None or job.owner is None or job.owner != _job_owner():
+        return jsonify({'error': 'Job not found or expired'}), 404
+    try:
+        wait = min(float(request.args.get('wait', 0)), JOB_LONG_POLL_MAX)
+    except ValueError:
+        wait = 0
+    if wait > 0:
+        job.wait(wait)
+    resp = jsonify(job.to_dict())
+    _clear_token_on_auth_failure(resp, job.result, job.result_status)
+    return _gzip_response(resp)
+
+
+@app.route('/extract-data/jobs/<job_id>', methods=['DELETE'])
+def cancel_extraction_job(job_id):
+    job = extraction_jobs.get(job_id)
+    if job is None or job.owner is None or job.owner != _job_owner():
+        return jsonify({'error': 'Job not found or expired'}), 404
+    extraction_jobs.cancel(job_id)
+    return jsonify(job.to_dict())
+
 
 @app.route('/json-jazz')
 def json_jazz():
-    return render_template('json-jazz.html')
+    return assets.page('json_jazz')
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 3000))
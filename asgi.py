@@ -0,0 +1,366 @@
+"""ASGI serving mode: extraction and OAuth token exchange run on asyncio with a non-blocking
+HTTP client, so one process can keep many long Document AI calls in flight.
+
+    gunicorn asgi:app -c gunicorn_asgi_config.py
+
+POST /extract-data and POST /auth/exchange are handled here. Request validation, session
+handling and response shaping still run through the Flask app's own functions (in a worker
+thread, inside a Flask request context), so both modes behave the same. Every other route is
+served by the Flask app through a WSGI adapter, each request on its own pool thread, so a
+streaming batch or a job long-poll does not hold up the rest.
+"""
+import asyncio
+import logging
+import sys
+import tempfile
+import time
+from http.cookiejar import CookieJar
+from urllib.parse import parse_qs, urlencode
+
+import httpx
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
+
+import app as flask_module
+from admission import AdmissionRejected, admission
+from circuit_breaker import CircuitOpenError, circuit_breakers, is_failure_status
+from config import HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE, HTTP_RETRIES, UPLOAD_SPOOL_THRESHOLD
+from discovery import candidate_endpoints, endpoint_cache, endpoint_url
+from coalescing import extraction_flights
+from extraction import (
+    cached_extraction_result, call_document_ai_chunked, chunk_windows, extract_headers, flight_key,
+    shape_extraction_result, shared_result,
+)
+from http_client import _NoCookiesPolicy
+from metrics import record_retry, record_stage, record_upstream, start_request
+from profiling import HEADER as PROFILE_HEADER, begin as begin_profile, profile_call, requested as profile_requested
+
+flask_app = flask_module.app
+
+# Upstream Document AI calls can take minutes; the connect phase should not
+UPSTREAM_TIMEOUT = httpx.Timeout(160.0, connect=15.0)
+BODY_CHUNK_SIZE = 256 * 1024
+
+
+def _new_async_client():
+    return httpx.AsyncClient(
+        timeout=UPSTREAM_TIMEOUT,
+        limits=httpx.Limits(max_connections=HTTP_POOL_CONNECTIONS * HTTP_POOL_MAXSIZE,
+                            max_keepalive_connections=HTTP_POOL_MAXSIZE),
+        transport=httpx.AsyncHTTPTransport(retries=HTTP_RETRIES),  # connection failures only
+        cookies=httpx.Cookies(CookieJar(policy=_NoCookiesPolicy())),
+    )
+
+
+class _EarlyResponse(Exception):
+    """Raised inside a Flask phase to end the request with an already-built response."""
+
+    def __init__(self, parts):
+        self.parts = parts
+
+
+def _in_thread(fn, *args):
+    """asyncio.to_thread, with fn profiled when the request is being profiled (the context is copied along)."""
+    return asyncio.to_thread(profile_call, fn, *args)
+
+
+async def _acquire_in_thread(acquire, release, *args):
+    """await _in_thread(acquire, *args) for a blocking slot acquire. If the awaiting task is cancelled
+    (client disconnect, timeout) the worker thread still finishes the acquire; release(its result) is
+    then called as soon as it does, so the slot is not lost."""
+    acquiring = asyncio.ensure_future(_in_thread(acquire, *args))
+    try:
+        return await asyncio.shield(acquiring)
+    except asyncio.CancelledError:
+        acquiring.add_done_callback(
+            lambda done: done.cancelled() or done.exception() is not None or release(done.result()))
+        raise
+
+
+def _query_param(environ, name):
+    values = parse_qs(environ['QUERY_STRING']).get(name)
+    return values[0] if values else None
+
+
+def _build_environ(scope, body):
+    script_name = scope.get('root_path', '').encode('utf8').decode('latin1')
+    path_info = scope['path'].encode('utf8').decode('latin1')
+    if path_info.startswith(script_name):
+        path_info = path_info[len(script_name):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name,
+        'PATH_INFO': path_info,
+        'QUERY_STRING': scope.get('query_string', b'').decode('ascii'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin1')
+        if name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        elif name == 'content-type':
+            key = 'CONTENT_TYPE'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        value = value.decode('latin1')
+        environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+
+def _response_parts(rv):
+    """Finish a Flask view return value (after_request hooks included) -> (status, headers, body)."""
+    resp = flask_app.process_response(flask_app.make_response(rv))
+    return resp.status_code, resp.headers.to_wsgi_list(), resp.get_data()
+
+
+def _flask_phase(environ, fn):
+    """Run fn() in a Flask request context (before_request hooks included); for use in a worker thread.
+
+    fn returns (value, None) to continue or (None, view_return_value) to finish the request.
+    """
+    with flask_app.request_context(environ):
+        rv = flask_app.preprocess_request()
+        if rv is not None:
+            raise _EarlyResponse(_response_parts(rv))
+        value, error_response = fn()
+        if error_response is not None:
+            raise _EarlyResponse(_response_parts(error_response))
+        return value
+
+
+def _flask_response(environ, fn):
+    """Build the final response with fn() -> view return value, in a Flask request context."""
+    with flask_app.request_context(environ):
+        rv = flask_app.preprocess_request()
+        return _response_parts(rv if rv is not None else fn())
+
+
+def _declared_length(scope):
+    for name, value in scope.get('headers', []):
+        if name == b'content-length':
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
+
+
+async def _body_chunks(body):
+    """Async iterator over a payload.ExtractBody; file reads happen off the event loop."""
+    reader = body.open()
+    try:
+        while True:
+            chunk = await _in_thread(reader.read, BODY_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        reader.close()
+
+
+class _PooledWsgiToAsgiInstance(WsgiToAsgiInstance):
+    # asgiref runs WSGI apps thread-sensitively: every call shares one thread, so a streaming batch or
+    # a job long-poll would hold up every other fallback route. Run each call on the thread pool instead.
+    run_wsgi_app = sync_to_async(WsgiToAsgiInstance.__dict__['run_wsgi_app'].func,  # the undecorated method
+                                 thread_sensitive=False)
+
+
+class _PooledWsgiToAsgi(WsgiToAsgi):
+    """WsgiToAsgi whose requests run concurrently on the event loop's default thread pool."""
+
+    async def __call__(self, scope, receive, send):
+        await _PooledWsgiToAsgiInstance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+
+class DocumentAIApp:
+    def __init__(self, wsgi_app):
+        self.wsgi = _PooledWsgiToAsgi(wsgi_app)
+        self.client = None
+        self.routes = {
+            ('POST', '/extract-data'): self.extract_data,
+            ('POST', '/auth/exchange'): self.auth_exchange,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        handler = self.routes.get((scope.get('method'), scope.get('path'))) if scope['type'] == 'http' else None
+        if handler is None:
+            return await self.wsgi(scope, receive, send)
+        if self.client is None:
+            self.client = _new_async_client()
+        limit = flask_app.config.get('MAX_CONTENT_LENGTH')
+        with tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_THRESHOLD) as body:
+            # Refuse an oversized body up front (declared length) or as soon as it passes the limit
+            too_large = bool(limit) and (_declared_length(scope) or 0) > limit
+            received = 0
+            while not too_large:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                chunk = message.get('body', b'')
+                received += len(chunk)
+                if limit and received > limit:
+                    too_large = True
+                    break
+                body.write(chunk)
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+            environ = _build_environ(scope, body)
+            start_request(environ)  # Flask phases in worker threads add to the same timings
+            profile = profile_summary = None
+            if profile_requested(environ.get('HTTP_X_PROFILE') or _query_param(environ, 'profile')):
+                # Only the worker-thread phases are profiled (that is where the CPU work is); the event loop is shared
+                profile = begin_profile(handler.__name__)
+                profile_summary = 'busy' if profile is None else None
+            try:
+                if too_large:
+                    raise RequestEntityTooLarge()
+                status, headers, content = await handler(environ)
+            except _EarlyResponse as early:
+                status, headers, content = early.parts
+            except HTTPException as e:
+                status, headers, content = await _in_thread(
+                    _flask_response, environ, lambda: flask_app.handle_user_exception(e))
+            except Exception as e:
+                logging.exception("ASGI handler failed")
+                status, headers, content = await _in_thread(
+                    _flask_response, environ, lambda: (flask_module.jsonify({'error': str(e)}), 500))
+            finally:
+                if profile is not None:
+                    profile_summary = await asyncio.to_thread(profile.finish)
+            if profile_summary:
+                headers.append((PROFILE_HEADER, profile_summary))
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(k.lower().encode('latin1'), v.encode('latin1')) for k, v in headers],
+        })
+        await send({'type': 'http.response.body', 'body': content})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.client = _new_async_client()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.client is not None:
+                    await self.client.aclose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _post(self, url, request_bytes, **kwargs):
+        """POST with the async client, recorded in the upstream metrics like http_client calls."""
+        started = time.perf_counter()
+        try:
+            response = await self.client.post(url, **kwargs)
+        except httpx.HTTPError:
+            record_upstream(url, 'error', time.perf_counter() - started)
+            raise
+        record_upstream(url, response.status_code, time.perf_counter() - started, request_bytes, len(response.content))
+        return response
+
+    async def post_extract(self, extraction):
+        """Async twin of extraction.post_extract: circuit breaker, cached endpoint first, 404 fallback, cache on success."""
+        instance_url = extraction['instance_url']
+        headers = extract_headers(extraction)
+        headers['Content-Length'] = str(len(extraction['body']))
+        cached = endpoint_cache.get(instance_url)
+        response = url = None
+        breaker = circuit_breakers.get(instance_url)
+        probe = await _acquire_in_thread(breaker.acquire, breaker.cancel)  # may wait for a bulkhead slot
+        call_started = time.monotonic()
+        failed = True
+        try:
+            for attempt, (version, path) in enumerate(candidate_endpoints(preferred=cached)):
+                url = endpoint_url(instance_url, version, path, extraction['query_suffix'])
+                if attempt:
+                    logging.info("Retrying 404 with alternate path/version")
+                started = time.perf_counter()
+                response = await self._post(url, len(extraction['body']), headers=headers,
+                                            content=_body_chunks(extraction['body']))
+                if response.status_code != 404:
+                    if response.status_code in (200, 201):
+                        endpoint_cache.set(instance_url, version, path)
+                    break
+                record_stage('fallback', time.perf_counter() - started)
+                record_retry('not_found')
+                if attempt == 0 and cached:
+                    endpoint_cache.invalidate(instance_url)
+            failed = is_failure_status(response.status_code)
+        finally:
+            breaker.release(probe, failed, time.monotonic() - call_started)
+        return response, url
+
+    async def extract_data(self, environ):
+        extraction = await _in_thread(_flask_phase, environ, flask_module._prepare_extraction)
+        try:
+            result = await _in_thread(cached_extraction_result, extraction)
+            if result is not None:
+                status = 200
+            elif extraction['cache_bypass']:
+                result, status = await self.admitted_call(extraction)
+            else:
+                async def lead():
+                    return (*await self.admitted_call(extraction), extraction['access_token'])
+
+                (result, status, leader_token), shared = await extraction_flights.run_async(
+                    flight_key(extraction), lead)
+                if shared:
+                    outcome = await _in_thread(shared_result, extraction, result, status, leader_token)
+                    result, status = outcome or await self.admitted_call(extraction)
+        finally:
+            extraction['body'].close()
+        return await _in_thread(
+            _flask_response, environ,
+            lambda: flask_module._extraction_response(result, status, extraction.get('cache_status'),
+                                                      extraction['pretty']))
+
+    async def admitted_call(self, extraction):
+        """Async twin of extraction.admitted_call."""
+        try:
+            # Waiting for an admission slot blocks a worker thread, never the event loop
+            await _acquire_in_thread(admission.acquire, lambda _: admission.release(),
+                                     extraction['admission_session'])
+        except AdmissionRejected as e:
+            return e.to_dict(), 429
+        try:
+            return await self.call_document_ai(extraction)
+        finally:
+            admission.release()
+
+    async def call_document_ai(self, extraction):
+        """Async twin of extraction.call_document_ai_uncached."""
+        windows = chunk_windows(extraction)
+        if windows:
+            # Chunked PDFs fan out on the sync client's thread pool (bounded by chunk_concurrency())
+            return await _in_thread(call_document_ai_chunked, extraction, windows)
+        logging.info("Processing document (page_range=%s)", extraction['page_range'] or "all")
+        try:
+            response, url = await self.post_extract(extraction)
+        except CircuitOpenError as e:
+            return e.to_dict(), 503
+        return await _in_thread(shape_extraction_result, extraction, response, url)
+
+    async def auth_exchange(self, environ):
+        token_url, payload = await _in_thread(_flask_phase, environ, flask_module._prepare_token_exchange)
+        resp = await self._post(token_url, len(urlencode(payload)), data=payload)
+        return await _in_thread(_flask_response, environ, lambda: flask_module._complete_token_exchange(resp))
+
+
+app = DocumentAIApp(flask_app)
@@ -0,0 +1,116 @@
+"""Precompressed delivery of the UI: pages rendered once, static files fingerprinted.
+
+Pages without per-request data are rendered on their first request and kept as identity, gzip
+and (when the optional brotli package is installed) brotli variants, each with a strong ETag, so
+a page load is a dictionary lookup and a repeat visit is a 304. Static files get the same treatment;
+url_for('static', ...) produces a fingerprinted URL (css/style.<hash>.css) that is served with
+a one-year immutable Cache-Control, while the plain URL still works and revalidates.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+
+from flask import Response, abort, render_template, request
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'  # cache, but check the ETag every time
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+MIN_COMPRESS_BYTES = 512
+
+
+class Asset:
+    """One response body with its precomputed encodings: {'identity' | 'gzip' | 'br': (bytes, etag)}."""
+
+    def __init__(self, body, content_type):
+        self.content_type = content_type
+        self.digest = hashlib.sha256(body).hexdigest()[:16]
+        self.variants = {'identity': (body, f'"{self.digest}"')}
+        if len(body) >= MIN_COMPRESS_BYTES and content_type.startswith(COMPRESSIBLE_TYPES):
+            self.variants['gzip'] = (gzip.compress(body, compresslevel=9, mtime=0), f'"{self.digest}-gz"')
+            if brotli is not None:
+                self.variants['br'] = (brotli.compress(body, quality=11), f'"{self.digest}-br"')
+
+    def response(self, cache_control):
+        """The best variant for the current request's Accept-Encoding, or 304 if If-None-Match matches it."""
+        accepted = request.accept_encodings
+        encoding = next((e for e in ('br', 'gzip') if e in self.variants and accepted[e]), 'identity')
+        body, etag = self.variants[encoding]
+        headers = {'ETag': etag, 'Cache-Control': cache_control}
+        if len(self.variants) > 1:
+            headers['Vary'] = 'Accept-Encoding'
+        if request.if_none_match.contains_weak(etag.strip('"')):
+            return Response(status=304, headers=headers)
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return Response(body, mimetype=self.content_type, headers=headers)
+
+
+def _fingerprinted(filename, digest):
+    root, ext = os.path.splitext(filename)
+    return f'{root}.{digest[:12]}{ext}'
+
+
+class AssetPipeline:
+    def __init__(self, app):
+        self.app = app
+        self._pages = {}  # page name -> render function
+        self._rendered = {}  # page name -> Asset
+        self._static = {}  # filename (plain or fingerprinted) -> (Asset, fingerprinted?)
+        self._fingerprints = {}  # plain filename -> fingerprinted filename
+        self._load_static()
+        app.view_functions['static'] = self.serve_static
+        app.url_defaults(self._static_url_defaults)
+
+    def _load_static(self):
+        folder = self.app.static_folder
+        for root, _, files in os.walk(folder):
+            for name in files:
+                path = os.path.join(root, name)
+                filename = os.path.relpath(path, folder).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    asset = Asset(f.read(), mimetypes.guess_type(name)[0] or 'application/octet-stream')
+                fingerprinted = _fingerprinted(filename, asset.digest)
+                self._static[filename] = (asset, False)
+                self._static[fingerprinted] = (asset, True)
+                self._fingerprints[filename] = fingerprinted
+
+    def _static_url_defaults(self, endpoint, values):
+        if endpoint == 'static' and values.get('filename') in self._fingerprints:
+            values['filename'] = self._fingerprints[values['filename']]
+
+    def serve_static(self, filename):
+        entry = self._static.get(filename)
+        if entry is None or self.app.debug:
+            return self.app.send_static_file(filename)  # new files, or live edits in debug mode
+        asset, fingerprinted = entry
+        return asset.response(IMMUTABLE if fingerprinted else REVALIDATE)
+
+    def add_template_page(self, name, template, **context):
+        """Serve `template` (rendered once, with a fixed context) as page `name`."""
+        self._add_page(name, lambda: render_template(template, **context).encode('utf-8'))
+
+    def add_static_page(self, name, filename):
+        """Serve a complete HTML file from the static folder as page `name`."""
+        def load():
+            with open(os.path.join(self.app.static_folder, filename), 'rb') as f:
+                return f.read()
+        self._add_page(name, load)
+
+    def _add_page(self, name, render):
+        self._pages[name] = render
+
+    def page(self, name):
+        """Response for a page, rendered on its first request (on every request in debug mode)."""
+        asset = self._rendered.get(name)
+        if asset is None or self.app.debug:
+            render = self._pages.get(name)
+            if render is None:
+                abort(404)
+            asset = self._rendered[name] = Asset(render(), 'text/html')
+        return asset.response(REVALIDATE)
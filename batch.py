@@ -0,0 +1,118 @@
+"""Batch extraction: bounded fan-out of many documents and NDJSON streaming of results."""
+import mimetypes
+import os
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from json_utils import dumps as dumps_json
+
+
+class BatchDocument:
+    """One document of a batch; opened lazily so only in-flight documents are held in memory.
+
+    `open()` returns a binary stream of the document's bytes.
+    """
+
+    def __init__(self, index, filename, content_type, open):
+        self.index = index
+        self.filename = filename
+        self.content_type = content_type
+        self.open = open
+
+
+class ZipRejected(ValueError):
+    """An uploaded zip archive that can't be used; `code` and `details` go into the JSON error body."""
+
+    def __init__(self, message, code, **details):
+        super().__init__(message)
+        self.code = code
+        self.details = details
+
+
+def is_zip_upload(file_storage):
+    name = (file_storage.filename or '').lower()
+    return name.endswith('.zip') or file_storage.mimetype in ('application/zip', 'application/x-zip-compressed')
+
+
+def zip_documents(file_storage, allowed_file, max_files, max_bytes, start_index=0):
+    """BatchDocuments for every allowed member of an uploaded zip archive.
+
+    Raises ZipRejected for an unreadable archive or one over the file-count / uncompressed-size limits.
+    """
+    try:
+        archive = zipfile.ZipFile(file_storage.stream)
+    except zipfile.BadZipFile as e:
+        raise ZipRejected(f'Invalid zip archive {file_storage.filename!r}: {e}', 'invalid_zip')
+    members = [
+        info for info in archive.infolist()
+        if not info.is_dir()
+        and not info.filename.startswith('__MACOSX/')
+        and not os.path.basename(info.filename).startswith('.')
+    ]
+    if len(members) > max_files:
+        raise ZipRejected(f'Zip archive has {len(members)} files; the limit is {max_files}', 'too_many_documents',
+                          limit=max_files)
+    if sum(info.file_size for info in members) > max_bytes:
+        raise ZipRejected(f'Zip archive expands to more than {max_bytes} bytes', 'zip_too_large', limitBytes=max_bytes)
+    documents = []
+    for offset, info in enumerate(members):
+        filename = info.filename
+        content_type = mimetypes.guess_type(filename)[0] if allowed_file(filename) else None
+        documents.append(BatchDocument(start_index + offset, filename, content_type,
+                                       lambda info=info: archive.open(info)))
+    return documents
+
+
+def iter_batch(documents, run_document, concurrency):
+    """Run run_document(doc) -> dict for each document, at most `concurrency` at a time.
+
+    Yields each document's result as soon as it finishes (completion order, not upload order).
+    Exceptions are turned into per-document error results so one failure never ends the batch.
+    """
+    pending = iter(documents)
+    in_flight = {}
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='extract-batch') as executor:
+        def submit_next():
+            doc = next(pending, None)
+            if doc is not None:
+                in_flight[executor.submit(_timed, run_document, doc)] = doc
+            return doc is not None
+
+        for _ in range(max(1, concurrency)):
+            if not submit_next():
+                break
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                doc = in_flight.pop(future)
+                yield future.result()
+                submit_next()
+
+
+def _timed(run_document, doc):
+    started = time.monotonic()
+    try:
+        line = run_document(doc)
+    except Exception as e:
+        line = {'status': 500, 'error': str(e)}
+    line = dict({'index': doc.index, 'filename': doc.filename}, **line)
+    line['elapsedMs'] = round((time.monotonic() - started) * 1000)
+    return line
+
+
+def ndjson_stream(lines):
+    """Serialize result dicts as newline-delimited JSON, ending with a summary line."""
+    total = succeeded = 0
+    started = time.monotonic()
+    for line in lines:
+        total += 1
+        if line.get('status') in (200, 201) and 'error' not in line:
+            succeeded += 1
+        yield dumps_json(line) + b'\n'
+    yield dumps_json({'summary': {
+        'documents': total,
+        'succeeded': succeeded,
+        'failed': total - succeeded,
+        'elapsedMs': round((time.monotonic() - started) * 1000),
+    }}) + b'\n'
@@ -0,0 +1,160 @@
+"""Local stand-in for the Salesforce endpoints this app calls, for benchmarks and load tests.
+
+    python -m bench.fake_salesforce --port 8765 --latency 0.5 --response-kb 4 --not-found-first
+
+Serves POST /services/oauth2/token and POST /services/data/<version>/ssot/document-processing/
+[actions/]extract-data. Only one version/path combination "exists"; the others return 404, so
+--not-found-first exercises the app's 404 fallback path. GET /__stats returns request and byte
+counters; POST /__reset clears them.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EXTRACT_RE = re.compile(r'^/services/data/(v[\d.]+)/(ssot/document-processing/(?:actions/)?extract-data)$')
+DEFAULT_ENDPOINT = ('v65.0', 'ssot/document-processing/actions/extract-data')
+NOT_FOUND_FIRST_ENDPOINT = ('v64.0', 'ssot/document-processing/extract-data')
+
+
+class FakeSalesforce:
+    def __init__(self, latency=0.0, jitter=0.0, response_kb=2, not_found_first=False):
+        self.latency = latency
+        self.jitter = jitter
+        self.response_kb = response_kb
+        self.endpoint = NOT_FOUND_FIRST_ENDPOINT if not_found_first else DEFAULT_ENDPOINT
+        self.base_url = None
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stats = {'requests': 0, 'bytesReceived': 0, 'byStatus': {}, 'extractCalls': 0, 'tokenCalls': 0}
+
+    def record(self, status, body_bytes, kind=None):
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats['bytesReceived'] += body_bytes
+            self.stats['byStatus'][str(status)] = self.stats['byStatus'].get(str(status), 0) + 1
+            if kind:
+                self.stats[kind] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return json.loads(json.dumps(self.stats))
+
+    def extraction_payload(self, model):
+        """Document AI style response: data[0].data is an HTML-entity-escaped JSON string."""
+        rows = max(1, self.response_kb * 1024 // 80)
+        extracted = {
+            'model': model,
+            'invoice_number': 'INV-0001',
+            'line_items': [{'description': f'Item {i}', 'quantity': i % 7 + 1, 'amount': round(i * 1.37, 2)}
+                           for i in range(rows)],
+        }
+        escaped = json.dumps(extracted).replace('"', '&quot;').replace('\\', '&#92;')
+        return {'data': [{'data': escaped}]}
+
+    def sleep(self):
+        delay = self.latency + (random.uniform(-self.jitter, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def read_body(self):
+                if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+                    total, parts = 0, []
+                    while True:
+                        size = int(self.rfile.readline().split(b';')[0].strip() or b'0', 16)
+                        if size == 0:
+                            self.rfile.readline()
+                            break
+                        parts.append(self.rfile.read(size))
+                        total += size
+                        self.rfile.readline()
+                    return b''.join(parts)
+                return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+            def reply(self, status, payload):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path == '/__stats':
+                    return self.reply(200, fake.snapshot())
+                self.reply(404, [{'errorCode': 'NOT_FOUND'}])
+
+            def do_POST(self):
+                body = self.read_body()
+                path = self.path.split('?', 1)[0]
+                if path == '/__reset':
+                    fake.reset()
+                    return self.reply(200, {'ok': True})
+                if path == '/services/oauth2/token':
+                    fake.sleep()
+                    fake.record(200, len(body), 'tokenCalls')
+                    return self.reply(200, {'access_token': 'fake-token', 'instance_url': fake.base_url,
+                                            'token_type': 'Bearer'})
+                match = EXTRACT_RE.match(path)
+                if not match or match.groups() != fake.endpoint:
+                    fake.record(404, len(body))
+                    return self.reply(404, [{'errorCode': 'NOT_FOUND', 'message': 'The requested resource does not exist'}])
+                try:
+                    request_json = json.loads(body)
+                    model = request_json['mlModel']
+                    if not request_json['files'][0]['data']:
+                        raise ValueError('empty file')
+                except (ValueError, KeyError, IndexError, TypeError):
+                    fake.record(400, len(body), 'extractCalls')
+                    return self.reply(400, [{'errorCode': 'INVALID_INPUT', 'message': 'Invalid request body'}])
+                fake.sleep()
+                fake.record(200, len(body), 'extractCalls')
+                self.reply(200, fake.extraction_payload(model))
+
+        return Handler
+
+    def start(self, host='127.0.0.1', port=0):
+        """Serve on a background thread; returns the server (call .shutdown() to stop)."""
+        server = ThreadingHTTPServer((host, port), self.make_handler())
+        server.daemon_threads = True
+        self.base_url = f'http://{host}:{server.server_address[1]}'
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds per upstream call')
+    parser.add_argument('--jitter', type=float, default=0.0, help='+/- seconds of random latency')
+    parser.add_argument('--response-kb', type=int, default=2, help='approximate size of the extracted JSON')
+    parser.add_argument('--not-found-first', action='store_true',
+                        help='only v64.0 .../extract-data exists, so the default path returns 404 first')
+    args = parser.parse_args()
+    fake = FakeSalesforce(args.latency, args.jitter, args.response_kb, args.not_found_first)
+    server = fake.start(args.host, args.port)
+    print(f'Fake Salesforce listening on {fake.base_url} (extract-data at {"/".join(fake.endpoint)})', flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
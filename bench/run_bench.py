@@ -0,0 +1,342 @@
+"""Load-test /extract-data through the real app against the local fake Salesforce server.
+
+    python -m bench.run_bench --sizes 1KB,1MB,10MB --types pdf,png --concurrency 8 --requests 40
+    python -m bench.run_bench --save bench/baseline.json
+    python -m bench.run_bench --compare bench/baseline.json --tolerance 0.2
+
+The app runs in its own process (werkzeug threaded server, or gunicorn with gunicorn_config.py /
+gunicorn_asgi_config.py) so its peak RSS is measured without the load generator in it. Requests carry
+a signed org session cookie pointing at the fake server, the result cache is bypassed so every
+request reaches "Salesforce", and admission control is off (SESSION_RATE_PER_MINUTE,
+ORG_RATE_PER_MINUTE and ADMISSION_MAX_IN_FLIGHT set to 0) since all bench traffic shares one session
+and org and would otherwise be rate-limited. Reports p50/p95/p99 latency and requests/sec of
+successful (200) responses, peak server RSS and bytes sent upstream per case; --compare exits 1 when
+any request fails, a case has fewer successes than the baseline, or a metric regresses past the tolerance.
+"""
+import argparse
+import json
+import os
+import secrets
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from itsdangerous import URLSafeTimedSerializer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SIZE_UNITS = {'B': 1, 'KB': 1024, 'MB': 1024 ** 2}
+CONTENT_TYPES = {'pdf': 'application/pdf', 'png': 'image/png', 'jpg': 'image/jpeg'}
+SCHEMA = json.dumps({'type': 'object', 'properties': {'invoice_number': {'type': 'string'}}})
+
+
+def parse_size(text):
+    text = text.strip().upper()
+    for unit in ('KB', 'MB', 'B'):
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * SIZE_UNITS[unit])
+    return int(text)
+
+
+def format_size(num):
+    for unit in ('MB', 'KB'):
+        if num >= SIZE_UNITS[unit] and num % SIZE_UNITS[unit] == 0:
+            return f'{num // SIZE_UNITS[unit]}{unit}'
+    return f'{num}B'
+
+
+def make_document(kind, size):
+    """Synthetic document of roughly `size` bytes: valid magic/header bytes plus incompressible padding."""
+    if kind == 'pdf':
+        head = (b'%PDF-1.7\n1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj\n'
+                b'2 0 obj << /Type /Pages /Kids [3 0 R] /Count 1 >> endobj\n'
+                b'3 0 obj << /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] >> endobj\n'
+                b'4 0 obj << /Length ')
+        tail = b'\nendstream endobj\ntrailer << /Root 1 0 R >>\n%%EOF\n'
+        pad = max(0, size - len(head) - len(tail) - 20)
+        return head + b'%d >> stream\n' % pad + os.urandom(pad) + tail
+    if kind == 'png':
+        head = b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x04\x00\x00\x00\x03\x00\x08\x02\x00\x00\x00'
+        return head + os.urandom(max(0, size - len(head)))
+    if kind == 'jpg':
+        head, tail = b'\xff\xd8\xff\xe0\x00\x10JFIF\x00', b'\xff\xd9'
+        return head + os.urandom(max(0, size - len(head) - len(tail))) + tail
+    raise ValueError(f'Unknown document type: {kind}')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url, proc, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f'{" ".join(proc.args)} exited with status {proc.returncode}')
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    raise RuntimeError(f'Timed out waiting for {url}')
+
+
+def server_command(server, port):
+    bind = f'127.0.0.1:{port}'
+    if server == 'werkzeug':
+        return [sys.executable, '-m', 'bench.serve_app', '--port', str(port)]
+    if server == 'gunicorn':
+        return [sys.executable, '-m', 'gunicorn', 'app:app', '-c', 'gunicorn_config.py', '-b', bind]
+    if server == 'asgi':
+        return [sys.executable, '-m', 'gunicorn', 'asgi:app', '-c', 'gunicorn_asgi_config.py', '-b', bind]
+    raise ValueError(f'Unknown server: {server}')
+
+
+def process_tree(pid):
+    """pid plus all descendants (Linux /proc); gunicorn workers are children of the master."""
+    pids, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        pids.append(current)
+        try:
+            for tid in os.listdir(f'/proc/{current}/task'):
+                with open(f'/proc/{current}/task/{tid}/children') as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def rss_bytes(pid):
+    total = 0
+    for child in process_tree(pid):
+        try:
+            with open(f'/proc/{child}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            pass
+    return total
+
+
+class RssSampler:
+    """Track the peak resident set size of the server process tree while a case runs."""
+
+    def __init__(self, pid, interval=0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, rss_bytes(self.pid))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_bytes(self.pid))
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def run_case(app_url, fake_url, cookie, server_pid, kind, size, concurrency, total):
+    document = make_document(kind, size)
+    filename = f'bench.{kind}'
+    requests.post(f'{fake_url}/__reset', timeout=5)
+    local = threading.local()
+
+    def one(_):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+            session.cookies.set('org_session', cookie)
+        started = time.perf_counter()
+        try:
+            resp = session.post(
+                f'{app_url}/extract-data',
+                files={'file': (filename, document, CONTENT_TYPES[kind])},
+                data={'schema': SCHEMA, 'cache': 'false'},
+                timeout=600,
+            )
+            status = resp.status_code
+            resp.content
+        except requests.RequestException:
+            status = 'error'
+        return time.perf_counter() - started, status
+
+    with RssSampler(server_pid) as sampler:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(one, range(total)))
+        elapsed = time.perf_counter() - started
+
+    upstream = requests.get(f'{fake_url}/__stats', timeout=5).json()
+    latencies = [latency for latency, status in outcomes if status == 200]
+    statuses = {}
+    for _, status in outcomes:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'type': kind,
+        'size': size,
+        'requests': total,
+        'concurrency': concurrency,
+        'statuses': statuses,
+        'p50Ms': _ms(percentile(latencies, 50)),
+        'p95Ms': _ms(percentile(latencies, 95)),
+        'p99Ms': _ms(percentile(latencies, 99)),
+        'rps': round(len(latencies) / elapsed, 2) if elapsed else None,  # successful responses only
+        'peakRssBytes': sampler.peak or None,
+        'upstreamBytes': upstream['bytesReceived'],
+        'upstreamRequests': upstream['requests'],
+        'upstreamStatuses': upstream['byStatus'],
+    }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def case_key(case):
+    return f"{case['type']}-{format_size(case['size'])}"
+
+
+# metric -> direction in which a change is a regression
+COMPARED_METRICS = {'p50Ms': 1, 'p95Ms': 1, 'p99Ms': 1, 'rps': -1, 'peakRssBytes': 1, 'upstreamBytes': 1}
+
+
+def succeeded(case):
+    return case['statuses'].get('200', 0)
+
+
+def compare(results, baseline, tolerance):
+    """Lines describing each failed request, drop in successes and metric that got worse than baseline
+    by more than `tolerance` (fraction). Latency and rps only cover 200 responses, so failures are
+    checked on their own."""
+    previous = {case_key(case): case for case in baseline['cases']}
+    regressions = []
+    for case in results['cases']:
+        failures = {status: count for status, count in case['statuses'].items() if status != '200'}
+        if failures:
+            regressions.append(f'{case_key(case)} non-200 responses: {failures}')
+        before = previous.get(case_key(case))
+        if before is None:
+            continue
+        if succeeded(case) < succeeded(before):
+            regressions.append(f'{case_key(case)} succeeded: {succeeded(before)} -> {succeeded(case)}')
+        for metric, direction in COMPARED_METRICS.items():
+            old, new = before.get(metric), case.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if change * direction > tolerance:
+                regressions.append(f'{case_key(case)} {metric}: {old} -> {new} ({change:+.0%})')
+    return regressions
+
+
+def print_report(results, out=sys.stdout):
+    header = f"{'case':<12}{'ok':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}{'peak RSS MB':>13}{'upstream MB':>13}"
+    print(f"server={results['server']} upstream latency={results['latency']}s "
+          f"response={results['responseKb']}KB not-found-first={results['notFoundFirst']}", file=out)
+    print(header, file=out)
+    for case in results['cases']:
+        ok = f"{succeeded(case)}/{case['requests']}"
+        rss = f"{case['peakRssBytes'] / SIZE_UNITS['MB']:.1f}" if case['peakRssBytes'] else '-'
+        print(f"{case_key(case):<12}{ok:>8}{_fmt(case['p50Ms']):>10}{_fmt(case['p95Ms']):>10}"
+              f"{_fmt(case['p99Ms']):>10}{_fmt(case['rps']):>9}{rss:>13}"
+              f"{case['upstreamBytes'] / SIZE_UNITS['MB']:>13.1f}", file=out)
+
+
+def _fmt(value):
+    return '-' if value is None else f'{value:g}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1KB,1MB,10MB', help='comma-separated, e.g. 1KB,1MB,50MB')
+    parser.add_argument('--types', default='pdf,png', help=f'comma-separated: {", ".join(CONTENT_TYPES)}')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=20, help='requests per case')
+    parser.add_argument('--server', choices=['werkzeug', 'gunicorn', 'asgi'], default='werkzeug')
+    parser.add_argument('--latency', type=float, default=0.2, help='fake upstream latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--response-kb', type=int, default=2)
+    parser.add_argument('--not-found-first', action='store_true', help='exercise the 404 fallback path')
+    parser.add_argument('--save', metavar='PATH', help='write results as a baseline JSON file')
+    parser.add_argument('--compare', metavar='PATH', help='compare against a saved baseline')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='allowed regression (fraction)')
+    args = parser.parse_args()
+
+    from bench.fake_salesforce import FakeSalesforce
+    fake = FakeSalesforce(args.latency, args.jitter, args.response_kb, args.not_found_first)
+    fake_server = fake.start()
+
+    secret_key = secrets.token_hex(32)
+    cookie = URLSafeTimedSerializer(secret_key, salt='org_session').dumps(
+        {'instance_url': fake.base_url, 'access_token': 'fake-token'})
+    port = free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, SECRET_KEY=secret_key, RESULT_CACHE_ENABLED='false',
+                   SESSION_RATE_PER_MINUTE='0', ORG_RATE_PER_MINUTE='0', ADMISSION_MAX_IN_FLIGHT='0',
+                   TOKEN_FILE=os.path.join(tmp, 'token.secret'), PYTHONUNBUFFERED='1')
+        proc = subprocess.Popen(server_command(args.server, port), cwd=ROOT, env=env,
+                                stdout=subprocess.DEVNULL)
+        try:
+            app_url = f'http://127.0.0.1:{port}'
+            wait_for(f'{app_url}/api/status', proc)
+            cases = []
+            for kind in args.types.split(','):
+                for size in args.sizes.split(','):
+                    case = run_case(app_url, fake.base_url, cookie, proc.pid, kind.strip(),
+                                    parse_size(size), args.concurrency, args.requests)
+                    cases.append(case)
+                    print(f'{case_key(case)} done', file=sys.stderr)
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+            fake_server.shutdown()
+
+    results = {
+        'server': args.server,
+        'latency': args.latency,
+        'responseKb': args.response_kb,
+        'notFoundFirst': args.not_found_first,
+        'cases': cases,
+    }
+    print_report(results)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            sys.exit(1)
+        print(f'No regressions beyond {args.tolerance:.0%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,24 @@
+"""Serve the real WSGI app (app:app) on a threaded werkzeug server for the benchmark harness.
+
+    python -m bench.serve_app --port 5055
+"""
+import argparse
+import logging
+
+from werkzeug.serving import make_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5055)
+    args = parser.parse_args()
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    from app import app
+    server = make_server(args.host, args.port, app, threaded=True)
+    print(f'App listening on http://{args.host}:{args.port}', flush=True)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+"""Extract every document under a directory with Document AI and write the results as JSONL.
+
+    python bulk_extract.py scans/ --schema invoice-schema.json --out results.jsonl --workers 8
+
+Uses the env-configured org (the token saved by the web app for the .env org: TOKEN_FILE, or the
+shared state store with STATE_BACKEND=sqlite) and the same extraction code as /extract-data, so
+endpoint discovery, the circuit breaker, chunking and the result cache all apply.
+
+Each finished document gets one line in the output file and one in the manifest (default
+<out>.manifest). A rerun skips files the manifest records as extracted, unless they changed
+since; failed files are tried again. Progress (documents/min, MB/s of source documents) is
+printed to stderr every --progress seconds.
+"""
+import argparse
+import mimetypes
+import os
+import sys
+import threading
+import time
+
+from api_client import APIClient
+from batch import BatchDocument, iter_batch
+from config import BATCH_CONCURRENCY, CHUNK_PAGES, DEFAULT_ML_MODEL, IMAGE_PREPROCESS, ORG_MAX_CONCURRENCY
+from extraction import (
+    allowed_file, build_extraction, call_document_ai, extraction_options, parse_page_range, prepare_schema_config,
+)
+from json_utils import dumps as dumps_json, loads as loads_json
+from preflight import PreflightError
+from schemas import schema_registry
+from state_store import namespace, state_backend
+
+RETRY_STATUSES = (429, 503)  # admission / circuit breaker / org busy: wait retryAfter and try again
+
+
+def walk_documents(root):
+    """(relative path, absolute path, stat) for every supported document under root, in sorted order."""
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if allowed_file(name):
+                path = os.path.join(directory, name)
+                yield os.path.relpath(path, root).replace(os.sep, '/'), path, os.stat(path)
+
+
+def load_manifest(path):
+    """{relative path: (size, mtime_ns)} of documents already extracted successfully."""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                entry = loads_json(line)
+            except ValueError:
+                continue  # a line cut short by an interrupted run
+            if entry.get('ok'):
+                done[entry['file']] = (entry['size'], entry['mtime'])
+            else:
+                done.pop(entry['file'], None)
+    return done
+
+
+class Progress:
+    """Running totals, printed as documents/min and MB/s at most every `interval` seconds."""
+
+    def __init__(self, total, interval, out=sys.stderr):
+        self.total = total
+        self.interval = interval
+        self.out = out
+        self.done = self.failed = self.bytes = 0
+        self.started = self._printed = time.monotonic()
+
+    def add(self, size, ok):
+        self.done += 1
+        self.bytes += size
+        self.failed += not ok
+        if self.interval and time.monotonic() - self._printed >= self.interval:
+            self.report()
+
+    def report(self, final=False):
+        self._printed = time.monotonic()
+        elapsed = max(self._printed - self.started, 1e-9)
+        rate = self.done / elapsed
+        line = (f'[{self.done}/{self.total}] {rate * 60:.1f} docs/min, {self.bytes / elapsed / 1e6:.2f} MB/s, '
+                f'{self.failed} failed, {elapsed:.0f}s elapsed')
+        if not final and rate and self.done < self.total:
+            line += f', ~{(self.total - self.done) / rate:.0f}s left'
+        print(line, file=self.out, flush=True)
+
+
+def extract_document(options, doc, retries):
+    """Result line for one document; waits and retries while the org or circuit is busy (429/503 with retryAfter)."""
+    try:
+        with doc.open() as source:
+            extraction = build_extraction(options, source, doc.content_type)
+    except PreflightError as e:
+        return dict(e.to_dict(), status=e.status)
+    try:
+        for attempt in range(retries + 1):
+            result, status = call_document_ai(extraction)
+            if status not in RETRY_STATUSES or 'retryAfter' not in result or attempt == retries:
+                break
+            time.sleep(result['retryAfter'])
+    finally:
+        extraction['body'].close()
+    return dict(result, status=status)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory', help='folder of PDFs and images (searched recursively)')
+    schema = parser.add_mutually_exclusive_group(required=True)
+    schema.add_argument('--schema', metavar='PATH', help='JSON schema file')
+    schema.add_argument('--schema-id', help='id of a schema registered with POST /api/schemas (shared state only)')
+    parser.add_argument('--prompt', default='', help='schema-level instructions (root description)')
+    parser.add_argument('--model', default=DEFAULT_ML_MODEL)
+    parser.add_argument('--pages', default='', help='page range for PDFs, e.g. 1-3')
+    parser.add_argument('--confidence', action='store_true', help='include confidence scores')
+    parser.add_argument('--chunk-pages', type=int, default=CHUNK_PAGES, help='split long PDFs (0 = off)')
+    parser.add_argument('--image-preprocess', action=argparse.BooleanOptionalAction, default=IMAGE_PREPROCESS)
+    parser.add_argument('--no-cache', action='store_true', help='bypass the result cache')
+    parser.add_argument('--out', default='results.jsonl', help='JSONL output (appended to)')
+    parser.add_argument('--manifest', help='resume manifest (default: <out>.manifest)')
+    parser.add_argument('--workers', type=int, default=BATCH_CONCURRENCY, help='concurrent extractions')
+    parser.add_argument('--retries', type=int, default=3, help='retries per document while the org is busy')
+    parser.add_argument('--progress', type=float, default=10, help='seconds between progress lines (0 = off)')
+    args = parser.parse_args(argv)
+
+    try:
+        start_page, end_page = parse_page_range(args.pages)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.schema_id:
+        schema_config = schema_registry.schema_config(args.schema_id, args.prompt)
+        if schema_config is None:
+            parser.error(f'Unknown or expired schema id {args.schema_id}')
+    else:
+        with open(args.schema) as f:
+            try:
+                schema_config = prepare_schema_config(f.read(), args.prompt)
+            except ValueError as e:
+                parser.error(f'Invalid JSON schema in {args.schema}: {e}')
+
+    api_client = APIClient(store=namespace('tokens') if state_backend.shared else None)
+    if not api_client.is_authenticated():
+        print('Not authenticated: sign in to the env-configured org in the web app first '
+              '(or save a token with POST /api/save-token).', file=sys.stderr)
+        return 2
+    options = extraction_options(api_client.get_instance_url(), api_client.get_access_token(), schema_config,
+                                 args.model, args.confidence, start_page, end_page, args.chunk_pages,
+                                 cache_bypass=args.no_cache, image_preprocess=args.image_preprocess)
+
+    manifest_path = args.manifest or args.out + '.manifest'
+    done = load_manifest(manifest_path)
+    pending, skipped = [], 0
+    for rel, path, st in walk_documents(args.directory):
+        if done.get(rel) == (st.st_size, st.st_mtime_ns):
+            skipped += 1
+        else:
+            pending.append((rel, path, st))
+    workers = max(1, args.workers)
+    if ORG_MAX_CONCURRENCY and workers > ORG_MAX_CONCURRENCY:
+        print(f'--workers {workers} is above ORG_MAX_CONCURRENCY; using {ORG_MAX_CONCURRENCY}', file=sys.stderr)
+        workers = ORG_MAX_CONCURRENCY
+    print(f'{len(pending)} documents to extract ({skipped} already done), {workers} workers', file=sys.stderr)
+
+    stats = {}  # document index -> (relative path, stat)
+    auth_failed = threading.Event()
+
+    def documents():
+        for index, (rel, path, st) in enumerate(pending):
+            if auth_failed.is_set():
+                return  # every remaining call would fail the same way
+            stats[index] = (rel, st)
+            yield BatchDocument(index, rel, mimetypes.guess_type(path)[0],
+                                lambda path=path: open(path, 'rb'))
+
+    def run_document(doc):
+        line = extract_document(options, doc, args.retries)
+        if line['status'] in (401, 403) and 'url_used' in line:
+            auth_failed.set()
+        return line
+
+    progress = Progress(len(pending), args.progress)
+    try:
+        with open(args.out, 'ab') as out, open(manifest_path, 'ab') as manifest:
+            for line in iter_batch(documents(), run_document, workers):
+                rel, st = stats.pop(line['index'])
+                line['bytes'] = st.st_size
+                ok = line['status'] in (200, 201) and 'error' not in line
+                out.write(dumps_json(line) + b'\n')
+                out.flush()  # the result is on disk before the manifest says the file is done
+                manifest.write(dumps_json({'file': rel, 'size': st.st_size, 'mtime': st.st_mtime_ns,
+                                           'status': line['status'], 'ok': ok}) + b'\n')
+                manifest.flush()
+                progress.add(st.st_size, ok)
+    except KeyboardInterrupt:
+        progress.report(final=True)
+        print('Interrupted; run the same command again to resume.', file=sys.stderr)
+        return 130
+    progress.report(final=True)
+    if auth_failed.is_set():
+        print('Stopped: Salesforce rejected the access token. Sign in again, then rerun to resume.', file=sys.stderr)
+    return 1 if progress.failed or auth_failed.is_set() else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""Split long PDFs into page windows, extract the windows concurrently, and merge the results."""
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def page_windows(first_page, last_page, window):
+    """[(start, end), ...] covering first_page..last_page in windows of `window` pages."""
+    return [(start, min(start + window - 1, last_page)) for start in range(first_page, last_page + 1, window)]
+
+
+def run_windows(windows, run_window, concurrency):
+    """Call run_window(start, end) -> (data, error_result) for every window, at most `concurrency` at once.
+
+    Returns one report per window, in page order: {startPage, endPage, elapsedMs, data | error, status}.
+    """
+    def timed(window):
+        started = time.monotonic()
+        try:
+            data, error = run_window(*window)
+        except Exception as e:
+            data, error = None, ({'error': str(e)}, 500)
+        report = {'startPage': window[0], 'endPage': window[1],
+                  'elapsedMs': round((time.monotonic() - started) * 1000)}
+        if error is not None:
+            report['error'], report['status'] = error
+        else:
+            report['data'], report['status'] = data, 200
+        return report
+
+    # Each window runs in a copy of the caller's context, so its timings count toward the request
+    contexts = [contextvars.copy_context() for _ in windows]
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(windows))),
+                            thread_name_prefix='extract-chunk') as executor:
+        return list(executor.map(lambda context, window: context.run(timed, window), contexts, windows))
+
+
+def _schema_type(schema):
+    stype = schema.get('type') if isinstance(schema, dict) else None
+    if isinstance(stype, list):
+        stype = next((t for t in stype if t != 'null'), None)
+    return stype
+
+
+def _has_value(value):
+    if value is None or value == '' or value == [] or value == {}:
+        return False
+    # Confidence-score shape: {"value": ..., "confidenceScore": ...}
+    if isinstance(value, dict) and 'value' in value and len(value) <= 3:
+        return _has_value(value['value'])
+    return True
+
+
+def merge_results(schema, values):
+    """Merge per-chunk extractions into one, guided by the JSON schema.
+
+    Arrays are concatenated in page order, objects are merged property by property, and
+    scalars take the first chunk that found a value.
+    """
+    present = [v for v in values if v is not None]
+    if not present:
+        return None
+    stype = _schema_type(schema)
+    if stype == 'array' or (stype is None and all(isinstance(v, list) for v in present)):
+        merged = []
+        for v in present:
+            merged.extend(v if isinstance(v, list) else [v])
+        return merged
+    is_scalar_wrapper = any(isinstance(v, dict) and 'value' in v and len(v) <= 3 for v in present)
+    if (stype == 'object' or stype is None) and not is_scalar_wrapper and all(isinstance(v, dict) for v in present):
+        properties = schema.get('properties', {}) if isinstance(schema, dict) else {}
+        keys = list(dict.fromkeys(k for v in present for k in v))
+        return {k: merge_results(properties.get(k), [v.get(k) for v in present]) for k in keys}
+    return next((v for v in present if _has_value(v)), present[0])
@@ -0,0 +1,191 @@
+"""Per-org circuit breaker and bulkhead around Document AI extract-data calls.
+
+When an org's Document AI is failing or very slow, its breaker opens and further calls fail
+fast (503 with Retry-After) instead of each waiting out the upstream timeout. After
+CIRCUIT_OPEN_SECONDS one probe call is let through (half-open): success closes the circuit,
+failure opens it again. The bulkhead caps concurrent calls per org so one slow org cannot
+occupy every worker thread.
+"""
+import math
+import threading
+import time
+from collections import deque
+
+from config import (
+    CIRCUIT_FAILURE_RATIO, CIRCUIT_MIN_CALLS, CIRCUIT_OPEN_SECONDS, CIRCUIT_SLOW_SECONDS, CIRCUIT_WINDOW,
+    ORG_MAX_CONCURRENCY, ORG_QUEUE_TIMEOUT,
+)
+from metrics import record_circuit_rejection
+from ttl_cache import TTLCache
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """A call refused without contacting Salesforce; `code` is 'circuit_open' or 'org_busy'."""
+
+    def __init__(self, message, code, retry_after):
+        super().__init__(message)
+        self.code = code
+        self.retry_after = max(1, math.ceil(retry_after))
+
+    def to_dict(self):
+        return {'error': str(self), 'code': self.code, 'retryAfter': self.retry_after}
+
+
+def is_failure_status(status):
+    """Upstream statuses that count against the org's circuit (client errors and 404 fallbacks don't)."""
+    return status is None or status >= 500 or status in (408, 429)
+
+
+class CircuitBreaker:
+    def __init__(self, window=CIRCUIT_WINDOW, min_calls=CIRCUIT_MIN_CALLS, failure_ratio=CIRCUIT_FAILURE_RATIO,
+                 slow_seconds=CIRCUIT_SLOW_SECONDS, open_seconds=CIRCUIT_OPEN_SECONDS,
+                 max_concurrency=ORG_MAX_CONCURRENCY, queue_timeout=ORG_QUEUE_TIMEOUT):
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.slow_seconds = slow_seconds
+        self.open_seconds = open_seconds
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self._outcomes = deque(maxlen=window)  # True = failed (error, 5xx/429 or slower than slow_seconds)
+        self._state = CLOSED
+        self._opened_until = 0.0
+        self._probing = False
+        self._in_flight = 0
+        self._slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        self._lock = threading.Lock()
+
+    def _current_state(self, now):
+        if self._state == OPEN and now >= self._opened_until:
+            self._state = HALF_OPEN
+        return self._state
+
+    def acquire(self):
+        """Claim a call slot. Raises CircuitOpenError when the circuit is open or the org is at capacity.
+
+        Returns True when this call is the half-open recovery probe. Every successful acquire() must
+        be followed by release() with that value.
+        """
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            if state == OPEN:
+                record_circuit_rejection('open')
+                raise CircuitOpenError('Document AI is failing for this org; not sending requests for now',
+                                       'circuit_open', self._opened_until - now)
+            if state == HALF_OPEN:
+                if self._probing:
+                    record_circuit_rejection('open')
+                    raise CircuitOpenError('Document AI is failing for this org; a recovery check is in progress',
+                                           'circuit_open', 1)
+                self._probing = True
+        if self._slots is not None and not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                if state == HALF_OPEN:
+                    self._probing = False
+            record_circuit_rejection('busy')
+            raise CircuitOpenError(f'Too many Document AI calls in progress for this org (limit {self.max_concurrency})',
+                                   'org_busy', self.queue_timeout or 1)
+        with self._lock:
+            self._in_flight += 1
+        return state == HALF_OPEN
+
+    def release(self, probe, failed, elapsed):
+        """Record a finished call (failed: error or failure status) and free its slot."""
+        failed = failed or (bool(self.slow_seconds) and elapsed > self.slow_seconds)
+        with self._lock:
+            self._in_flight -= 1
+            now = time.monotonic()
+            if probe:
+                self._probing = False
+                if failed:
+                    self._open(now)
+                else:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+            elif self._current_state(now) == CLOSED:  # calls that started before the circuit opened are ignored
+                self._outcomes.append(failed)
+                failures = sum(self._outcomes)
+                if len(self._outcomes) >= self.min_calls and failures >= self.failure_ratio * len(self._outcomes):
+                    self._open(now)
+        if self._slots is not None:
+            self._slots.release()
+
+    def cancel(self, probe):
+        """Free a slot acquired for a call that was never made (its caller went away); no outcome is recorded."""
+        with self._lock:
+            self._in_flight -= 1
+            if probe:
+                self._probing = False  # still half-open: the next call becomes the probe
+        if self._slots is not None:
+            self._slots.release()
+
+    def _open(self, now):
+        self._state = OPEN
+        self._opened_until = now + self.open_seconds
+        self._outcomes.clear()
+
+    def guard(self):
+        """Context manager around one upstream call; set `.status` on the yielded object to the HTTP status."""
+        return _Guard(self)
+
+    def to_dict(self):
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            info = {
+                'state': state,
+                'recentCalls': len(self._outcomes),
+                'recentFailures': sum(self._outcomes),
+                'inFlight': self._in_flight,
+                'maxConcurrency': self.max_concurrency or None,
+            }
+            if state == OPEN:
+                info['retryAfter'] = max(1, math.ceil(self._opened_until - now))
+        return info
+
+
+class _Guard:
+    def __init__(self, breaker):
+        self.breaker = breaker
+        self.status = None
+
+    def __enter__(self):
+        self.probe = self.breaker.acquire()
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        failed = exc_type is not None or is_failure_status(self.status)
+        self.breaker.release(self.probe, failed, time.monotonic() - self.started)
+        return False
+
+
+class CircuitBreakers:
+    """instance_url -> CircuitBreaker, created on first use; orgs idle for a day are forgotten."""
+
+    def __init__(self, ttl=24 * 60 * 60, maxsize=1024):
+        self._breakers = TTLCache(ttl, maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def get(self, instance_url):
+        key = (instance_url or '').rstrip('/')
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                breaker = CircuitBreaker()
+            self._breakers.set(key, breaker)  # renews the idle expiry
+            return breaker
+
+    def status(self, instance_url):
+        """Breaker state for one org (closed with no history when it has made no calls yet)."""
+        key = (instance_url or '').rstrip('/')
+        with self._lock:
+            breaker = self._breakers.get(key)
+        return (breaker or CircuitBreaker()).to_dict()
+
+
+circuit_breakers = CircuitBreakers()
@@ -0,0 +1,120 @@
+"""Single-flight coalescing: identical concurrent extractions share one upstream call.
+
+The first caller for a key (the leader) runs the call; callers arriving while it is in flight
+(followers) wait for its outcome instead of sending the same document again. Every waiter gets
+the leader's return value, or the exception it raised.
+
+Followers wait at most `wait_timeout` seconds, then stop waiting and make their own call. A
+follower that is cancelled (a disconnected ASGI client, a cancelled job) just stops waiting; the
+shared call carries on for the others. If the leader itself is cancelled (anything that is not an
+Exception, e.g. asyncio.CancelledError) the flight is abandoned and one of its followers becomes
+the new leader. Flights are per process: gunicorn workers do not coalesce with each other.
+"""
+import asyncio
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from config import COALESCE_ENABLED, COALESCE_WAIT_TIMEOUT
+from metrics import record_coalesced
+
+
+class _Abandoned(Exception):
+    """Set on a flight whose leader was cancelled before finishing."""
+
+
+class SingleFlight:
+    def __init__(self, wait_timeout=COALESCE_WAIT_TIMEOUT, enabled=COALESCE_ENABLED):
+        self.enabled = enabled
+        self.wait_timeout = wait_timeout
+        self._flights = {}  # key -> Future of the call in flight
+        self._lock = threading.Lock()
+        self._counters = {'leaders': 0, 'shared': 0, 'timeouts': 0, 'abandoned': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+        if name != 'leaders':
+            record_coalesced(name)
+
+    def _join(self, key):
+        """(future, True) when the caller leads a new flight for key, else (the flight's future, False)."""
+        with self._lock:
+            future = self._flights.get(key)
+            if future is not None:
+                return future, False
+            future = self._flights[key] = Future()
+            self._counters['leaders'] += 1
+            return future, True
+
+    def _finish(self, key, future, value=None, error=None):
+        with self._lock:
+            if self._flights.get(key) is future:
+                del self._flights[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(value)
+
+    def run(self, key, fn):
+        """fn() once for all concurrent callers with the same key. Returns (value, shared)."""
+        if not self.enabled:
+            return fn(), False
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                try:
+                    value = fn()
+                except Exception as e:
+                    self._finish(key, future, error=e)
+                    raise
+                except BaseException:
+                    self._finish(key, future, error=_Abandoned())
+                    raise
+                self._finish(key, future, value)
+                return value, False
+            try:
+                value = future.result(timeout=self.wait_timeout)
+            except FutureTimeout:
+                self._count('timeouts')
+                return fn(), False
+            except _Abandoned:
+                self._count('abandoned')
+                continue
+            self._count('shared')
+            return value, True
+
+    async def run_async(self, key, fn):
+        """Async run(): fn is a coroutine function. Followers wait without holding a thread."""
+        if not self.enabled:
+            return await fn(), False
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                try:
+                    value = await fn()
+                except Exception as e:
+                    self._finish(key, future, error=e)
+                    raise
+                except BaseException:
+                    self._finish(key, future, error=_Abandoned())
+                    raise
+                self._finish(key, future, value)
+                return value, False
+            try:
+                # shield: a cancelled follower must not cancel the flight the others are waiting on
+                value = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.wait_timeout)
+            except asyncio.TimeoutError:
+                self._count('timeouts')
+                return await fn(), False
+            except _Abandoned:
+                self._count('abandoned')
+                continue
+            self._count('shared')
+            return value, True
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, inFlight=len(self._flights), enabled=self.enabled)
+
+
+extraction_flights = SingleFlight()
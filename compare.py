@@ -0,0 +1,98 @@
+"""Model comparison: one document extracted by several ml_models at once, with field-level differences.
+
+Every model is called concurrently, so a comparison takes about as long as its slowest model.
+iter_compare yields one line per model as it finishes, then a summary with per-model latency
+and result size and the fields on which the successful models disagree.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from json_utils import dumps as dumps_json
+
+MAX_DIFFERENCES = 200  # differing fields listed in the summary
+
+
+def iter_compare(models, run_model):
+    """Run run_model(model) -> (result_dict, status) for every model at once.
+
+    Yields {'model', 'status', 'elapsedMs', 'resultBytes', ...result} per model in completion order,
+    then {'summary': ...}. Exceptions become per-model error lines.
+    """
+    started = time.monotonic()
+    lines = {}
+    with ThreadPoolExecutor(max_workers=max(1, len(models)), thread_name_prefix='extract-compare') as executor:
+        futures = [executor.submit(_timed, run_model, model) for model in models]
+        for future in as_completed(futures):
+            line = future.result()
+            lines[line['model']] = line
+            yield line
+    yield {'summary': summarize(models, lines, time.monotonic() - started)}
+
+
+def _timed(run_model, model):
+    started = time.monotonic()
+    try:
+        result, status = run_model(model)
+    except Exception as e:
+        result, status = {'error': str(e)}, 500
+    line = dict({'model': model}, **result)
+    line['status'] = status
+    line['elapsedMs'] = round((time.monotonic() - started) * 1000)
+    if 'data' in result:
+        line['resultBytes'] = len(dumps_json(result['data']))
+    return line
+
+
+def summarize(models, lines, elapsed):
+    succeeded = {model: lines[model]['data'] for model in models
+                 if model in lines and lines[model]['status'] in (200, 201) and 'data' in lines[model]}
+    summary = {
+        'models': models,
+        'succeeded': len(succeeded),
+        'failed': len(models) - len(succeeded),
+        'elapsedMs': round(elapsed * 1000),
+        'latencyMs': {model: lines[model]['elapsedMs'] for model in models if model in lines},
+        'resultBytes': {model: lines[model].get('resultBytes') for model in models if model in lines},
+    }
+    if len(succeeded) >= 2:
+        summary.update(field_differences(succeeded))
+    return summary
+
+
+def flatten(value, prefix=''):
+    """{path: leaf value} for a JSON value; paths look like invoice.line_items[0].amount."""
+    if isinstance(value, dict) and value:
+        fields = {}
+        for key, item in value.items():
+            fields.update(flatten(item, f'{prefix}.{key}' if prefix else key))
+        return fields
+    if isinstance(value, list) and value:
+        fields = {}
+        for index, item in enumerate(value):
+            fields.update(flatten(item, f'{prefix}[{index}]'))
+        return fields
+    return {prefix: value}
+
+
+def field_differences(results):
+    """Compare {model: extracted data}: counts of agreeing/differing fields and the differing ones.
+
+    A field differs when the models' values are not all equal or some model lacks it.
+    """
+    flat = {model: flatten(data) for model, data in results.items()}
+    paths = list(dict.fromkeys(path for fields in flat.values() for path in fields))
+    differences = []
+    for path in paths:
+        values = {model: fields[path] for model, fields in flat.items() if path in fields}
+        missing = [model for model in flat if path not in flat[model]]
+        distinct = list(values.values())
+        if missing or any(value != distinct[0] for value in distinct[1:]):
+            difference = {'field': path, 'values': values}
+            if missing:
+                difference['missing'] = missing
+            differences.append(difference)
+    return {
+        'fields': {'total': len(paths), 'agree': len(paths) - len(differences), 'differ': len(differences)},
+        'differences': differences[:MAX_DIFFERENCES],
+        'differencesTruncated': len(differences) > MAX_DIFFERENCES,
+    }
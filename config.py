@@ -10,5 +10,95 @@ API_VERSION = os.environ.get("API_VERSION", "v65.0")
 TOKEN_FILE = os.environ.get("TOKEN_FILE", "access-token.secret")
 # Optional: override Document AI extract path if default returns 404 (e.g. "ssot/document-processing/extract-data")
 DOCUMENT_AI_EXTRACT_PATH = os.environ.get("DOCUMENT_AI_EXTRACT_PATH", "ssot/document-processing/actions/extract-data")
+# Seconds to remember which API version/path works for an org (skips the 404 fallback probing)
+ENDPOINT_CACHE_TTL = int(os.environ.get("ENDPOINT_CACHE_TTL", "3600"))
+# Optional: probe the extract-data endpoint with an empty request right after /auth/exchange
+ENDPOINT_PREFLIGHT = os.environ.get("ENDPOINT_PREFLIGHT", "false").lower() == "true"
+# Shared HTTP connection pool for Salesforce calls
+HTTP_POOL_CONNECTIONS = int(os.environ.get("HTTP_POOL_CONNECTIONS", "10"))  # hosts (orgs) kept warm
+HTTP_POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", "10"))  # keep-alive connections per host
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", "2"))  # retries on failures to connect only
+# Background extraction jobs (POST /extract-data/jobs)
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))  # concurrent Document AI calls
+JOB_MAX_PENDING = int(os.environ.get("JOB_MAX_PENDING", "32"))  # queued + running before new jobs get 503
+JOB_TTL = int(os.environ.get("JOB_TTL", "900"))  # seconds a finished job's result stays available
+JOB_LONG_POLL_MAX = float(os.environ.get("JOB_LONG_POLL_MAX", "20"))  # cap for GET ...?wait=N
+# Batch extraction (POST /extract-data/batch)
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "4"))  # max concurrent Document AI calls per batch
+BATCH_MAX_FILES = int(os.environ.get("BATCH_MAX_FILES", "100"))
+BATCH_MAX_ZIP_BYTES = int(os.environ.get("BATCH_MAX_ZIP_BYTES", str(500 * 1024 * 1024)))  # uncompressed
+# Uploads and their base64 request bodies are kept in memory up to this many bytes, then spooled to disk
+UPLOAD_SPOOL_THRESHOLD = int(os.environ.get("UPLOAD_SPOOL_THRESHOLD", str(1024 * 1024)))
+# Extraction result cache (same document + schema + model + pages + confidence flag, per org)
+RESULT_CACHE_ENABLED = os.environ.get("RESULT_CACHE_ENABLED", "true").lower() == "true"
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", "256"))  # in-memory entries
+RESULT_CACHE_TTL = int(os.environ.get("RESULT_CACHE_TTL", str(24 * 60 * 60)))  # seconds
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", "")  # optional on-disk tier; empty disables it
+RESULT_CACHE_DISK_MAX_BYTES = int(os.environ.get("RESULT_CACHE_DISK_MAX_BYTES", str(512 * 1024 * 1024)))
+# Seconds a successful extraction's developer snippet (curl/Apex) can be fetched
+SNIPPET_TTL = int(os.environ.get("SNIPPET_TTL", "900"))
+# Gzip extraction responses at least this large when the client accepts it (0 disables)
+RESPONSE_GZIP_MIN_BYTES = int(os.environ.get("RESPONSE_GZIP_MIN_BYTES", "1024"))
+# Org sessions: verified-cookie decode cache and legacy in-memory session store sizes
+SESSION_DECODE_CACHE_SIZE = int(os.environ.get("SESSION_DECODE_CACHE_SIZE", "512"))
+SESSION_STORE_SIZE = int(os.environ.get("SESSION_STORE_SIZE", "1000"))
+# Long PDFs: split into windows of CHUNK_PAGES pages extracted concurrently (0 = off; per request: chunk_pages).
+# Each window re-sends the whole document, so upstream bytes grow with the number of windows.
+# CHUNK_CONCURRENCY is capped one below ORG_MAX_CONCURRENCY so other extractions keep a slot.
+CHUNK_PAGES = int(os.environ.get("CHUNK_PAGES", "0"))
+CHUNK_CONCURRENCY = int(os.environ.get("CHUNK_CONCURRENCY", "4"))
+# Schema registry (POST /api/schemas): registered schemas and prepared schemaConfig strings
+SCHEMA_REGISTRY_SIZE = int(os.environ.get("SCHEMA_REGISTRY_SIZE", "500"))
+SCHEMA_CONFIG_CACHE_SIZE = int(os.environ.get("SCHEMA_CONFIG_CACHE_SIZE", "1000"))
+SCHEMA_TTL = int(os.environ.get("SCHEMA_TTL", "86400"))  # seconds since last registration
+# Image preprocessing (needs Pillow): downscale and re-encode bulky images before upload (per request: image_preprocess)
+IMAGE_PREPROCESS = os.environ.get("IMAGE_PREPROCESS", "false").lower() == "true"
+IMAGE_MAX_DIMENSION = int(os.environ.get("IMAGE_MAX_DIMENSION", "3000"))  # longest side in pixels (0 = no cap)
+IMAGE_MAX_DPI = int(os.environ.get("IMAGE_MAX_DPI", "300"))  # when the image records its DPI (0 = no cap)
+IMAGE_JPEG_QUALITY = int(os.environ.get("IMAGE_JPEG_QUALITY", "90"))
+IMAGE_PREPROCESS_WORKERS = int(os.environ.get("IMAGE_PREPROCESS_WORKERS", "2"))
+# Upload limits: per document (after zip extraction) and per request body (0 disables either)
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+MAX_REQUEST_BYTES = int(os.environ.get("MAX_REQUEST_BYTES", str(200 * 1024 * 1024)))
+# Per-org circuit breaker around extract-data: opens when at least CIRCUIT_FAILURE_RATIO of the last
+# CIRCUIT_WINDOW calls (and at least CIRCUIT_MIN_CALLS) failed with an error, 5xx/429 or took longer
+# than CIRCUIT_SLOW_SECONDS; calls then fail fast with 503 for CIRCUIT_OPEN_SECONDS before one probe
+CIRCUIT_WINDOW = int(os.environ.get("CIRCUIT_WINDOW", "20"))
+CIRCUIT_MIN_CALLS = int(os.environ.get("CIRCUIT_MIN_CALLS", "5"))
+CIRCUIT_FAILURE_RATIO = float(os.environ.get("CIRCUIT_FAILURE_RATIO", "0.5"))
+CIRCUIT_SLOW_SECONDS = float(os.environ.get("CIRCUIT_SLOW_SECONDS", "120"))  # 0 = latency never counts
+CIRCUIT_OPEN_SECONDS = float(os.environ.get("CIRCUIT_OPEN_SECONDS", "30"))
+# Bulkhead: concurrent extract-data calls per org (0 = unlimited), and seconds to wait for a free slot
+ORG_MAX_CONCURRENCY = int(os.environ.get("ORG_MAX_CONCURRENCY", "8"))
+ORG_QUEUE_TIMEOUT = float(os.environ.get("ORG_QUEUE_TIMEOUT", "5"))
+# Admission control for extractions: token buckets per browser session and per org (requests per
+# minute, burst size; 0 disables), a global cap on extractions calling Salesforce at once, and a
+# bounded fair queue (round-robin across sessions) for the rest; past it callers get 429
+SESSION_RATE_PER_MINUTE = float(os.environ.get("SESSION_RATE_PER_MINUTE", "30"))
+SESSION_BURST = int(os.environ.get("SESSION_BURST", "10"))
+ORG_RATE_PER_MINUTE = float(os.environ.get("ORG_RATE_PER_MINUTE", "120"))
+ORG_BURST = int(os.environ.get("ORG_BURST", "30"))
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", "8"))  # 0 = unlimited
+ADMISSION_QUEUE_SIZE = int(os.environ.get("ADMISSION_QUEUE_SIZE", "64"))
+ADMISSION_SESSION_QUEUE = int(os.environ.get("ADMISSION_SESSION_QUEUE", "16"))  # places one session may hold
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "60"))  # seconds
+# Where sessions, tokens, discovered endpoints, registered schemas, snippets and cached results live:
+# "memory" (this process only) or "sqlite" (STATE_DB_PATH, shared by every worker process on the host)
+STATE_BACKEND = os.environ.get("STATE_BACKEND", "memory").lower()
+STATE_DB_PATH = os.environ.get("STATE_DB_PATH", "state.sqlite3")
+# Single-flight coalescing: concurrent identical extractions (same org, document, schema, model, pages,
+# confidence flag) share one Document AI call; a waiter gives up after COALESCE_WAIT_TIMEOUT seconds
+# and makes its own call. Requests that bypass the result cache are never coalesced.
+COALESCE_ENABLED = os.environ.get("COALESCE_ENABLED", "true").lower() == "true"
+COALESCE_WAIT_TIMEOUT = float(os.environ.get("COALESCE_WAIT_TIMEOUT", "300"))
+# Opt-in per-request profiling (cProfile + tracemalloc) of /extract-data and /auth/exchange: requests
+# with an X-Profile header or ?profile= equal to PROFILING_KEY (or "1" when no key is set) write
+# artifacts to PROFILING_DIR and get a summary in the X-Profile response header
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "false").lower() == "true"
+PROFILING_KEY = os.environ.get("PROFILING_KEY", "")
+PROFILING_DIR = os.environ.get("PROFILING_DIR", "profiles")
+PROFILING_TRACE_FRAMES = int(os.environ.get("PROFILING_TRACE_FRAMES", "5"))  # stack depth kept per allocation
+# Model comparison (POST /extract-data/compare): most models one request may compare
+COMPARE_MAX_MODELS = int(os.environ.get("COMPARE_MAX_MODELS", "6"))
 
 DEFAULT_ML_MODEL = "llmgateway__VertexAIGemini20Flash001"
\ No newline at end of file
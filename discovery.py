@@ -0,0 +1,85 @@
+"""Per-org discovery of the Document AI extract-data endpoint (API version + path).
+
+Orgs differ in which API version and path serve extract-data. The first working
+combination is cached per instance_url so later uploads go straight to it.
+"""
+import logging
+
+from config import API_VERSION, DOCUMENT_AI_EXTRACT_PATH, ENDPOINT_CACHE_TTL
+from http_client import http_client
+from state_store import namespace
+
+# Known extract-data paths and API versions (different orgs use different combinations)
+EXTRACT_PATHS = [
+    "ssot/document-processing/actions/extract-data",
+    "ssot/document-processing/extract-data",
+]
+FALLBACK_VERSIONS = ["v65.0", "v64.0"]
+
+
+def configured_endpoint():
+    """(version, path) from config: API_VERSION and DOCUMENT_AI_EXTRACT_PATH."""
+    return API_VERSION, DOCUMENT_AI_EXTRACT_PATH.strip().strip('/')
+
+
+def candidate_endpoints(preferred=None):
+    """All (version, path) pairs to try, in order: preferred (cached), configured, then alternates."""
+    candidates = []
+    if preferred:
+        candidates.append(tuple(preferred))
+    configured = configured_endpoint()
+    if configured not in candidates:
+        candidates.append(configured)
+    for version in dict.fromkeys([API_VERSION] + FALLBACK_VERSIONS):  # dedupe, keep order
+        for path in EXTRACT_PATHS:
+            if (version, path) not in candidates:
+                candidates.append((version, path))
+    return candidates
+
+
+def endpoint_url(instance_url, version, path, query_suffix=''):
+    return f"{instance_url.rstrip('/')}/services/data/{version}/{path}{query_suffix}"
+
+
+class EndpointCache:
+    """instance_url -> working (version, path), expiring after `ttl` seconds."""
+
+    def __init__(self, ttl=ENDPOINT_CACHE_TTL, maxsize=1024):
+        self._cache = namespace('endpoints', ttl, maxsize)  # shared across workers with STATE_BACKEND=sqlite
+
+    def get(self, instance_url):
+        if not instance_url:
+            return None
+        return self._cache.get(instance_url.rstrip('/'))
+
+    def set(self, instance_url, version, path):
+        if instance_url:
+            self._cache.set(instance_url.rstrip('/'), (version, path))
+
+    def invalidate(self, instance_url):
+        if instance_url:
+            self._cache.pop(instance_url.rstrip('/'))
+
+
+endpoint_cache = EndpointCache()
+
+
+def probe_endpoint(instance_url, access_token, timeout=15):
+    """Cheap pre-flight: POST an empty body to each candidate until one is not a 404.
+
+    An existing endpoint rejects the empty body (400) without doing any extraction work;
+    a missing one returns 404. Returns the (version, path) found, or None.
+    """
+    headers = {
+        'Content-Type': 'application/json',
+        'Authorization': f'Bearer {access_token}'
+    }
+    for version, path in candidate_endpoints():
+        resp = http_client.post(endpoint_url(instance_url, version, path), headers=headers, json={}, timeout=timeout)
+        if resp.status_code in (401, 403):
+            return None  # token problem, not a path problem; let the real upload report it
+        if resp.status_code != 404:
+            endpoint_cache.set(instance_url, version, path)
+            logging.info("Document AI endpoint discovered by pre-flight probe (%s)", version)
+            return version, path
+    return None
@@ -0,0 +1,463 @@
+"""Document AI extraction without Flask: request building, endpoint fallback and response parsing.
+
+An extraction is a plain dict: the options shared by every document of a request (credentials,
+schemaConfig, model, pages, flags; see extraction_options) plus one encoded document (see
+build_extraction). run_extraction sends it and returns (response_body_dict, status_code). The
+web routes, background jobs, the ASGI mode and the bulk_extract.py CLI all go through here.
+"""
+import hashlib
+import json
+import logging
+import time
+
+from admission import AdmissionRejected, admission
+from chunking import merge_results, page_windows, run_windows
+from circuit_breaker import CircuitOpenError, circuit_breakers
+from coalescing import extraction_flights
+from config import CHUNK_CONCURRENCY, CHUNK_PAGES, DEFAULT_ML_MODEL, IMAGE_PREPROCESS, MAX_UPLOAD_BYTES
+from discovery import candidate_endpoints, configured_endpoint, endpoint_cache, endpoint_url
+from http_client import http_client
+from image_prep import available as image_preprocessing_available, preprocess_image
+from json_utils import loads as loads_json, unescape_entities
+from metrics import record_retry, record_stage, stage
+from payload import ExtractBody, build_extract_body
+from preflight import check_document
+from result_cache import cache_key, result_cache
+from snippets import snippet_store
+
+ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg', 'tiff', 'bmp'}
+INVALID_FILE_TYPE = 'Invalid file type. Allowed types are: PDF and images (PNG, JPG, JPEG, TIFF, BMP)'
+
+
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+def query_suffix(include_confidence, start_page=None, end_page=None):
+    """Query string for extract-data (reused for retry)."""
+    query_params = []
+    if include_confidence:
+        query_params.append('extractDataWithConfidenceScore=true')
+    if start_page is not None:
+        query_params.append(f'startPage={start_page}')
+    if end_page is not None:
+        query_params.append(f'endPage={end_page}')
+    return '?' + '&'.join(query_params) if query_params else ''
+
+
+def parse_page_range(page_range):
+    """(start_page, end_page) from "start-end", or (None, None) when empty. Raises ValueError with a user-facing message."""
+    page_range = (page_range or '').strip()
+    if not page_range:
+        return None, None
+    parts = page_range.split('-')
+    try:
+        if len(parts) != 2:
+            raise ValueError
+        start_page, end_page = int(parts[0]), int(parts[1])
+    except ValueError:
+        raise ValueError('Invalid page range format. Use: startPage-endPage')
+    if start_page < 1 or end_page < 1:
+        raise ValueError('Page numbers must be at least 1')
+    if start_page > end_page:
+        raise ValueError('Start page must be less than or equal to end page')
+    return start_page, end_page
+
+
+def prepare_schema_config(schema_text, config_prompt=''):
+    """schemaConfig string for a JSON schema, with config_prompt as the root "description".
+
+    Document AI uses the root-level description as schema-level instructions.
+    Raises ValueError (json.JSONDecodeError) when schema_text is not valid JSON.
+    """
+    schema_json = json.loads(schema_text)
+    if config_prompt:
+        schema_json['description'] = config_prompt
+        logging.info("Schema-level prompt added (root description)")
+    return json.dumps(schema_json)
+
+
+def extraction_options(instance_url, access_token, schema_config, ml_model=DEFAULT_ML_MODEL, include_confidence=False,
+                       start_page=None, end_page=None, chunk_pages=CHUNK_PAGES, cache_bypass=False,
+                       image_preprocess=IMAGE_PREPROCESS, admission_session=None):
+    """Options shared by every document of a request, for build_extraction.
+
+    admission_session names the caller for admission control; None (the CLI) skips the admission queue.
+    """
+    return {
+        'instance_url': instance_url,
+        'access_token': access_token,
+        'schema_config': schema_config,
+        'query_suffix': query_suffix(include_confidence, start_page, end_page),
+        'start_page': start_page,
+        'end_page': end_page,
+        'chunk_pages': chunk_pages,
+        'ml_model': ml_model,
+        'include_confidence': include_confidence,
+        'page_range': f'{start_page}-{end_page}' if start_page is not None else '',
+        'cache_bypass': cache_bypass,
+        'image_preprocess': image_preprocess,
+        'admission_session': admission_session,
+    }
+
+
+def build_extraction(options, source, content_type):
+    """Combine shared options with one document (a binary stream) into an extraction for run_extraction.
+
+    The document is base64-encoded in chunks into a spooled request body; run_extraction releases it.
+    Raises PreflightError, before any encoding, when the document can't be extracted as requested.
+    """
+    image_report = None
+    with stage('validate'):
+        mime_type, page_count = check_document(source, content_type, options['start_page'], options['end_page'],
+                                               need_page_count=bool(options['chunk_pages']),
+                                               max_bytes=MAX_UPLOAD_BYTES)
+    if options['image_preprocess'] and mime_type.startswith('image/') and image_preprocessing_available():
+        with stage('image'):
+            processed, mime_type, image_report = preprocess_image(source, mime_type)
+    else:
+        processed = source
+    try:
+        with stage('encode'):
+            body = build_extract_body(processed, options['ml_model'], options['schema_config'], mime_type)
+    finally:
+        if processed is not source:
+            processed.close()
+    return dict(options, body=body, mime_type=mime_type, page_count=page_count, image_report=image_report)
+
+
+def with_model(extraction, ml_model):
+    """A built extraction for another model, sharing its encoded document (nothing is encoded again).
+
+    The copies must not be closed: close the original's body once every copy is done.
+    """
+    body = extraction['body']
+    return dict(extraction, ml_model=ml_model,
+                body=ExtractBody(body.document, ml_model, extraction['schema_config'], body.mime_type))
+
+
+def run_extraction(extraction):
+    """Call Document AI for a prepared extraction. Returns (response_body_dict, status_code).
+
+    Needs no request context: used by /extract-data, background extraction jobs and bulk_extract.py.
+    Closes the extraction's request body (and its spool file) when done.
+    """
+    try:
+        return call_document_ai(extraction)
+    finally:
+        extraction['body'].close()
+
+
+def call_document_ai(extraction):
+    """Cached result, else the upstream call, shared with an identical extraction already in flight."""
+    cached = cached_extraction_result(extraction)
+    if cached is not None:
+        return cached, 200
+    if extraction['cache_bypass']:
+        return admitted_call(extraction)  # asked for a fresh answer: never joins a call already under way
+    (result, status, leader_token), shared = extraction_flights.run(
+        flight_key(extraction), lambda: (*admitted_call(extraction), extraction['access_token']))
+    if shared:
+        outcome = shared_result(extraction, result, status, leader_token)
+        if outcome is None:
+            return admitted_call(extraction)
+        return outcome
+    return result, status
+
+
+def admitted_call(extraction):
+    """The upstream call, inside an admission slot when the extraction has an admission_session."""
+    if extraction['admission_session'] is None:
+        return call_document_ai_uncached(extraction)
+    try:
+        with admission.slot(extraction['admission_session']):
+            return call_document_ai_uncached(extraction)
+    except AdmissionRejected as e:
+        return e.to_dict(), 429
+
+
+def flight_key(extraction):
+    """Single-flight key: the result cache key (computed here when the cache is off)."""
+    return extraction.get('cache_key') or result_key(extraction)
+
+
+def shared_result(extraction, result, status, leader_token):
+    """A follower's copy of the leader's (result, status), or None when it only applied to the leader.
+
+    Admission rejections are per session, and auth failures are per token, so a follower with a
+    different token makes its own call instead of inheriting a 401.
+    """
+    if status == 429 and 'url_used' not in result:
+        return None
+    if status in (401, 403) and 'url_used' in result and leader_token != extraction['access_token']:
+        return None
+    extraction['cache_status'] = 'COALESCED'
+    result = dict(result)
+    if 'apiRequestId' in result:
+        result['apiRequestId'] = _remember_endpoint_snippet(extraction)  # snippets are per owner
+    return result, status
+
+
+def call_document_ai_uncached(extraction):
+    windows = chunk_windows(extraction)
+    if windows:
+        return call_document_ai_chunked(extraction, windows)
+
+    # Log page range for debugging
+    logging.info("Processing document (page_range=%s)", extraction['page_range'] or "all")
+
+    # Do not log schema, payload, or URL (may contain user data or org identity)
+    try:
+        response, url = post_extract(extraction['instance_url'], extract_headers(extraction), extraction['body'],
+                                      extraction['query_suffix'])
+    except CircuitOpenError as e:
+        return e.to_dict(), 503
+    return shape_extraction_result(extraction, response, url)
+
+
+def chunk_windows(extraction):
+    """Page windows for a chunked extraction, or None when the document should go in one call."""
+    chunk_pages = extraction['chunk_pages']
+    page_count = extraction.get('page_count')
+    if not chunk_pages or not page_count:
+        return None
+    first_page = extraction['start_page'] or 1
+    last_page = min(extraction['end_page'] or page_count, page_count)
+    if last_page - first_page + 1 <= chunk_pages:
+        return None
+    return page_windows(first_page, last_page, chunk_pages)
+
+
+def chunk_concurrency(instance_url):
+    """Concurrent windows for one chunked document: CHUNK_CONCURRENCY, kept below the org's bulkhead size
+    so a single long PDF cannot hold every slot the org's other extractions need."""
+    org_slots = circuit_breakers.get(instance_url).max_concurrency
+    if not org_slots:
+        return CHUNK_CONCURRENCY
+    return max(1, min(CHUNK_CONCURRENCY, org_slots - 1))
+
+
+def call_document_ai_chunked(extraction, windows):
+    """Extract each page window concurrently and merge.
+
+    Every window POSTs the whole encoded document with its own startPage/endPage (Document AI takes
+    the page range as a parameter; there is no PDF library here to cut page subsets), so upstream
+    bytes grow with the number of windows: chunking trades upload volume for latency on long PDFs.
+    """
+    instance_url = extraction['instance_url']
+    headers = extract_headers(extraction)
+    urls = {}
+
+    def run_window(start_page, end_page):
+        suffix = query_suffix(extraction['include_confidence'], start_page, end_page)
+        try:
+            response, url = post_extract(instance_url, headers, extraction['body'], suffix)
+        except CircuitOpenError as e:
+            return None, (e.to_dict(), 503)
+        urls.setdefault('first', url)
+        return parse_extraction_response(response, url)
+
+    logging.info("Processing document in %d chunks of %d pages (%d bytes sent per chunk)",
+                 len(windows), extraction['chunk_pages'], len(extraction['body']))
+    reports = run_windows(windows, run_window, chunk_concurrency(instance_url))
+    succeeded = [r for r in reports if 'data' in r]
+    failed = [r for r in reports if 'data' not in r]
+    # Auth failures, or nothing extracted at all: report the first error as a single call would
+    auth_failure = next((r for r in failed if r['status'] in (401, 403)), None)
+    if auth_failure or not succeeded:
+        first = auth_failure or failed[0]
+        return first['error'], first['status']
+
+    try:
+        schema = json.loads(extraction['schema_config'])
+    except ValueError:
+        schema = None
+    response_data = {'data': merge_results(schema, [r['data'] for r in succeeded])}
+    metadata = {}
+    if extraction['include_confidence']:
+        metadata['confidenceScoresIncluded'] = True
+    metadata['pageCount'] = extraction['page_count']
+    metadata['chunks'] = []
+    for r in reports:
+        chunk = {k: r[k] for k in ('startPage', 'endPage', 'status', 'elapsedMs')}
+        if 'error' in r:
+            chunk['error'] = r['error'].get('error')
+        metadata['chunks'].append(chunk)
+    metadata['failedChunks'] = len(failed)
+    response_data['metadata'] = metadata
+
+    if not failed and extraction.get('cache_key') is not None:
+        result_cache.set(extraction['cache_key'], response_data)
+    response_data['apiRequestId'] = remember_snippet(extraction, urls.get('first'))
+    return response_data, 200
+
+
+def extract_headers(extraction):
+    return {
+        'Content-Type': 'application/json',
+        'Authorization': f'Bearer {extraction["access_token"]}'
+    }
+
+
+def post_extract(instance_url, headers, body, query_suffix):
+    """POST to extract-data, trying the org's cached endpoint first and falling back on 404.
+
+    Returns (response, url_used). A working endpoint is cached per org so the fallback
+    probing (each attempt re-sends the whole document) only happens once.
+    Raises CircuitOpenError, without calling Salesforce, while the org's circuit is open or it is at
+    its concurrency limit.
+    """
+    cached = endpoint_cache.get(instance_url)
+    response = url = None
+    with circuit_breakers.get(instance_url).guard() as call:
+        for attempt, (version, path) in enumerate(candidate_endpoints(preferred=cached)):
+            url = endpoint_url(instance_url, version, path, query_suffix)
+            if attempt:
+                logging.info("Retrying 404 with alternate path/version")
+            reader = body.open()  # the body is serialized once; each attempt streams it again
+            started = time.perf_counter()
+            try:
+                response = http_client.post(url, headers=headers, data=reader, timeout=160)
+            finally:
+                reader.close()
+            if response.status_code != 404:
+                if response.status_code in (200, 201):
+                    endpoint_cache.set(instance_url, version, path)
+                break
+            record_stage('fallback', time.perf_counter() - started)  # time lost to a 404 endpoint
+            record_retry('not_found')
+            if attempt == 0 and cached:
+                endpoint_cache.invalidate(instance_url)
+        call.status = response.status_code
+    return response, url
+
+
+def cached_extraction_result(extraction):
+    """Serve repeats of the same document + schema + model + pages from the result cache.
+
+    Returns the cached result (ready to send) or None; records cache_key/cache_status on the extraction.
+    """
+    extraction['cache_key'] = None
+    if not result_cache.enabled:
+        return None
+    extraction['cache_key'] = result_key(extraction)
+    if extraction['cache_bypass']:
+        result_cache.record_bypass()
+        extraction['cache_status'] = 'BYPASS'
+        return None
+    cached = result_cache.get(extraction['cache_key'])
+    if cached is None:
+        extraction['cache_status'] = 'MISS'
+        return None
+    extraction['cache_status'] = 'HIT'
+    cached['apiRequestId'] = _remember_endpoint_snippet(extraction)
+    return cached
+
+
+def result_key(extraction):
+    """What determines Document AI's answer: org, document hash, schema, model, pages (and chunking), confidence."""
+    pages = extraction['page_range']
+    if chunk_windows(extraction):
+        pages += f"/chunks:{extraction['chunk_pages']}"  # merged chunk results can differ from a single call
+    return cache_key(extraction['instance_url'], extraction['body'].document.sha256, extraction['schema_config'],
+                     extraction['ml_model'], pages, extraction['include_confidence'])
+
+
+def _remember_endpoint_snippet(extraction):
+    """Snippet id for a result this extraction didn't fetch itself (cached or shared): uses the org's known endpoint."""
+    instance_url = extraction['instance_url']
+    endpoint = endpoint_cache.get(instance_url) or configured_endpoint()
+    return remember_snippet(extraction, endpoint_url(instance_url, *endpoint, extraction['query_suffix']))
+
+
+def shape_extraction_result(extraction, response, url):
+    """Turn the upstream extract-data response into (response_body_dict, status_code).
+
+    `response` only needs .status_code, .content and .text (requests and httpx responses both work).
+    """
+    nested_json, error_result = parse_extraction_response(response, url)
+    if error_result is not None:
+        return error_result
+
+    # Unified response shape: always { data, metadata?, apiRequestId? }
+    response_data = {'data': nested_json}
+    if extraction['include_confidence']:
+        response_data['metadata'] = {'confidenceScoresIncluded': True}
+    if extraction.get('image_report'):
+        response_data.setdefault('metadata', {})['imagePreprocessing'] = extraction['image_report']
+
+    if extraction.get('cache_key') is not None:
+        result_cache.set(extraction['cache_key'], response_data)
+
+    response_data['apiRequestId'] = remember_snippet(extraction, url)
+    return response_data, 200
+
+
+def parse_extraction_response(response, url):
+    """Extracted JSON from an upstream extract-data response: (data, None) or (None, (error_dict, status))."""
+    # Handle 404: Document AI endpoint not found
+    if response.status_code == 404:
+        return None, ({
+            'error': 'Document AI endpoint not found (404)',
+            'details': response.text or 'The document-processing API returned 404.',
+            'hints': [
+                'Document AI may not be enabled in this org, or the API path/version differs.',
+                'Confirm Document AI is enabled: Setup → Data 360 Connect / Document AI.',
+                'On Heroku set: DOCUMENT_AI_EXTRACT_PATH=ssot/document-processing/extract-data or .../actions/extract-data, and API_VERSION=v65.0 or v64.0.',
+                'Check Data 360 Connect API docs or Postman for the current extract-data path for your org.'
+            ]
+        }, 404)
+
+    if response.status_code in [200, 201]:
+        try:
+            # Do not log response body (may contain extracted PII or sensitive data)
+            json_response = loads_json(response.content)
+
+            # Check if response has expected structure
+            if not json_response:
+                return None, ({'error': 'Empty response from server'}, 200)
+
+            if 'data' not in json_response or not json_response['data']:
+                return None, ({'error': 'No data in response'}, 200)
+
+            # Check for error in the response
+            if json_response['data'][0].get('error'):
+                error_msg = json_response['data'][0]['error']
+                if '403' in error_msg:
+                    return None, ({
+                        'error': 'Authentication error with the OpenAI service. Please check your API credentials.',
+                        'details': error_msg
+                    }, 403)
+                return None, ({
+                    'error': 'Service error',
+                    'details': error_msg
+                }, 500)
+
+            nested_json_str = json_response['data'][0].get('data')
+            if not nested_json_str:
+                return None, ({'error': 'No extracted data in response'}, 200)
+
+            with stage('parse'):
+                # Replace HTML entities and parse the JSON string
+                return loads_json(unescape_entities(nested_json_str)), None
+        except (KeyError, IndexError, json.JSONDecodeError) as e:
+            return None, ({
+                'error': f'Error processing response: {str(e)}',
+                'raw_response': response.text
+            }, 500)
+    return None, ({
+        'error': f'API request failed with status {response.status_code}',
+        'details': response.text,
+        'url_used': url
+    }, response.status_code)
+
+
+def org_owner(instance_url, access_token):
+    """Opaque id for a set of org credentials; jobs and snippets are only visible to their owner."""
+    return hashlib.sha256(f"{instance_url}|{access_token or ''}".encode('utf-8')).hexdigest()
+
+
+def remember_snippet(extraction, url):
+    """Store what the developer snippet needs; the client fetches it from /extract-data/snippet/<id>."""
+    with stage('snippet'):
+        return snippet_store.put(extraction, url, org_owner(extraction['instance_url'], extraction['access_token']))
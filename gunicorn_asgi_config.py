@@ -0,0 +1,18 @@
+# Gunicorn config for the ASGI serving mode (asgi:app on uvicorn workers).
+# One async worker keeps many Document AI calls in flight; access logs keep the OAuth code redaction.
+import os
+
+from gunicorn_config import RedactCallbackCodeLogger
+
+logger_class = RedactCallbackCodeLogger
+
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.environ.get("WEB_CONCURRENCY", "1"))
+# Long extractions: let in-flight requests finish on restart, and don't kill quiet workers
+timeout = 300
+graceful_timeout = 180
+keepalive = 5
+bind = "0.0.0.0:{}".format(os.environ.get("PORT", "5000"))
+accesslog = "-"
+errorlog = "-"
+loglevel = "info"
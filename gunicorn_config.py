@@ -24,11 +24,15 @@ class RedactCallbackCodeLogger(Logger):
                 atoms["r"] = " ".join(parts)
             else:
                 atoms["r"] = re.sub(r"code=[^&\s]+", "code=[REDACTED]", raw)
+        # Total time spent waiting on Salesforce for this request (set by the app; metrics.UPSTREAM_MS_ENVIRON_KEY)
+        atoms["upstream_ms"] = environ.get("docai.upstream_ms", "-")
         return atoms
 
 
 # Use custom logger so access logs don't contain OAuth codes
 logger_class = RedactCallbackCodeLogger
+# Default access log format plus upstream (Salesforce) time in milliseconds
+access_log_format = '%(h)s %(l)s %(u)s %(t)s "%(r)s" %(s)s %(b)s "%(f)s" "%(a)s" upstream_ms=%(upstream_ms)s'
 
 # Standard settings
 workers = 1
@@ -0,0 +1,110 @@
+"""Shared HTTP client for Salesforce calls: pooled keep-alive connections per host.
+
+All outbound calls (token exchange, extract-data, endpoint probes) go through one
+requests.Session so back-to-back calls to the same org reuse warm TLS connections.
+"""
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+from urllib3.util.retry import Retry
+
+from config import HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE, HTTP_RETRIES
+from metrics import record_retry, record_upstream
+
+
+class _NoCookiesPolicy(DefaultCookiePolicy):
+    """Never store or send cookies: the session is shared by every user and org."""
+
+    def set_ok(self, cookie, request):
+        return False
+
+    def return_ok(self, cookie, request):
+        return False
+
+
+class _ConnectionResetRetry(Retry):
+    """Retry failures to connect, never anything after the request was sent.
+
+    Once a POST has gone out, a reset or timeout does not mean Salesforce did nothing: the
+    extraction may have run (and been billed), so it is not sent again. Read timeouts are
+    re-raised as-is rather than wrapped in MaxRetryError.
+    """
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        if isinstance(error, ReadTimeoutError):
+            raise error
+        retry = super().increment(method, url, response, error, _pool, _stacktrace)
+        record_retry('connection')
+        return retry
+
+
+class HttpClient:
+    def __init__(self, pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE, retries=HTTP_RETRIES):
+        retry = _ConnectionResetRetry(
+            total=retries,
+            connect=retries,
+            read=0,  # errors after the request was sent: the upstream may already have processed it
+            status=0,
+            other=0,
+            allowed_methods=None,  # POST too: a request that never connected cannot have been processed
+            raise_on_status=False,
+        )
+        self._adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                    max_retries=retry, pool_block=False)
+        self._session = requests.Session()
+        self._session.cookies.set_policy(_NoCookiesPolicy())
+        self._session.mount('https://', self._adapter)
+        self._session.mount('http://', self._adapter)
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._errors = 0
+
+    def request(self, method, url, **kwargs):
+        with self._lock:
+            self._requests += 1
+        started = time.perf_counter()
+        try:
+            response = self._session.request(method, url, **kwargs)
+        except requests.RequestException:
+            with self._lock:
+                self._errors += 1
+            record_upstream(url, 'error', time.perf_counter() - started)
+            raise
+        sent = int(response.request.headers.get('Content-Length') or 0)
+        received = int(response.headers.get('Content-Length') or 0) if kwargs.get('stream') else len(response.content)
+        record_upstream(url, response.status_code, time.perf_counter() - started, sent, received)
+        return response
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def pool_stats(self):
+        """Aggregate connection pool metrics (no host names: they identify orgs)."""
+        hosts = opened = served = idle = 0
+        pools = self._adapter.poolmanager.pools
+        with pools.lock:
+            pool_list = list(pools._container.values())
+        for pool in pool_list:
+            hosts += 1
+            opened += pool.num_connections
+            served += pool.num_requests
+            if pool.pool is not None:
+                idle += sum(1 for conn in list(pool.pool.queue) if conn is not None)  # None = free slot
+        with self._lock:
+            requests_sent, errors = self._requests, self._errors
+        return {
+            'hosts': hosts,
+            'connectionsOpened': opened,
+            'connectionsIdle': idle,
+            'poolRequests': served,
+            'requests': requests_sent,
+            'errors': errors,
+            'poolMaxsize': self._adapter._pool_maxsize,
+        }
+
+
+http_client = HttpClient()
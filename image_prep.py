@@ -0,0 +1,128 @@
+"""Optional image preprocessing before upload: cap resolution, re-encode bulky formats, strip metadata.
+
+Uncompressed scans (BMP, raw TIFF) and oversized photos are downscaled to IMAGE_MAX_DIMENSION /
+IMAGE_MAX_DPI and re-encoded: PNG for bilevel/grayscale/palette scans (lossless, compresses text
+well), JPEG for colour. The result is only used when it is smaller than the upload. Needs Pillow;
+without it images are sent unchanged. Work runs on a small dedicated pool so concurrent uploads
+can't all decode large images at once.
+"""
+import logging
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import (
+    IMAGE_JPEG_QUALITY, IMAGE_MAX_DIMENSION, IMAGE_MAX_DPI, IMAGE_PREPROCESS_WORKERS, UPLOAD_SPOOL_THRESHOLD,
+)
+from metrics import record_image_preprocess
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional dependency
+    Image = None
+
+# Formats that are usually stored uncompressed and always worth re-encoding
+BULKY_FORMATS = {'BMP'}
+LOSSLESS_MODES = {'1', 'L', 'LA', 'P', 'I;16'}
+
+_pool = ThreadPoolExecutor(max_workers=IMAGE_PREPROCESS_WORKERS, thread_name_prefix='image-prep')
+
+
+def available():
+    return Image is not None
+
+
+def preprocess_image(source, mime_type):
+    """Run _preprocess on the image pool. Returns (stream, mime_type, report); see _preprocess."""
+    stream, mime_type, report = _pool.submit(_preprocess, source, mime_type).result()
+    record_image_preprocess(report['originalBytes'], report['bytes'])
+    return stream, mime_type, report
+
+
+def _preprocess(source, mime_type):
+    """(stream, mime_type, report) for an image upload.
+
+    `stream` is either `source` (rewound, unchanged) or a new spooled file the caller must close.
+    `report` describes what was done: sizes and MIME type before and after.
+    """
+    started = time.monotonic()
+    source.seek(0, 2)
+    original_bytes = source.tell()
+    source.seek(0)
+    report = {'applied': False, 'originalBytes': original_bytes, 'bytes': original_bytes,
+              'originalMimeType': mime_type, 'mimeType': mime_type}
+    try:
+        image = Image.open(source)
+        detected_mime = Image.MIME.get(image.format, mime_type)
+        report['mimeType'] = detected_mime  # trust the file's contents over the browser's guess
+        report['originalSize'] = list(image.size)
+        plan = _plan(image)
+        if plan is None:
+            report['reason'] = 'already compact'
+            source.seek(0)
+            return source, detected_mime, _finish(report, started)
+        output, size = _encode(image, *plan)
+    except Exception as e:  # unreadable, multi-frame edge cases, decompression bombs: send as uploaded
+        logging.warning("Image preprocessing skipped: %s", str(e))
+        source.seek(0)
+        report['reason'] = 'unreadable'
+        return source, report['mimeType'], _finish(report, started)
+
+    new_bytes = output.seek(0, 2)
+    if new_bytes >= original_bytes:
+        output.close()
+        source.seek(0)
+        report['reason'] = 'no smaller'
+        return source, report['mimeType'], _finish(report, started)
+    output.seek(0)
+    report.update(applied=True, bytes=new_bytes, mimeType=Image.MIME[plan[0]], size=list(size))
+    logging.info("Image preprocessed: %d -> %d bytes", original_bytes, new_bytes)
+    return output, report['mimeType'], _finish(report, started)
+
+
+def _finish(report, started):
+    report['elapsedMs'] = round((time.monotonic() - started) * 1000)
+    return report
+
+
+def _plan(image):
+    """(output format, target size) when the image should be re-encoded, else None."""
+    if getattr(image, 'n_frames', 1) > 1:
+        return None  # multi-page TIFF: re-encoding would drop pages
+    width, height = image.size
+    scale = 1.0
+    if IMAGE_MAX_DIMENSION and max(width, height) > IMAGE_MAX_DIMENSION:
+        scale = IMAGE_MAX_DIMENSION / max(width, height)
+    dpi = image.info.get('dpi')
+    if IMAGE_MAX_DPI and dpi and dpi[0] and float(dpi[0]) > IMAGE_MAX_DPI:
+        scale = min(scale, IMAGE_MAX_DPI / float(dpi[0]))
+    bulky = image.format in BULKY_FORMATS or (image.format == 'TIFF' and image.info.get('compression') == 'raw')
+    has_metadata = any(key in image.info for key in ('exif', 'icc_profile', 'xmp', 'photoshop'))
+    if scale >= 1.0 and not bulky and not (has_metadata and image.format == 'PNG'):
+        # JPEG metadata alone is not worth a lossy re-encode
+        return None
+    target_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    if image.format == 'JPEG' or (image.mode not in LOSSLESS_MODES and image.format != 'PNG'):
+        return 'JPEG', target_size
+    return 'PNG', target_size
+
+
+def _encode(image, out_format, target_size):
+    """Spooled file holding the re-encoded image, and its final (width, height)."""
+    if image.format == 'JPEG':
+        image.draft(image.mode, target_size)  # decode at reduced scale when possible
+    if image.getexif().get(0x0112, 1) in (5, 6, 7, 8):  # EXIF orientation that swaps width and height
+        target_size = target_size[::-1]
+    image = ImageOps.exif_transpose(image)  # keep the orientation the EXIF tag described
+    if image.size != target_size:
+        image = image.resize(target_size, Image.LANCZOS)
+    if out_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    elif out_format == 'PNG' and image.mode not in LOSSLESS_MODES | {'RGB', 'RGBA'}:
+        image = image.convert('RGBA' if 'A' in image.mode else 'RGB')
+    output = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_THRESHOLD)
+    if out_format == 'JPEG':
+        image.save(output, 'JPEG', quality=IMAGE_JPEG_QUALITY, optimize=True)
+    else:
+        image.save(output, 'PNG', optimize=True)
+    return output, image.size
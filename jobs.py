@@ -0,0 +1,130 @@
+"""Background extraction jobs: a bounded executor plus an expiring job table.
+
+POST /extract-data/jobs hands the prepared extraction to this executor and returns at
+once, so a slow Document AI call no longer pins the (single) web worker.
+"""
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import JOB_MAX_PENDING, JOB_TTL, JOB_WORKERS
+from ttl_cache import TTLCache
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, owner=None):
+        self.id = secrets.token_urlsafe(16)
+        self.owner = owner
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.result_status = None
+        self.future = None
+        self._done = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status in (SUCCEEDED, FAILED, CANCELLED)
+
+    def wait(self, timeout):
+        return self._done.wait(timeout)
+
+    def to_dict(self):
+        data = {
+            'id': self.id,
+            'status': self.status,
+            'createdAt': self.created_at,
+            'startedAt': self.started_at,
+            'finishedAt': self.finished_at,
+        }
+        if self.status in (SUCCEEDED, FAILED):
+            data['result'] = self.result
+            data['resultStatus'] = self.result_status
+        return data
+
+
+class JobManager:
+    """Runs fn(*args) -> (result_dict, status_code) on a bounded pool; finished jobs expire after `ttl`."""
+
+    def __init__(self, max_workers=JOB_WORKERS, max_pending=JOB_MAX_PENDING, ttl=JOB_TTL):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='extract-job')
+        self._jobs = TTLCache(ttl, maxsize=max(1024, max_pending * 10))
+        self._ttl = ttl
+        self._max_pending = max_pending
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, owner=None):
+        with self._lock:
+            if self._pending >= self._max_pending:
+                raise JobQueueFull('Too many extraction jobs in progress. Please retry shortly.')
+            self._pending += 1
+        job = Job(owner=owner)
+        # Unfinished jobs must not expire out from under the poller: keep them until they finish
+        self._jobs.set(job.id, job, ttl=0)
+        job.future = self._executor.submit(self._run, job, fn, args)
+        return job
+
+    def _run(self, job, fn, args):
+        try:
+            with self._lock:  # status changes hold the lock cancel() uses, so a cancel is never overwritten
+                if job.status == CANCELLED:
+                    return
+                job.status = RUNNING
+                job.started_at = time.time()
+            result, status = fn(*args)
+            with self._lock:
+                if job.status == CANCELLED:
+                    return  # cancelled while running: the upstream call finished, drop its result
+                job.result, job.result_status = result, status
+                job.status = SUCCEEDED if 200 <= status < 300 and 'error' not in result else FAILED
+        except Exception as e:
+            with self._lock:
+                if job.status != CANCELLED:
+                    job.result, job.result_status = {'error': str(e)}, 500
+                    job.status = FAILED
+        finally:
+            self._finish(job)
+
+    def _finish(self, job):
+        if job._done.is_set():
+            return
+        if job.finished_at is None:
+            job.finished_at = time.time()
+        with self._lock:
+            self._pending -= 1
+        self._jobs.set(job.id, job, ttl=self._ttl)
+        job._done.set()
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Cancel a queued job outright; a running job is marked cancelled and its result discarded."""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return job
+        with self._lock:
+            if job.finished:
+                return job
+            job.status = CANCELLED
+            job.finished_at = time.time()
+        if job.future is not None and job.future.cancel():
+            self._finish(job)  # never started, so _run will not finish it
+        return job
+
+
+extraction_jobs = JobManager()
@@ -0,0 +1,278 @@
+"""Low-overhead request stage timers and upstream counters, exposed in Prometheus text format.
+
+Each request gets a RequestTimings (stored on the WSGI environ, so the ASGI mode's phases share it)
+that is also the "current" timings for code running on the request's behalf. stage() and
+record_upstream() feed both the process-wide histograms served on /metrics and the current
+request's Server-Timing header.
+"""
+import contextvars
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+ENVIRON_KEY = 'docai.timings'
+# Read by the gunicorn access logger (gunicorn_config.py)
+UPSTREAM_MS_ENVIRON_KEY = 'docai.upstream_ms'
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f'{self.name}{_labels(self.labelnames, key)} {_number(value)}')
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._value = 0
+
+    def set(self, value):
+        self._value = value
+
+    def render(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} gauge',
+                f'{self.name} {_number(self._value)}']
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._values.items())
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, [("le", _number(float(bound)))])} {cumulative}')
+            lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, [("le", "+Inf")])} {series[-1]}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, key)} {_number(series[-2])}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, key)} {series[-1]}')
+        return lines
+
+
+REQUEST_SECONDS = Histogram('docai_request_seconds', 'Time to build each HTTP response, by route and status.',
+                            ['route', 'status'])
+STAGE_SECONDS = Histogram('docai_stage_seconds', 'Time spent in each stage of a request.', ['route', 'stage'])
+UPSTREAM_SECONDS = Histogram('docai_upstream_seconds', 'Duration of Salesforce API calls.', ['operation'])
+UPSTREAM_RESPONSES = Counter('docai_upstream_responses_total', 'Salesforce API responses by status code.',
+                             ['operation', 'status'])
+UPSTREAM_RETRIES = Counter('docai_upstream_retries_total',
+                           'Salesforce API calls repeated after a connection failure or a 404 endpoint fallback.',
+                           ['reason'])
+UPSTREAM_REQUEST_BYTES = Counter('docai_upstream_request_bytes_total', 'Request body bytes sent to Salesforce.',
+                                 ['operation'])
+UPSTREAM_RESPONSE_BYTES = Counter('docai_upstream_response_bytes_total', 'Response body bytes received from Salesforce.',
+                                  ['operation'])
+IMAGE_BYTES = Counter('docai_image_preprocess_bytes_total',
+                      'Image upload bytes before (original) and after (sent) preprocessing.', ['stage'])
+CIRCUIT_REJECTIONS = Counter('docai_circuit_rejections_total',
+                             'Extract-data calls refused without contacting Salesforce: circuit open or org at its '
+                             'concurrency limit.', ['reason'])
+ADMISSION_IN_FLIGHT = Gauge('docai_admission_in_flight', 'Extractions holding an admission slot.')
+ADMISSION_QUEUE_DEPTH = Gauge('docai_admission_queue_depth', 'Extractions waiting for an admission slot.')
+ADMISSION_WAIT_SECONDS = Histogram('docai_admission_wait_seconds', 'Time admitted extractions waited for a slot.')
+ADMISSION_REJECTIONS = Counter('docai_admission_rejections_total',
+                               'Extractions refused with 429 by rate limits or the admission queue.', ['reason'])
+COALESCED_REQUESTS = Counter('docai_coalesced_requests_total',
+                             'Extractions that waited on an identical in-flight call instead of making their own; '
+                             'outcome="shared" is an upstream call saved.', ['outcome'])
+METRICS = [REQUEST_SECONDS, STAGE_SECONDS, UPSTREAM_SECONDS, UPSTREAM_RESPONSES, UPSTREAM_RETRIES,
+           UPSTREAM_REQUEST_BYTES, UPSTREAM_RESPONSE_BYTES, IMAGE_BYTES, CIRCUIT_REJECTIONS,
+           ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_WAIT_SECONDS, ADMISSION_REJECTIONS,
+           COALESCED_REQUESTS]
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+_TOKEN_RE = re.compile(r'[^A-Za-z0-9_-]')
+
+
+class RequestTimings:
+    """Per-request stage totals (a stage that runs more than once accumulates), rendered as Server-Timing."""
+
+    def __init__(self):
+        self.route = 'unknown'
+        self.started = time.perf_counter()
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self._stages[stage] = self._stages.get(stage, 0.0) + seconds
+
+    def stage_ms(self, stage):
+        with self._lock:
+            seconds = self._stages.get(stage)
+        return None if seconds is None else seconds * 1000
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        with self._lock:
+            stages = list(self._stages.items())
+        parts = [f'{_TOKEN_RE.sub("_", name)};dur={seconds * 1000:.1f}' for name, seconds in stages]
+        parts.append(f'total;dur={self.elapsed() * 1000:.1f}')
+        return ', '.join(parts)
+
+
+_current = contextvars.ContextVar('request_timings', default=None)
+
+
+def start_request(environ):
+    """Make the environ's RequestTimings (created on first use) current for this thread or task."""
+    timings = environ.get(ENVIRON_KEY)
+    if timings is None:
+        timings = environ[ENVIRON_KEY] = RequestTimings()
+    _current.set(timings)
+    return timings
+
+
+def end_request():
+    _current.set(None)
+
+
+def current_timings():
+    return _current.get()
+
+
+def record_stage(stage, seconds):
+    timings = _current.get()
+    STAGE_SECONDS.observe(seconds, route=timings.route if timings else 'background', stage=stage)
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextmanager
+def stage(name):
+    """Time the enclosed block as stage `name` of the current request."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def upstream_operation(url):
+    """Low-cardinality label for a Salesforce URL (never the host: it identifies the org)."""
+    if '/oauth2/token' in url:
+        return 'token'
+    if 'extract-data' in url:
+        return 'extract'
+    return 'other'
+
+
+def record_upstream(url, status, seconds, request_bytes=0, response_bytes=0):
+    """Record one Salesforce API call; status is the HTTP status code or 'error'."""
+    operation = upstream_operation(url)
+    UPSTREAM_SECONDS.observe(seconds, operation=operation)
+    UPSTREAM_RESPONSES.inc(operation=operation, status=status)
+    if request_bytes:
+        UPSTREAM_REQUEST_BYTES.inc(request_bytes, operation=operation)
+    if response_bytes:
+        UPSTREAM_RESPONSE_BYTES.inc(response_bytes, operation=operation)
+    record_stage('upstream', seconds)
+
+
+def record_retry(reason):
+    UPSTREAM_RETRIES.inc(reason=reason)
+
+
+def record_image_preprocess(original_bytes, sent_bytes):
+    IMAGE_BYTES.inc(original_bytes, stage='original')
+    IMAGE_BYTES.inc(sent_bytes, stage='sent')
+
+
+def record_circuit_rejection(reason):
+    CIRCUIT_REJECTIONS.inc(reason=reason)
+
+
+def set_admission_gauges(in_flight, queued):
+    ADMISSION_IN_FLIGHT.set(in_flight)
+    ADMISSION_QUEUE_DEPTH.set(queued)
+
+
+def record_admission_wait(seconds):
+    ADMISSION_WAIT_SECONDS.observe(seconds)
+
+
+def record_admission_rejection(reason):
+    ADMISSION_REJECTIONS.inc(reason=reason)
+
+
+def record_coalesced(outcome):
+    COALESCED_REQUESTS.inc(outcome=outcome)
+
+
+def finish_response(environ, route, status):
+    """Observe the request duration; returns the Server-Timing header value (None outside a request)."""
+    timings = environ.get(ENVIRON_KEY)
+    if timings is None:
+        return None
+    REQUEST_SECONDS.observe(timings.elapsed(), route=route, status=status)
+    upstream_ms = timings.stage_ms('upstream')
+    if upstream_ms is not None:
+        environ[UPSTREAM_MS_ENVIRON_KEY] = f'{upstream_ms:.1f}'
+    return timings.server_timing()
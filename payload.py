@@ -0,0 +1,173 @@
+"""Streaming Document AI request bodies.
+
+The upload is base64-encoded in fixed-size chunks into a spool (memory up to a threshold,
+then a temp file), and the JSON body is served as a file-like reader that stitches the
+JSON envelope around that spool. The body is built once and re-read for every attempt
+(404 fallbacks, transport retries), so peak memory per request stays at a few chunks
+instead of several full copies of the document.
+"""
+import base64
+import hashlib
+import io
+import json
+import os
+import tempfile
+import weakref
+
+from config import UPLOAD_SPOOL_THRESHOLD
+
+# Multiple of 3 so each chunk base64-encodes without padding and chunks concatenate cleanly
+ENCODE_CHUNK_SIZE = 3 * 64 * 1024
+
+
+class EncodedDocument:
+    """Base64 text of one document, spooled to disk once it exceeds `spool_threshold` bytes.
+
+    `sha256` is the hex digest of the original (decoded) bytes, computed during the same pass.
+    """
+
+    def __init__(self, source, spool_threshold=UPLOAD_SPOOL_THRESHOLD):
+        self.raw_size = 0
+        self.size = 0
+        digest = hashlib.sha256()
+        self._buffer = io.BytesIO()
+        self._data = None
+        self._path = None
+        self._finalizer = None
+        sink = self._buffer
+        while True:
+            chunk = source.read(ENCODE_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            encoded = base64.b64encode(chunk)
+            self.raw_size += len(chunk)
+            self.size += len(encoded)
+            if self._path is None and self.size > spool_threshold:
+                sink = self._spill()
+            sink.write(encoded)
+        if self._path is not None:
+            sink.close()
+        else:
+            self._data = self._buffer.getvalue()
+        self._buffer = None
+        self.sha256 = digest.hexdigest()
+
+    def _spill(self):
+        fd, self._path = tempfile.mkstemp(prefix='docai-', suffix='.b64')
+        self._finalizer = weakref.finalize(self, _unlink, self._path)
+        sink = os.fdopen(fd, 'wb')
+        sink.write(self._buffer.getvalue())
+        return sink
+
+    def open(self):
+        """A fresh binary reader positioned at the start; safe to use from several threads at once."""
+        if self._path is not None:
+            return open(self._path, 'rb')
+        return io.BytesIO(self._data)
+
+    def close(self):
+        if self._finalizer is not None:
+            self._finalizer()
+        self._data = None
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+class ExtractBody:
+    """The extract-data JSON body {mlModel, schemaConfig, files: [{mimeType, data}]} around an EncodedDocument."""
+
+    def __init__(self, document, ml_model, schema_config, mime_type):
+        self.document = document
+        self.mime_type = mime_type
+        self._head = (
+            '{"mlModel": ' + json.dumps(ml_model)
+            + ', "schemaConfig": ' + json.dumps(schema_config)
+            + ', "files": [{"mimeType": ' + json.dumps(mime_type) + ', "data": "'
+        ).encode('utf-8')
+        self._tail = b'"}]}'
+
+    def __len__(self):
+        return len(self._head) + self.document.size + len(self._tail)
+
+    def open(self):
+        """A new reader over the whole body; pass as `data=` so requests streams it with a Content-Length."""
+        return BodyReader(self._head, self.document, self._tail)
+
+    def close(self):
+        self.document.close()
+
+
+class BodyReader(io.RawIOBase):
+    """Seekable read-only view over head + document + tail, read without joining them in memory."""
+
+    def __init__(self, head, document, tail):
+        super().__init__()
+        self._head = head
+        self._tail = tail
+        self._doc = document.open()
+        self._doc_size = document.size
+        self._length = len(head) + document.size + len(tail)
+        self._pos = 0
+
+    def __len__(self):
+        return self._length - self._pos
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self._length
+        self._pos = max(0, min(offset, self._length))
+        return self._pos
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._length - self._pos
+        out = []
+        while size > 0 and self._pos < self._length:
+            head_len = len(self._head)
+            doc_end = head_len + self._doc_size
+            if self._pos < head_len:
+                piece = self._head[self._pos:self._pos + size]
+            elif self._pos < doc_end:
+                self._doc.seek(self._pos - head_len)
+                piece = self._doc.read(min(size, doc_end - self._pos))
+                if not piece:
+                    raise IOError('Encoded document is shorter than expected')
+            else:
+                start = self._pos - doc_end
+                piece = self._tail[start:start + size]
+            out.append(piece)
+            self._pos += len(piece)
+            size -= len(piece)
+        return b''.join(out)
+
+    def close(self):
+        if not self.closed:
+            self._doc.close()
+        super().close()
+
+
+def build_extract_body(source, ml_model, schema_config, mime_type):
+    """Encode `source` (a binary file-like) and wrap it in an extract-data request body."""
+    return ExtractBody(EncodedDocument(source), ml_model, schema_config, mime_type)
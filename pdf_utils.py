@@ -0,0 +1,272 @@
+"""Lightweight PDF inspection (no PDF library required)."""
+import re
+import zlib
+
+_PAGES_COUNT = re.compile(rb'/Type\s*/Pages\b[^>]*?/Count\s+(\d+)|/Count\s+(\d+)[^>]*?/Type\s*/Pages\b', re.S)
+_LINEARIZED = re.compile(rb'<<\s*/Linearized\s[^>]*>>', re.S)
+_STARTXREF = re.compile(rb'startxref\s+(\d+)')
+_SUBSECTION = re.compile(rb'\s*(\d+)\s+(\d+)[ \t]*\r?\n?')
+_OBJECT_HEADER = re.compile(rb'\s*(\d+)\s+\d+\s+obj\b')
+_STREAM_START = re.compile(rb'stream\r?\n')
+SCAN_CHUNK_SIZE = 1024 * 1024
+SCAN_OVERLAP = 4096
+HEAD_BYTES = 1024
+TAIL_BYTES = 2048
+OBJECT_BYTES = 4096
+XREF_ENTRY_BYTES = 20
+MAX_XREF_SECTIONS = 32  # incremental updates followed through /Prev
+MAX_STREAM_BYTES = 16 * 1024 * 1024  # xref and object streams we are willing to inflate
+
+
+def count_pdf_pages(stream):
+    """Page count of a PDF, or None when it can't be read cheaply. Restores the stream position.
+
+    Tries, in order: the linearization dictionary at the start of the file; the trailer ->
+    catalog -> page tree root through the cross-reference table or stream (a few small reads
+    near the end of the file); and finally a chunked scan for /Type /Pages nodes.
+    """
+    start = stream.tell()
+    try:
+        for strategy in (_linearized_page_count, _xref_page_count, _scanned_page_count):
+            stream.seek(0)
+            try:
+                count = strategy(stream)
+            except (ValueError, OSError, zlib.error):
+                count = None
+            except (AttributeError, TypeError, IndexError, KeyError):
+                count = None  # malformed structure the checks below did not anticipate
+            if count is not None:
+                return count
+        return None
+    finally:
+        stream.seek(start)
+
+
+def _int_value(dictionary, key):
+    match = re.search(rb'/' + key + rb'\s+(\d+)\b(?!\s+\d+\s+R)', dictionary)
+    return int(match.group(1)) if match else None
+
+
+def _ref_value(dictionary, key):
+    match = re.search(rb'/' + key + rb'\s+(\d+)\s+\d+\s+R', dictionary)
+    return int(match.group(1)) if match else None
+
+
+def _linearized_page_count(stream):
+    """/N of the linearization dictionary, trusted only while /L still equals the file length."""
+    match = _LINEARIZED.search(stream.read(HEAD_BYTES))
+    if not match:
+        return None
+    pages, length = _int_value(match.group(0), b'N'), _int_value(match.group(0), b'L')
+    if pages is None or length != stream.seek(0, 2):
+        return None  # appended incremental updates may have changed the page count
+    return pages
+
+
+def _xref_page_count(stream):
+    """Follow trailer /Root -> catalog /Pages -> /Count through the cross-reference data."""
+    size = stream.seek(0, 2)
+    stream.seek(max(0, size - TAIL_BYTES))
+    matches = _STARTXREF.findall(stream.read(TAIL_BYTES))
+    if not matches:
+        return None
+    xref = _CrossReference(stream, int(matches[-1]))
+    if xref.root is None:
+        return None
+    pages = _ref_value(xref.object(xref.root) or b'', b'Pages')
+    if pages is None:
+        return None
+    return _int_value(xref.object(pages) or b'', b'Count')
+
+
+class _CrossReference:
+    """Object locations from classic xref tables and/or xref streams, newest section first."""
+
+    def __init__(self, stream, offset):
+        self.stream = stream
+        self.root = None
+        self.sections = []  # ('table', [(first, count, entries_offset)]) or ('stream', {num: entry})
+        self._object_streams = {}
+        seen = set()
+        while offset is not None and offset not in seen and len(self.sections) < MAX_XREF_SECTIONS:
+            seen.add(offset)
+            stream.seek(offset)
+            if stream.read(4) == b'xref':
+                trailer = self._load_table(offset)
+                hybrid = _int_value(trailer, b'XRefStm')
+                if hybrid is not None and hybrid not in seen:
+                    seen.add(hybrid)
+                    self._load_stream(hybrid)
+            else:
+                trailer = self._load_stream(offset)
+            if self.root is None:
+                self.root = _ref_value(trailer, b'Root')
+            offset = _int_value(trailer, b'Prev')
+
+    def _load_table(self, offset):
+        position = offset + 4
+        subsections = []
+        while True:
+            self.stream.seek(position)
+            match = _SUBSECTION.match(self.stream.read(64))
+            if not match:
+                break
+            first, count = int(match.group(1)), int(match.group(2))
+            entries = position + match.end()
+            subsections.append((first, count, entries))
+            position = entries + count * XREF_ENTRY_BYTES
+        self.stream.seek(position)
+        trailer = self.stream.read(OBJECT_BYTES)
+        if not trailer.lstrip().startswith(b'trailer'):
+            raise ValueError('malformed xref table')
+        self.sections.append(('table', subsections))
+        return trailer.split(b'startxref', 1)[0]
+
+    def _load_stream(self, offset):
+        dictionary, data = self._read_stream_object(offset)
+        if b'/XRef' not in dictionary:
+            raise ValueError('startxref does not point at a cross-reference')
+        widths = re.search(rb'/W\s*\[([\d\s]+)\]', dictionary)
+        widths = [int(w) for w in widths.group(1).split()] if widths else []
+        if len(widths) != 3:
+            raise ValueError('xref stream without a valid /W')
+        index = re.search(rb'/Index\s*\[([\d\s]+)\]', dictionary)
+        if index:
+            ranges = [int(n) for n in index.group(1).split()]
+        else:
+            size = _int_value(dictionary, b'Size')
+            if size is None:
+                raise ValueError('xref stream without /Size')
+            ranges = [0, size]
+        if len(ranges) % 2:
+            raise ValueError('malformed xref stream /Index')
+        if len(data) < sum(widths) * sum(ranges[1::2]):
+            raise ValueError('truncated xref stream')
+        entries = {}
+        position = 0
+        for first, count in zip(ranges[::2], ranges[1::2]):
+            for number in range(first, first + count):
+                fields = []
+                for width in widths:
+                    fields.append(int.from_bytes(data[position:position + width], 'big'))
+                    position += width
+                kind = fields[0] if widths[0] else 1
+                if kind == 1:
+                    entries[number] = ('n', fields[1])
+                elif kind == 2:
+                    entries[number] = ('c', fields[1], fields[2])
+                else:
+                    entries[number] = None
+        self.sections.append(('stream', entries))
+        return dictionary
+
+    def _entry(self, number):
+        for kind, section in self.sections:
+            if kind == 'stream':
+                if number in section:
+                    return section[number]
+                continue
+            for first, count, entries in section:
+                if first <= number < first + count:
+                    self.stream.seek(entries + (number - first) * XREF_ENTRY_BYTES)
+                    fields = self.stream.read(XREF_ENTRY_BYTES).split()
+                    if len(fields) < 3 or fields[2] != b'n':
+                        return None
+                    return ('n', int(fields[0]))
+        return None
+
+    def object(self, number):
+        """Bytes of object `number` (at most OBJECT_BYTES of it), or None if it can't be located."""
+        entry = self._entry(number)
+        if entry is None:
+            return None
+        if entry[0] == 'n':
+            self.stream.seek(entry[1])
+            data = self.stream.read(OBJECT_BYTES)
+            match = _OBJECT_HEADER.match(data)
+            if not match or int(match.group(1)) != number:
+                raise ValueError('xref offset does not point at the object')
+            return data[match.end():].split(b'endobj', 1)[0]
+        _, container, index = entry
+        objects = self._object_streams.get(container)
+        if objects is None:
+            objects = self._object_streams[container] = self._unpack_object_stream(container)
+        return objects.get(number)
+
+    def _unpack_object_stream(self, number):
+        entry = self._entry(number)
+        if entry is None or entry[0] != 'n':
+            return {}
+        dictionary, data = self._read_stream_object(entry[1])
+        count, first = _int_value(dictionary, b'N'), _int_value(dictionary, b'First')
+        if count is None or first is None:
+            raise ValueError('object stream without /N or /First')
+        header = [int(n) for n in data[:first].split()][:2 * count]
+        numbers, offsets = header[::2], header[1::2] + [len(data) - first]
+        return {num: data[first + offsets[i]:first + offsets[i + 1]] for i, num in enumerate(numbers)}
+
+    def _read_stream_object(self, offset):
+        """(dictionary bytes, decoded stream data) of the stream object at `offset`."""
+        self.stream.seek(offset)
+        head = self.stream.read(OBJECT_BYTES)
+        if not _OBJECT_HEADER.match(head):
+            raise ValueError('no object at offset')
+        start = _STREAM_START.search(head)
+        if not start:
+            raise ValueError('not a stream object')
+        dictionary = head[:start.start()]
+        length = _int_value(dictionary, b'Length')
+        if length is None or length > MAX_STREAM_BYTES:
+            raise ValueError('stream length is indirect or too large')
+        self.stream.seek(offset + start.end())
+        data = self.stream.read(length)
+        if b'/FlateDecode' in dictionary:
+            data = zlib.decompressobj().decompress(data, MAX_STREAM_BYTES)
+        elif b'/Filter' in dictionary:
+            raise ValueError('unsupported stream filter')
+        predictor = _int_value(dictionary, b'Predictor') or 1
+        if predictor >= 10:
+            data = _undo_png_predictor(data, _int_value(dictionary, b'Columns') or 1)
+        return dictionary, data
+
+
+def _undo_png_predictor(data, columns):
+    """Reverse PNG row filters (one filter-type byte per row, 1 byte per pixel as used by xref streams)."""
+    out = bytearray()
+    previous = bytearray(columns)
+    stride = columns + 1
+    for start in range(0, len(data) - columns, stride):
+        kind, row = data[start], bytearray(data[start + 1:start + stride])
+        for i in range(columns):
+            left = row[i - 1] if i else 0
+            up = previous[i]
+            if kind == 1:
+                row[i] = (row[i] + left) & 0xFF
+            elif kind == 2:
+                row[i] = (row[i] + up) & 0xFF
+            elif kind == 3:
+                row[i] = (row[i] + (left + up) // 2) & 0xFF
+            elif kind == 4:
+                upper_left = previous[i - 1] if i else 0
+                estimate = left + up - upper_left
+                distances = (abs(estimate - left), abs(estimate - up), abs(estimate - upper_left))
+                row[i] = (row[i] + (left, up, upper_left)[distances.index(min(distances))]) & 0xFF
+        out += row
+        previous = row
+    return bytes(out)
+
+
+def _scanned_page_count(stream):
+    """Largest /Count among /Type /Pages nodes (the root holds the total), scanned in bounded chunks."""
+    best = None
+    tail = b''
+    while True:
+        chunk = stream.read(SCAN_CHUNK_SIZE)
+        if not chunk:
+            break
+        window = tail + chunk
+        for match in _PAGES_COUNT.finditer(window):
+            count = int(match.group(1) or match.group(2))
+            best = count if best is None else max(best, count)
+        tail = window[-SCAN_OVERLAP:]
+    return best
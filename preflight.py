@@ -0,0 +1,87 @@
+"""Cheap checks on an uploaded document before it is encoded and sent upstream.
+
+Everything here reads a few bytes from the start (and, for PDFs, the end) of the stream, so an
+upload that can't succeed is rejected before any base64 encoding or Salesforce call.
+"""
+from pdf_utils import HEAD_BYTES, count_pdf_pages
+
+# (magic bytes, MIME type); PDFs are matched separately since the header may follow some junk
+SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'II*\x00', 'image/tiff'),
+    (b'MM\x00*', 'image/tiff'),
+    (b'BM', 'image/bmp'),
+)
+PDF_MIME = 'application/pdf'
+# Declared types that say nothing about the content: use the sniffed type instead
+GENERIC_TYPES = {'', 'application/octet-stream', 'binary/octet-stream'}
+
+
+class PreflightError(ValueError):
+    """A document rejected before extraction; `code` and `details` go into the JSON error body."""
+
+    def __init__(self, message, code, status=400, **details):
+        super().__init__(message)
+        self.code = code
+        self.status = status
+        self.details = details
+
+    def to_dict(self):
+        return dict({'error': str(self), 'code': self.code}, **self.details)
+
+
+def sniff_mime_type(stream):
+    """MIME type from the leading bytes (None if not a supported format). Restores the stream position."""
+    start = stream.tell()
+    try:
+        head = stream.read(HEAD_BYTES)
+    finally:
+        stream.seek(start)
+    if b'%PDF-' in head:  # readers accept the header anywhere in the first 1024 bytes
+        return PDF_MIME
+    for magic, mime_type in SIGNATURES:
+        if head.startswith(magic):
+            return mime_type
+    return None
+
+
+def _stream_size(stream):
+    start = stream.tell()
+    try:
+        return stream.seek(0, 2)
+    finally:
+        stream.seek(start)
+
+
+def check_document(source, declared_mime, start_page=None, end_page=None, need_page_count=False, max_bytes=0):
+    """Validate one document. Returns (mime_type, page_count); raises PreflightError.
+
+    mime_type is the sniffed type (a browser's wrong image subtype is corrected; PDF vs image is
+    a mismatch). page_count is counted for PDFs when a page range is given or need_page_count,
+    and is None when it can't be read cheaply (the range is then left for Salesforce to check).
+    """
+    size = _stream_size(source)
+    if size == 0:
+        raise PreflightError('The uploaded file is empty', 'empty_file')
+    if max_bytes and size > max_bytes:
+        raise PreflightError(f'The uploaded file is {size} bytes; the limit is {max_bytes}', 'file_too_large',
+                             413, limitBytes=max_bytes)
+    mime_type = sniff_mime_type(source)
+    if mime_type is None:
+        raise PreflightError('The file content is not a PDF, PNG, JPEG, TIFF or BMP document',
+                             'unsupported_file_content', 415)
+    declared = (declared_mime or '').split(';', 1)[0].strip().lower()
+    if declared not in GENERIC_TYPES and (declared == PDF_MIME) != (mime_type == PDF_MIME):
+        raise PreflightError(f'The file was uploaded as {declared} but its content is {mime_type}',
+                             'file_type_mismatch', 415, declaredMimeType=declared, detectedMimeType=mime_type)
+
+    page_count = None
+    if mime_type == PDF_MIME and (need_page_count or start_page is not None):
+        page_count = count_pdf_pages(source)
+    if page_count is not None:
+        for name, page in (('startPage', start_page), ('endPage', end_page)):
+            if page is not None and page > page_count:
+                raise PreflightError(f'{name} {page} is beyond the last page of the document ({page_count})',
+                                     'page_out_of_range', pageCount=page_count)
+    return mime_type, page_count
@@ -0,0 +1,195 @@
+"""Opt-in profiling of single requests: a CPU profile and a tracemalloc snapshot per request.
+
+Off unless PROFILING_ENABLED=true. Then a request to a profiled route (/extract-data,
+/auth/exchange) is profiled when it carries an `X-Profile` header or `profile` query parameter
+equal to PROFILING_KEY (or "1"/"true" when no key is set). Artifacts are written to
+PROFILING_DIR as <time>-<route>-<id>.prof (pstats: `python -m pstats`, snakeviz),
+.tracemalloc (tracemalloc.Snapshot.load) and .txt (top functions and allocation sites), and a
+one-line summary is returned in the X-Profile response header.
+
+Only one request is profiled at a time (others get `X-Profile: busy`). tracemalloc is
+process-wide, so allocations made by concurrent requests show up too: profile on a quiet
+instance for clean numbers.
+"""
+import contextvars
+import cProfile
+import functools
+import hmac
+import io
+import logging
+import os
+import pstats
+import secrets
+import threading
+import time
+import tracemalloc
+
+from flask import make_response, request
+
+from config import PROFILING_DIR, PROFILING_ENABLED, PROFILING_KEY, PROFILING_TRACE_FRAMES
+
+HEADER = 'X-Profile'
+TOP_LINES = 25  # functions / allocation sites listed in the .txt report
+SAMPLE_INTERVAL = 0.005  # seconds between checks of traced memory for a new high-water mark
+SNAPSHOT_GROWTH = 1.1  # re-snapshot once traced memory is this much above the last snapshot
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+)
+
+_lock = threading.Lock()  # one profiled request at a time: tracemalloc is global
+_current = contextvars.ContextVar('profile_session', default=None)
+
+
+def requested(value):
+    """Whether a request's X-Profile header / profile parameter asks for (and may have) a profile."""
+    if not PROFILING_ENABLED or not value:
+        return False
+    if PROFILING_KEY:
+        return hmac.compare_digest(value.encode('utf-8'), PROFILING_KEY.encode('utf-8'))
+    return value.lower() in ('1', 'true')
+
+
+class ProfileSession:
+    """Profiles the calls made through call() (in any thread) and traces allocations until finish().
+
+    tracemalloc only knows the blocks alive when a snapshot is taken, so a sampler thread
+    snapshots whenever traced memory reaches a new high; the last of those shows what was
+    allocated (and by which lines) near the request's peak.
+    """
+
+    def __init__(self, route):
+        self.id = secrets.token_hex(4)
+        self.route = route
+        self.started = time.perf_counter()
+        self.cpu_seconds = 0.0
+        self._profiles = []
+        self._profiles_lock = threading.Lock()
+        self._was_tracing = tracemalloc.is_tracing()
+        if self._was_tracing:
+            tracemalloc.reset_peak()
+        else:
+            tracemalloc.start(PROFILING_TRACE_FRAMES)
+        self._baseline = tracemalloc.get_traced_memory()[0]
+        self._snapshot = None
+        self._snapshot_size = 0
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name='profile-sampler', daemon=True)
+        self._sampler.start()
+
+    def _sample(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            current = tracemalloc.get_traced_memory()[0]
+            if current > max(self._snapshot_size * SNAPSHOT_GROWTH, self._baseline):
+                self._snapshot = tracemalloc.take_snapshot()
+                self._snapshot_size = current
+
+    def call(self, fn, *args, **kwargs):
+        """fn(*args, **kwargs) under a cProfile profiler of its own (profilers are per thread)."""
+        profile = cProfile.Profile()
+        cpu_started = time.thread_time()
+        profile.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profile.disable()
+            with self._profiles_lock:
+                self._profiles.append(profile)
+                self.cpu_seconds += time.thread_time() - cpu_started
+
+    def finish(self):
+        """Stop tracing, write the artifacts and return the X-Profile summary."""
+        try:
+            wall = time.perf_counter() - self.started
+            self._stop.set()
+            self._sampler.join()
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = self._snapshot
+            if snapshot is None or current > self._snapshot_size:
+                snapshot, self._snapshot_size = tracemalloc.take_snapshot(), current
+            if not self._was_tracing:
+                tracemalloc.stop()
+            snapshot = snapshot.filter_traces(SNAPSHOT_FILTERS)
+            sites = snapshot.statistics('lineno')
+            with self._profiles_lock:
+                profiles = list(self._profiles)
+            stats = pstats.Stats(*profiles) if profiles else None
+            summary = self._summary(wall, peak, sites, stats)
+            self._write(snapshot, sites, stats, summary)
+            return summary
+        finally:
+            _lock.release()
+
+    def _summary(self, wall, peak, sites, stats):
+        parts = [f'id={self.id}', f'wall={wall * 1000:.1f}ms', f'cpu={self.cpu_seconds * 1000:.1f}ms',
+                 f'peak={(peak - self._baseline) / 1024:.0f}KB']
+        if sites:
+            frame = sites[0].traceback[0]
+            parts.append(f'topAlloc={os.path.basename(frame.filename)}:{frame.lineno}/{sites[0].size / 1024:.0f}KB')
+        if stats is not None:
+            (filename, lineno, name), (_, _, own, _, _) = max(stats.stats.items(), key=lambda item: item[1][2])
+            where = name if filename == '~' else f'{os.path.basename(filename)}:{lineno}({name})'  # '~': builtins
+            parts.append(f'topFunc={where}/{own * 1000:.1f}ms')
+        return '; '.join(parts)
+
+    def _write(self, snapshot, sites, stats, summary):
+        try:
+            os.makedirs(PROFILING_DIR, exist_ok=True)
+            base = os.path.join(PROFILING_DIR, f'{time.strftime("%Y%m%d-%H%M%S")}-{self.route}-{self.id}')
+            snapshot.dump(base + '.tracemalloc')
+            report = io.StringIO()
+            report.write(f'{summary}\n\nTop allocation sites near the peak ({self._snapshot_size / 1024:.0f}KB traced):\n')
+            for stat in sites[:TOP_LINES]:
+                report.write(f'  {stat}\n')
+            if stats is not None:
+                stats.dump_stats(base + '.prof')
+                report.write('\n')
+                stats.stream = report
+                stats.sort_stats('tottime').print_stats(TOP_LINES)
+            with open(base + '.txt', 'w') as f:
+                f.write(report.getvalue())
+            logging.info("Profile %s written to %s.*", self.id, base)
+        except OSError:
+            logging.exception("Could not write profile %s", self.id)
+
+
+def begin(route):
+    """Start a ProfileSession for the current request, or None when another request is being profiled."""
+    if not _lock.acquire(blocking=False):
+        return None
+    try:
+        session = ProfileSession(route)
+    except BaseException:
+        _lock.release()
+        raise
+    _current.set(session)
+    return session
+
+
+def profile_call(fn, *args):
+    """fn(*args), profiled when the current context belongs to a profiled request (ASGI worker-thread phases)."""
+    session = _current.get()
+    if session is None:
+        return fn(*args)
+    return session.call(fn, *args)
+
+
+def profiled(view):
+    """Flask view decorator: profile the view when the request asks for it (see requested())."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not requested(request.headers.get(HEADER) or request.args.get('profile')):
+            return view(*args, **kwargs)
+        session = begin(request.endpoint)
+        if session is None:
+            resp = make_response(view(*args, **kwargs))
+            resp.headers[HEADER] = 'busy'
+            return resp
+        try:
+            resp = session.call(lambda: make_response(view(*args, **kwargs)))
+        finally:
+            summary = session.finish()
+            _current.set(None)
+        resp.headers[HEADER] = summary
+        return resp
+    return wrapper
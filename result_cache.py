@@ -0,0 +1,184 @@
+"""Content-addressed cache of successful extraction results.
+
+Keyed on the org plus everything that determines Document AI's answer: the SHA-256 of
+the document bytes, the normalized schemaConfig (prompt included), ml_model, page range
+and the confidence flag. A bounded in-memory LRU sits in front of the shared state backend
+(when STATE_BACKEND is shared, e.g. sqlite, so every worker sees each result) and an optional
+on-disk tier (RESULT_CACHE_DIR) that evicts least-recently-used files past a size budget.
+Only { data, metadata } is cached: never developer snippets or tokens.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from config import (
+    RESULT_CACHE_DIR, RESULT_CACHE_DISK_MAX_BYTES, RESULT_CACHE_ENABLED, RESULT_CACHE_SIZE, RESULT_CACHE_TTL,
+)
+from json_utils import dumps as dumps_json, loads as loads_json
+from state_store import namespace, state_backend
+from ttl_cache import TTLCache
+
+
+def normalize_schema(schema_config):
+    """Canonical JSON text for a schemaConfig string, so key order and whitespace don't split the cache."""
+    return json.dumps(json.loads(schema_config), sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+
+def cache_key(org, document_sha256, schema_config, ml_model, page_range, include_confidence):
+    parts = {
+        'org': (org or '').rstrip('/'),
+        'document': document_sha256,
+        'schema': normalize_schema(schema_config),
+        'model': ml_model,
+        'pages': page_range or '',
+        'confidence': bool(include_confidence),
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, maxsize=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL, disk_dir=RESULT_CACHE_DIR,
+                 disk_max_bytes=RESULT_CACHE_DISK_MAX_BYTES, enabled=RESULT_CACHE_ENABLED):
+        self.enabled = enabled
+        self.ttl = ttl
+        self._memory = TTLCache(ttl, maxsize=maxsize)
+        self._shared = namespace('results', ttl) if enabled and state_backend.shared else None
+        self._disk_dir = disk_dir or None
+        self._disk_max_bytes = disk_max_bytes
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'sharedHits': 0, 'diskHits': 0, 'misses': 0, 'stores': 0, 'bypassed': 0,
+                          'diskEvictions': 0}
+        if self.enabled and self._disk_dir:
+            os.makedirs(self._disk_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, _, size in self._disk_entries())
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._counters[name] += n
+
+    def get(self, key):
+        """Cached result dict (a fresh shallow copy) or None."""
+        value = self._memory.get(key)
+        if value is None and self._shared is not None:
+            value = self._shared.get(key)
+            if value is not None:
+                self._memory.set(key, value)
+                self._count('sharedHits')
+        if value is None and self._disk_dir:
+            value = self._disk_get(key)
+            if value is not None:
+                self._memory.set(key, value)
+                self._count('diskHits')
+        if value is None:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return dict(value)
+
+    def set(self, key, result):
+        value = {k: result[k] for k in ('data', 'metadata') if k in result}
+        self._memory.set(key, value)
+        self._count('stores')
+        if self._shared is not None:
+            self._shared.set(key, value)
+        if self._disk_dir:
+            try:
+                self._disk_set(key, value)
+            except OSError as e:
+                logging.warning("Result cache disk write failed: %s", str(e))
+
+    def record_bypass(self):
+        self._count('bypassed')
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            disk_bytes = self._disk_bytes
+        lookups = counters['hits'] + counters['misses']
+        counters.update({
+            'enabled': self.enabled,
+            'entries': len(self._memory),
+            'hitRate': round(counters['hits'] / lookups, 4) if lookups else None,
+            'sharedEnabled': self._shared is not None,
+            'diskEnabled': bool(self._disk_dir),
+            'diskBytes': disk_bytes,
+        })
+        return counters
+
+    # --- disk tier ---
+
+    def _path(self, key):
+        return os.path.join(self._disk_dir, key[:2], key + '.json')
+
+    def _disk_get(self, key):
+        path = self._path(key)
+        try:
+            stat = os.stat(path)
+            if self.ttl and stat.st_mtime + self.ttl < time.time():
+                self._disk_remove(path, stat.st_size)
+                return None
+            with open(path, 'rb') as f:
+                value = loads_json(f.read())
+            os.utime(path, (time.time(), stat.st_mtime))  # atime marks recent use for LRU eviction
+            return value
+        except (OSError, ValueError):
+            return None
+
+    def _disk_set(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = dumps_json(value)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        try:
+            old_size = os.path.getsize(path)
+        except OSError:
+            old_size = 0
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._disk_bytes += len(data) - old_size
+            over = self._disk_bytes > self._disk_max_bytes
+        if over:
+            self._evict_disk()
+
+    def _disk_entries(self):
+        for root, _, files in os.walk(self._disk_dir):
+            for name in files:
+                if name.endswith('.json'):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, max(stat.st_atime, stat.st_mtime), stat.st_size
+
+    def _disk_remove(self, path, size):
+        try:
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self._disk_bytes -= size
+
+    def _evict_disk(self):
+        """Drop least-recently-used files until the tier is back under 90% of its budget."""
+        target = int(self._disk_max_bytes * 0.9)
+        entries = sorted(self._disk_entries(), key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+        with self._lock:
+            self._disk_bytes = total
+        for path, _, size in entries:
+            if total <= target:
+                break
+            self._disk_remove(path, size)
+            total -= size
+            self._count('diskEvictions')
+
+
+result_cache = ResultCache()
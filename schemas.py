@@ -0,0 +1,59 @@
+"""Schema registry: clients upload a JSON schema once and reference it by a content-hash id.
+
+The id is a hash of the schema's canonical (key-sorted) JSON, so the same schema always gets the
+same id. The schema itself is stored compacted but in the key order it was submitted in: Document
+AI follows the schema's field order, so it must not change. The schemaConfig string sent to
+Document AI (with any config_prompt applied as the root "description") is cached per
+(schema id, prompt), so repeat extractions skip the parse/serialize work entirely.
+"""
+import hashlib
+import json
+
+from config import SCHEMA_CONFIG_CACHE_SIZE, SCHEMA_REGISTRY_SIZE, SCHEMA_TTL
+from state_store import namespace
+from ttl_cache import TTLCache
+
+
+class SchemaRegistry:
+    def __init__(self, ttl=SCHEMA_TTL, maxsize=SCHEMA_REGISTRY_SIZE, config_cache_size=SCHEMA_CONFIG_CACHE_SIZE):
+        self._schemas = namespace('schemas', ttl, maxsize)  # schema id -> schema JSON text as submitted
+        # (schema id, prompt) -> (schema text it was built from, schemaConfig)
+        self._configs = TTLCache(ttl, maxsize=config_cache_size)
+
+    def register(self, schema_text):
+        """Validate and store a schema. Returns (schema_id, created); raises ValueError if it is not a JSON object."""
+        schema = json.loads(schema_text)
+        if not isinstance(schema, dict):
+            raise ValueError('Schema must be a JSON object')
+        canonical = json.dumps(schema, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        schema_id = hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:32]
+        created = schema_id not in self._schemas
+        # Re-registering renews the expiry; the latest submission's field order is the one used
+        self._schemas.set(schema_id, json.dumps(schema, separators=(',', ':'), ensure_ascii=False))
+        return schema_id, created
+
+    def get(self, schema_id):
+        """The registered schema as a dict, or None if unknown or expired."""
+        schema_text = self._schemas.get(schema_id)
+        return None if schema_text is None else json.loads(schema_text)
+
+    def schema_config(self, schema_id, config_prompt=''):
+        """schemaConfig string for a registered schema with the prompt applied, or None if unknown or expired."""
+        schema_text = self._schemas.get(schema_id)
+        if schema_text is None:
+            return None
+        key = (schema_id, config_prompt)
+        cached = self._configs.get(key)
+        if cached is not None and cached[0] == schema_text:  # else re-registered in another key order
+            return cached[1]
+        if config_prompt:
+            schema = json.loads(schema_text)
+            schema['description'] = config_prompt
+            config = json.dumps(schema, separators=(',', ':'), ensure_ascii=False)
+        else:
+            config = schema_text
+        self._configs.set(key, (schema_text, config))
+        return config
+
+
+schema_registry = SchemaRegistry()
@@ -0,0 +1,87 @@
+"""Developer reference snippets (curl + Apex), generated on demand.
+
+A successful extraction only records the few fields needed to describe the request under a
+short-lived id; the snippet itself is rendered when /extract-data/snippet/<id> is fetched.
+The document is shown as a placeholder instead of being embedded as base64.
+"""
+import json
+import secrets
+
+from config import API_VERSION, SNIPPET_TTL
+from state_store import namespace
+
+FILE_DATA_PLACEHOLDER = '<BASE64_FILE_DATA>'
+
+
+class SnippetStore:
+    def __init__(self, ttl=SNIPPET_TTL, maxsize=2048):
+        self._contexts = namespace('snippets', ttl, maxsize)
+
+    def put(self, extraction, url, owner):
+        """Remember what a snippet for this extraction needs; returns the id to hand to the client."""
+        snippet_id = secrets.token_urlsafe(12)
+        self._contexts.set(snippet_id, {
+            'owner': owner,
+            'url': url,
+            'instance_url': extraction['instance_url'],
+            'query_suffix': extraction['query_suffix'],
+            'ml_model': extraction['ml_model'],
+            'schema_config': extraction['schema_config'],
+            'mime_type': extraction['mime_type'],
+            'document_bytes': extraction['body'].document.raw_size,
+        })
+        return snippet_id
+
+    def get(self, snippet_id, owner):
+        context = self._contexts.get(snippet_id)
+        if context is None or context['owner'] != owner:
+            return None
+        return context
+
+
+snippet_store = SnippetStore()
+
+
+def render_snippet(context, access_token):
+    """curl + Apex for a stored context. The file data is a placeholder the developer fills in."""
+    instance_url = context['instance_url']
+    query_suffix = context['query_suffix']
+    ml_model = context['ml_model']
+    mime_type = context['mime_type']
+    payload_json = json.dumps({
+        "mlModel": ml_model,
+        "schemaConfig": context['schema_config'],
+        "files": [
+            {
+                "mimeType": mime_type,
+                "data": FILE_DATA_PLACEHOLDER
+            }
+        ]
+    }, ensure_ascii=False)
+    # Escape single quotes for use inside single-quoted curl -d '...'
+    def escape_single_quotes(s):
+        return s.replace("'", "'\"'\"'")
+    payload_escaped = escape_single_quotes(payload_json)
+    url_escaped = escape_single_quotes(context['url'])
+    token_escaped = escape_single_quotes(access_token or '')
+    curl_cmd = (
+        f"# Replace {FILE_DATA_PLACEHOLDER} with the base64-encoded document "
+        f"({context['document_bytes']} bytes, e.g. base64 -i yourfile)\n"
+        f"curl -X POST '{url_escaped}' -H 'Content-Type: application/json' -H 'Authorization: Bearer {token_escaped}' -d '{payload_escaped}'"
+    )
+
+    apex_endpoint = f"{instance_url.rstrip('/')}/services/data/{API_VERSION}/ssot/document-processing/actions/extract-data{query_suffix}"
+    apex_snippet = f'''HttpRequest req = new HttpRequest();
+req.setEndpoint('{apex_endpoint}');
+req.setMethod('POST');
+req.setHeader('Content-Type', 'application/json');
+req.setHeader('Authorization', 'Bearer ' + accessToken);
+req.setBody('{{"mlModel":"{ml_model}","schemaConfig":' + schemaConfigJson + ',"files":[{{"mimeType":"{mime_type}","data":"' + base64FileData + '"}}]}}');
+Http http = new Http();
+HttpResponse res = http.send(req);
+// Replace: accessToken, schemaConfigJson (JSON string), base64FileData (Base64 string).'''
+
+    return {
+        'curl': curl_cmd,
+        'apex': apex_snippet
+    }
@@ -0,0 +1,201 @@
+"""Shared state backends: where sessions, tokens, discovered endpoints and cached results live.
+
+STATE_BACKEND=memory (the default) keeps everything in this process, as before. With
+STATE_BACKEND=sqlite every gunicorn worker on the host shares one SQLite database
+(STATE_DB_PATH, WAL mode), so warm state survives restarts and is not duplicated per worker.
+
+Both backends store JSON-serializable values under (namespace, key) with optional expiry and
+offer bulk get/set and an atomic compare-and-set. Callers use a Namespace, which has the
+get/set/pop interface of TTLCache; a networked backend only needs to implement the same
+methods.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+from config import STATE_BACKEND, STATE_DB_PATH
+from json_utils import dumps as dumps_json, loads as loads_json
+from ttl_cache import TTLCache
+
+
+class MemoryBackend:
+    """Process-local backend: one bounded TTLCache per namespace."""
+
+    shared = False
+
+    def __init__(self):
+        self._namespaces = {}
+        self._lock = threading.Lock()  # makes compare_and_set atomic
+
+    def register(self, namespace, maxsize):
+        self._namespaces[namespace] = TTLCache(ttl=0, maxsize=maxsize)  # ttl=0: entries only expire when given a ttl
+
+    def get(self, namespace, key):
+        return self._namespaces[namespace].get(key)
+
+    def get_many(self, namespace, keys):
+        cache = self._namespaces[namespace]
+        found = {}
+        for key in keys:
+            value = cache.get(key)
+            if value is not None:
+                found[key] = value
+        return found
+
+    def set(self, namespace, key, value, ttl=None):
+        self._namespaces[namespace].set(key, value, ttl=ttl or 0)
+
+    def set_many(self, namespace, items, ttl=None):
+        cache = self._namespaces[namespace]
+        for key, value in items.items():
+            cache.set(key, value, ttl=ttl or 0)
+
+    def delete(self, namespace, key):
+        return self._namespaces[namespace].pop(key)
+
+    def compare_and_set(self, namespace, key, expected, value, ttl=None):
+        """Store value only if the current value equals expected (None: the key is absent). Returns True if stored."""
+        cache = self._namespaces[namespace]
+        with self._lock:
+            if cache.get(key) != expected:
+                return False
+            cache.set(key, value, ttl=ttl or 0)
+            return True
+
+
+class SQLiteBackend:
+    """Backend shared by every process on the host: one SQLite file in WAL mode.
+
+    Each thread has its own connection. Expiry uses wall-clock time so all processes agree;
+    expired rows are ignored on read and deleted in batches on write.
+    """
+
+    shared = True
+    PURGE_EVERY = 500  # writes between sweeps of expired rows
+
+    def __init__(self, path=STATE_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection().execute('CREATE TABLE IF NOT EXISTS state ('
+                                   'namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, expires REAL, '
+                                   'PRIMARY KEY (namespace, key)) WITHOUT ROWID')
+
+    def register(self, namespace, maxsize):
+        pass  # bounded by expiry, not entry count
+
+    def _connection(self):
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():  # never reuse a connection across fork()
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)  # autocommit unless BEGIN
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')  # durable enough for caches and sessions, much faster
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def get(self, namespace, key):
+        row = self._connection().execute(
+            'SELECT value FROM state WHERE namespace = ? AND key = ? AND (expires IS NULL OR expires > ?)',
+            (namespace, key, time.time())).fetchone()
+        return None if row is None else loads_json(row[0])
+
+    def get_many(self, namespace, keys):
+        keys = list(keys)
+        found = {}
+        for start in range(0, len(keys), 500):  # stay under SQLite's bound-parameter limit
+            chunk = keys[start:start + 500]
+            rows = self._connection().execute(
+                f'SELECT key, value FROM state WHERE namespace = ? AND key IN ({",".join("?" * len(chunk))}) '
+                'AND (expires IS NULL OR expires > ?)', [namespace, *chunk, time.time()])
+            found.update((key, loads_json(value)) for key, value in rows)
+        return found
+
+    def set(self, namespace, key, value, ttl=None):
+        self.set_many(namespace, {key: value}, ttl)
+
+    def set_many(self, namespace, items, ttl=None):
+        expires = time.time() + ttl if ttl else None
+        rows = [(namespace, key, dumps_json(value), expires) for key, value in items.items()]
+        db = self._connection()
+        db.executemany('INSERT OR REPLACE INTO state (namespace, key, value, expires) VALUES (?, ?, ?, ?)', rows)
+        self._after_write(db, len(rows))
+
+    def delete(self, namespace, key):
+        value = self.get(namespace, key)
+        self._connection().execute('DELETE FROM state WHERE namespace = ? AND key = ?', (namespace, key))
+        return value
+
+    def compare_and_set(self, namespace, key, expected, value, ttl=None):
+        """Store value only if the current value equals expected (None: the key is absent). Returns True if stored."""
+        db = self._connection()
+        db.execute('BEGIN IMMEDIATE')  # takes the write lock, so no other process can interleave
+        try:
+            if self.get(namespace, key) != expected:
+                db.execute('ROLLBACK')
+                return False
+            db.execute('INSERT OR REPLACE INTO state (namespace, key, value, expires) VALUES (?, ?, ?, ?)',
+                       (namespace, key, dumps_json(value), time.time() + ttl if ttl else None))
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        self._after_write(db, 1)
+        return True
+
+    def _after_write(self, db, count):
+        self._writes += count
+        if self._writes >= self.PURGE_EVERY:
+            self._writes = 0
+            db.execute('DELETE FROM state WHERE expires IS NOT NULL AND expires <= ?', (time.time(),))
+
+
+class Namespace:
+    """One namespace of a backend, with TTLCache's get/set/pop interface and a default ttl."""
+
+    def __init__(self, backend, name, ttl=None):
+        self.backend = backend
+        self.name = name
+        self.ttl = ttl
+
+    def get(self, key, default=None):
+        value = self.backend.get(self.name, key)
+        return default if value is None else value
+
+    def get_many(self, keys):
+        return self.backend.get_many(self.name, keys)
+
+    def set(self, key, value, ttl=None):
+        self.backend.set(self.name, key, value, self.ttl if ttl is None else ttl)
+
+    def set_many(self, items, ttl=None):
+        self.backend.set_many(self.name, items, self.ttl if ttl is None else ttl)
+
+    def pop(self, key, default=None):
+        value = self.backend.delete(self.name, key)
+        return default if value is None else value
+
+    def compare_and_set(self, key, expected, value, ttl=None):
+        return self.backend.compare_and_set(self.name, key, expected, value, self.ttl if ttl is None else ttl)
+
+    def __contains__(self, key):
+        return self.backend.get(self.name, key) is not None
+
+
+def create_backend(kind=STATE_BACKEND):
+    if kind == 'memory':
+        return MemoryBackend()
+    if kind == 'sqlite':
+        return SQLiteBackend()
+    raise ValueError(f'Unknown STATE_BACKEND {kind!r} (expected memory or sqlite)')
+
+
+state_backend = create_backend()
+
+
+def namespace(name, ttl=None, maxsize=1024):
+    """Namespace `name` of the configured backend; maxsize bounds it in the memory backend."""
+    state_backend.register(name, maxsize)
+    return Namespace(state_backend, name, ttl)
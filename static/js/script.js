@@ -21,7 +21,34 @@ document.addEventListener('DOMContentLoaded', function() {
         content.hidden = !isHidden;
         e.target.setAttribute('aria-expanded', String(!isHidden));
         e.target.textContent = isHidden ? 'Hide API request (Developer reference)' : 'Show API request (Developer reference)';
+        if (isHidden) loadDeveloperSnippet();
     });
+
+    // The curl/Apex snippet is generated on demand, the first time the section is opened
+    async function loadDeveloperSnippet() {
+        const snippetId = developerReference.dataset.snippetId;
+        if (!snippetId || developerReference.dataset.snippetLoaded === snippetId) return;
+        const curlEl = document.getElementById('snippet-curl');
+        const apexEl = document.getElementById('snippet-apex');
+        curlEl.textContent = 'Loading...';
+        apexEl.textContent = 'Loading...';
+        try {
+            const res = await fetch(`/extract-data/snippet/${encodeURIComponent(snippetId)}`);
+            const data = await res.json().catch(() => ({}));
+            if (!res.ok) {
+                const msg = data.error || `Could not load the API request (${res.status})`;
+                curlEl.textContent = msg;
+                apexEl.textContent = msg;
+                return;
+            }
+            curlEl.textContent = data.curl || '';
+            apexEl.textContent = data.apex || '';
+            developerReference.dataset.snippetLoaded = snippetId;
+        } catch (err) {
+            curlEl.textContent = 'Could not load the API request: ' + err.message;
+            apexEl.textContent = '';
+        }
+    }
     
     // Authentication elements
     const authStatus = document.getElementById('auth-status');
@@ -442,6 +469,81 @@ document.addEventListener('DOMContentLoaded', function() {
         container.textContent = jsonString;
     }
 
+    // Schema text -> id from POST /api/schemas, so repeat extractions send the id instead of the schema
+    const registeredSchemas = new Map();
+
+    async function registerSchema(schemaText) {
+        if (registeredSchemas.has(schemaText)) {
+            return registeredSchemas.get(schemaText);
+        }
+        try {
+            const response = await fetch('/api/schemas', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: schemaText
+            });
+            if (!response.ok) {
+                return null; // e.g. invalid JSON: submit the schema itself and show the server's error
+            }
+            const { schemaId } = await response.json();
+            registeredSchemas.set(schemaText, schemaId);
+            return schemaId;
+        } catch (_) {
+            return null;
+        }
+    }
+
+    // Run the extraction with a registered schema id when possible, falling back to the full schema
+    // (e.g. the server restarted and no longer knows the id).
+    async function runExtraction(form) {
+        const formData = new FormData(form);
+        const schemaText = formData.get('schema');
+        const schemaId = await registerSchema(schemaText);
+        if (schemaId) {
+            const byId = new FormData(form);
+            byId.delete('schema');
+            byId.set('schema_id', schemaId);
+            const response = await runExtractionJob(byId);
+            if (response.status !== 404) {
+                return response;
+            }
+            const body = await response.clone().json().catch(() => ({}));
+            if (body.code !== 'unknown_schema_id') {
+                return response;
+            }
+            registeredSchemas.delete(schemaText);
+        }
+        return runExtractionJob(formData);
+    }
+
+    // Submit the upload as a background job and poll until it finishes.
+    // Resolves to a Response carrying the job's result, shaped like a direct /extract-data reply.
+    async function runExtractionJob(formData) {
+        const submitted = await fetch('/extract-data/jobs', {
+            method: 'POST',
+            body: formData
+        });
+        if (submitted.status !== 202) {
+            return submitted;
+        }
+        let job = await submitted.json();
+        while (job.status === 'queued' || job.status === 'running') {
+            await new Promise(resolve => setTimeout(resolve, 1500));
+            const poll = await fetch(`/extract-data/jobs/${encodeURIComponent(job.id)}`);
+            if (!poll.ok) {
+                return poll;
+            }
+            job = await poll.json();
+        }
+        if (job.status === 'cancelled') {
+            return new Response(JSON.stringify({ error: 'Extraction was cancelled' }), { status: 409 });
+        }
+        return new Response(JSON.stringify(job.result), {
+            status: job.resultStatus || 500,
+            headers: { 'Content-Type': 'application/json' }
+        });
+    }
+
     // Handle form submission
     form.addEventListener('submit', async function(e) {
         e.preventDefault();
@@ -465,11 +567,7 @@ document.addEventListener('DOMContentLoaded', function() {
         resultSection.style.display = 'none';
 
         try {
-            const formData = new FormData(this);
-            const response = await fetch('/extract-data', {
-                method: 'POST',
-                body: formData
-            });
+            const response = await runExtraction(this);
 
             if (response.status === 401 || response.status === 403) {
                 // Session expired or invalid token - sync with server then force re-auth UI
@@ -540,10 +638,12 @@ document.addEventListener('DOMContentLoaded', function() {
                     resultViewToggle.querySelector('[data-view="formatted"]').addEventListener('click', showFormatted);
                     resultViewToggle.querySelector('[data-view="raw"]').addEventListener('click', showRaw);
                     
-                    if (jsonData.apiRequest) {
+                    if (jsonData.apiRequestId) {
                         developerReference.style.display = 'block';
-                        document.getElementById('snippet-curl').textContent = jsonData.apiRequest.curl || '';
-                        document.getElementById('snippet-apex').textContent = jsonData.apiRequest.apex || '';
+                        developerReference.dataset.snippetId = jsonData.apiRequestId;
+                        delete developerReference.dataset.snippetLoaded;
+                        document.getElementById('snippet-curl').textContent = '';
+                        document.getElementById('snippet-apex').textContent = '';
                         const content = developerReference.querySelector('.developer-reference-content');
                         const toggleBtn = developerReference.querySelector('.developer-reference-toggle');
                         content.hidden = true;
@@ -551,8 +651,9 @@ document.addEventListener('DOMContentLoaded', function() {
                         toggleBtn.textContent = 'Show API request (Developer reference)';
                         developerReference.querySelectorAll('.copy-snippet-btn').forEach(btn => {
                             const target = btn.getAttribute('data-target');
-                            const code = target === 'curl' ? jsonData.apiRequest.curl : jsonData.apiRequest.apex;
-                            btn.onclick = function() {
+                            btn.onclick = async function() {
+                                await loadDeveloperSnippet();
+                                const code = document.getElementById(`snippet-${target}`).textContent;
                                 navigator.clipboard.writeText(code || '').then(() => {
                                     this.textContent = 'Copied!';
                                     this.classList.add('copied');